@@ -0,0 +1,216 @@
+"""
+Content-addressed storage for uploads (request letters, certificate attachments).
+
+BlobStorage.save() names a file after the SHA-256 of its bytes
+(blobs/ab/cd/abcdef...<ext>) and writes it only if that content isn't stored
+yet, so the same circular uploaded by a whole class is on disk once and no
+directory holds more than a handful of files. The Blob row counts the
+FileField values pointing at a file; the name the user uploaded is kept on
+the owning row (original_filename).
+
+delete() drops one reference. A blob nobody references any more is removed
+after the commit by collect(), which also sweeps leftovers
+(`manage.py migrate_uploads_to_blobs --collect`): Blob rows left at 0, and
+files under blobs/ older than BLOB_ORPHAN_MINUTES with no Blob row at all -
+written by an upload whose transaction rolled back, or half-written .tmp files.
+
+Locking: save() takes the Blob row (UPDATE / INSERT) before it looks at the
+file, collect() re-checks refcount=0 under SELECT ... FOR UPDATE before it
+removes one, and claims the name of a row-less file by inserting its row
+(refcount 0) first - a file is never removed under an upload that just
+referenced it.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from .models import Blob
+
+
+PREFIX = "blobs"
+
+
+def blob_name(sha256, ext=""):
+    return f"{PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(PREFIX + "/")
+
+
+def _ext(name):
+    # kept for content types / the extractors; anything odd is dropped
+    ext = os.path.splitext(name or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """FileSystemStorage under MEDIA_ROOT/blobs/, one file per distinct content."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        h = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            h.update(chunk)
+            size += len(chunk)
+        sha256 = h.hexdigest()
+        name = blob_name(sha256, _ext(name))
+
+        with transaction.atomic():
+            self._add_ref(name, sha256, size)
+            if not self.exists(name):
+                self._write(name, content)
+        return name
+
+    def _add_ref(self, name, sha256, size):
+        if Blob.objects.filter(name=name).update(refcount=F("refcount") + 1):
+            return
+        try:
+            with transaction.atomic():
+                Blob.objects.create(name=name, sha256=sha256, size=size, refcount=1)
+        except IntegrityError:
+            # the same bytes uploaded at the same moment
+            Blob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+    def _write(self, name, content):
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # never a half-written file under the final name
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp, self.file_permissions_mode)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def delete(self, name):
+        """Drops one reference; the file goes after the commit if that was the last one."""
+        if not is_blob(name):
+            # stored before BlobStorage - several rows may share it (REQ-TMP),
+            # migrate_uploads_to_blobs removes those
+            return
+        Blob.objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1)
+        transaction.on_commit(lambda: collect([name]))
+
+
+blob_storage = BlobStorage()
+
+
+def orphan_age():
+    return timedelta(minutes=getattr(settings, "BLOB_ORPHAN_MINUTES", 60))
+
+
+def collect(names=None):
+    """
+    Removes unreferenced blobs (the given names, or all of them - then also
+    the orphan files, see sweep_orphans()). Returns how many.
+    """
+    qs = Blob.objects.filter(refcount=0)
+    if names is not None:
+        qs = qs.filter(name__in=names)
+
+    removed = 0
+    for name in list(qs.values_list("name", flat=True)):
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name, refcount=0).first()
+            if blob is None:
+                continue   # referenced again meanwhile
+            try:
+                os.remove(blob_storage.path(name))
+            except FileNotFoundError:
+                pass
+            blob.delete()
+        removed += 1
+
+    if names is None:
+        removed += sweep_orphans()
+    return removed
+
+
+def _files_under(directory):
+    for root, _, files in os.walk(directory):
+        for f in files:
+            yield os.path.join(root, f)
+
+
+def sweep_orphans(now=None):
+    """
+    Removes files under blobs/ older than orphan_age() that no Blob row names.
+    Returns how many.
+    """
+    cutoff = ((now or timezone.now()) - orphan_age()).timestamp()
+    root = blob_storage.path(PREFIX)
+    removed = 0
+    for path in _files_under(root):
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue   # may belong to an upload still in its transaction
+        except FileNotFoundError:
+            continue
+
+        name = PREFIX + "/" + os.path.relpath(path, root).replace(os.sep, "/")
+        if path.endswith(".tmp"):
+            # BlobStorage._write() that never got to os.replace()
+            os.remove(path)
+            removed += 1
+            continue
+        if Blob.objects.filter(name=name).exists():
+            continue
+
+        try:
+            with transaction.atomic():
+                # the row (refcount 0) claims the name: a concurrent save() of
+                # these bytes waits for it and then writes the file again
+                blob = Blob.objects.create(name=name, sha256=os.path.basename(name)[:64], refcount=0)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                blob.delete()
+        except IntegrityError:
+            continue   # referenced meanwhile
+        removed += 1
+    return removed
+
+
+# ---------------- MODEL HOOKS ---------------- #
+
+def file_name_of(value):
+    """Stored name of a FileField value as found in instance.__dict__ (str or FieldFile)."""
+    return getattr(value, "name", value) or None
+
+
+def remember_original_name(instance, field_name, name_field="original_filename"):
+    """pre_save: the uploaded file's own name - the stored one is its hash."""
+    f = getattr(instance, field_name)
+    if f and not f._committed:
+        setattr(instance, name_field, os.path.basename(f.name)[:255])
+
+
+def release(name):
+    if name:
+        blob_storage.delete(name)
@@ -0,0 +1,137 @@
+"""
+Hi/lo allocator for the human readable codes (REQ-000123, CERTREQ-..., CERT-...).
+
+Each process reserves a block of CODE_BLOCK_SIZE values from its CodeSequence
+row in one short transaction and hands them out from memory, so creating a
+request is a single INSERT with its code already set and two processes can
+never hand out the same value. Values of a block that is not used up (process
+restart) are simply skipped.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+
+from .models import CodeSequence
+
+
+def _block_size():
+    return max(1, getattr(settings, "CODE_BLOCK_SIZE", 20))
+
+
+def initial_value(model, field, prefix):
+    """First value of a new sequence: past every pk and code already in the table."""
+    highest = model.objects.aggregate(m=Max("pk"))["m"] or 0
+    cut = len(prefix) + 1
+    codes = model.objects.filter(**{f"{field}__startswith": f"{prefix}-"}).values_list(field, flat=True)
+    for code in codes.iterator():
+        tail = code[cut:]
+        if tail.isdigit():
+            highest = max(highest, int(tail))
+    return highest + 1
+
+
+def _reserve(name, size, initial, floor):
+    """Moves the sequence row forward by `size`, returns the first value of the block."""
+    with transaction.atomic():
+        row = CodeSequence.objects.select_for_update().filter(name=name).first()
+        if row is None:
+            try:
+                with transaction.atomic():
+                    row = CodeSequence.objects.create(name=name, next_value=initial())
+            except IntegrityError:
+                # another process created it first
+                row = CodeSequence.objects.select_for_update().get(name=name)
+
+        start = max(row.next_value, floor)
+        CodeSequence.objects.filter(pk=row.pk).update(next_value=start + size)
+    return start
+
+
+def _reserve_committed(name, size, initial, floor):
+    """
+    The reservation must survive a rollback of the caller's transaction,
+    otherwise another process could get the same block. Inside an atomic
+    block it therefore runs on its own connection (a short-lived thread).
+    SQLite has one writer at a time and would wait on the caller forever, so
+    there it stays inline; `floor` keeps this process from re-using a
+    rolled back block.
+    """
+    if not connection.in_atomic_block or connection.vendor == "sqlite":
+        return _reserve(name, size, initial, floor)
+
+    result = {}
+
+    def run():
+        try:
+            result["start"] = _reserve(name, size, initial, floor)
+        except Exception as e:
+            result["error"] = e
+        finally:
+            connection.close()  # this thread's own connection
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    worker.join()
+
+    if "error" in result:
+        raise result["error"]
+    return result["start"]
+
+
+class CodeAllocator:
+    """Per-process blocks: name -> [next value, end of block)."""
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._pid = os.getpid()
+
+    def next_value(self, name, initial=lambda: 1):
+        return self.next_values(name, 1, initial)[0]
+
+    def next_values(self, name, count, initial=lambda: 1):
+        """
+        `count` consecutive-as-possible values: what is left of the current
+        block, then ONE new block big enough for the rest.
+        """
+        with self._lock:
+            if os.getpid() != self._pid:
+                # forked worker: the parent's blocks are not ours to use
+                self._blocks = {}
+                self._pid = os.getpid()
+
+            values = []
+            block = self._blocks.get(name)
+            if block is not None:
+                take = min(count, block[1] - block[0])
+                values.extend(range(block[0], block[0] + take))
+                block[0] += take
+
+            missing = count - len(values)
+            if missing:
+                size = max(missing, self.block_size or _block_size())
+                floor = block[1] if block else 0
+                start = _reserve_committed(name, size, initial, floor)
+                values.extend(range(start, start + missing))
+                self._blocks[name] = [start + missing, start + size]
+
+            return values
+
+
+allocator = CodeAllocator()
+
+
+def next_code(prefix, model, field):
+    """e.g. next_code("REQ", PermissionRequest, "request_code") -> "REQ-000124"."""
+    value = allocator.next_value(prefix, lambda: initial_value(model, field, prefix))
+    return f"{prefix}-{value:06d}"
+
+
+def next_codes(prefix, model, field, count):
+    """next_code() for `count` rows at once (bulk_create), at most one reservation."""
+    values = allocator.next_values(prefix, count, lambda: initial_value(model, field, prefix))
+    return [f"{prefix}-{value:06d}" for value in values]
@@ -0,0 +1,79 @@
+"""
+Per-user cache of the dashboard data (profile, counters, first page of rows).
+
+Every user has a generation number in the cache; the dashboard entry is stored
+under (user, generation), so bumping the generation makes the old entry
+unreachable - nothing has to be deleted. Generations are bumped by the
+PermissionRequest / UserProfile signals (accounts/signals.py) and by
+run_escalations, for the student and for the old and new assignee.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+def _gen_key(user_id):
+    return f"dash:gen:{user_id}"
+
+
+def _data_key(user_id, gen):
+    return f"dash:data:{user_id}:{gen}"
+
+
+def _timeout():
+    return getattr(settings, "DASHBOARD_CACHE_SECONDS", 300)
+
+
+def _fresh_generation():
+    # not 1: if the counter gets evicted, an old (user, gen) entry must not come back
+    return int(time.time() * 1000)
+
+
+def _bump_now(user_ids):
+    for user_id in user_ids:
+        try:
+            cache.incr(_gen_key(user_id))
+        except ValueError:
+            cache.set(_gen_key(user_id), _fresh_generation(), None)
+
+
+def bump(*user_ids):
+    """
+    Invalidates the cached dashboards of these users.
+    Bumps now and again after the surrounding transaction commits, so a
+    dashboard rebuilt from not-yet-committed data can't survive the commit.
+    """
+    user_ids = {u for u in user_ids if u}
+    if not user_ids:
+        return
+
+    _bump_now(user_ids)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump_now(user_ids))
+
+
+def generation(user_id):
+    """Current generation of this user's dashboard (changes whenever it must be rebuilt)."""
+    gen = cache.get(_gen_key(user_id))
+    if gen is None:
+        gen = _fresh_generation()
+        if not cache.add(_gen_key(user_id), gen, None):
+            gen = cache.get(_gen_key(user_id), gen)
+    return gen
+
+
+def cached_dashboard(user_id, build):
+    """
+    Returns (generation, build()) for this user, the data coming from the
+    cache while their generation is unchanged.
+    """
+    gen = generation(user_id)
+
+    key = _data_key(user_id, gen)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, _timeout())
+    return gen, data
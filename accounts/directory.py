@@ -0,0 +1,141 @@
+"""
+Department directory: who holds role X in department Y.
+
+Every process keeps an in-memory index of the non-student UserProfiles
+(with their User) by (department, role), stamped with the version number
+found in the shared cache when it was built. Saving / deleting a profile or
+a user bumps that version (accounts/signals.py), and each process rebuilds
+its index - one query - the next time it is asked. Lookups in between cost
+no queries at all.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import UserProfile
+
+
+VERSION_KEY = "directory:version"
+
+
+def _norm(value):
+    return (value or "").strip().lower()
+
+
+# ---------------- VERSION STAMP ---------------- #
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # start from the clock, so an evicted counter never repeats an old stamp
+        version = int(time.time() * 1000)
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def _bump_now():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+    _index.clear()
+
+
+def invalidate():
+    """Called on profile / user changes; again after commit (see dashboard_cache.bump)."""
+    _bump_now()
+    if connection.in_atomic_block:
+        transaction.on_commit(_bump_now)
+
+
+# ---------------- INDEX ---------------- #
+
+class _Index:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.by_dept_role = {}
+        self.by_user = {}
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+
+    def current(self):
+        version = _current_version()
+        with self._lock:
+            if self.version == version:
+                return self
+            self._build(version)
+            return self
+
+    def _build(self, version):
+        by_dept_role = defaultdict(list)
+        by_user = {}
+        qs = (
+            UserProfile.objects
+            .exclude(role="student")
+            .select_related("user")
+            .order_by("pk")
+        )
+        for p in qs:
+            by_dept_role[(p.department, _norm(p.role))].append(p)
+            by_user[p.user_id] = p
+
+        self.by_dept_role = dict(by_dept_role)
+        self.by_user = by_user
+        self.version = version
+
+
+_index = _Index()
+
+
+# ---------------- LOOKUPS ---------------- #
+
+def profiles(department, role):
+    """Profiles (with .user) holding `role` in `department`, by pk."""
+    return list(_index.current().by_dept_role.get((department, _norm(role)), ()))
+
+
+def first_user(department, role):
+    """The User holding `role` in `department` (first profile by pk), or None."""
+    found = _index.current().by_dept_role.get((department, _norm(role)))
+    return found[0].user if found else None
+
+
+def profile_of(user_id, department=None, role=None):
+    """Staff profile of this user, optionally required to match department / role."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    p = _index.current().by_user.get(user_id)
+    if p is None:
+        return None
+    if department is not None and p.department != department:
+        return None
+    if role is not None and _norm(p.role) != _norm(role):
+        return None
+    return p
+
+
+def staff_in_department(department, exclude_user_id=None):
+    """Every non-student profile in the department, by pk."""
+    index = _index.current()
+    return [
+        p for p in index.by_user.values()
+        if p.department == department and p.user_id != exclude_user_id
+    ]
+
+
+def targets():
+    """{department: {role: User}} - first profile by pk per (department, role)."""
+    result = defaultdict(dict)
+    for (department, role), found in _index.current().by_dept_role.items():
+        result[department][role] = found[0].user
+    return result
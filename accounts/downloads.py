@@ -0,0 +1,207 @@
+"""
+Delivery of protected uploads (request letters, certificate attachments).
+
+The download views check access and hand the stored file to serve_file():
+
+  * SENDFILE_BACKEND = "nginx"     -> X-Accel-Redirect to SENDFILE_NGINX_PREFIX + name
+                                      (an `internal` location aliased to MEDIA_ROOT)
+  * SENDFILE_BACKEND = "xsendfile" -> X-Sendfile with the absolute path
+                                      (Apache mod_xsendfile, lighttpd)
+  * not set                        -> FileResponse streamed in chunks by Django,
+                                      with Range (one range) and If-Range
+
+Either way the response carries a strong ETag - the content hash for blobs
+(accounts/blobs.py), size + mtime for files stored before them, or the
+caller's own - and a matching If-None-Match (or If-Modified-Since, when a
+Last-Modified is given) gets a 304 without touching the file.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import serve
+
+from .blobs import is_blob
+
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# the only MEDIA_ROOT files that are not uploads: approver signatures / stamps
+# drawn on the certificate pages. Anything else under MEDIA_URL is refused
+# (public_media() under DEBUG - the front-end server should do the same).
+PUBLIC_MEDIA_PREFIXES = ("signatures/", "stamps/")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def etag_for(name, stat):
+    if is_blob(name):
+        # blobs/ab/cd/<sha256><ext>: the name is the content
+        return '"{}"'.format(os.path.basename(name)[:64])
+    return '"{:x}-{:x}"'.format(stat.st_size, int(stat.st_mtime))
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak comparison, as RFC 7232 asks for If-None-Match
+    tags = [t.strip() for t in header.split(",")]
+    return any(t[2:] == etag if t.startswith("W/") else t == etag for t in tags)
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the whole
+    file (no header, several ranges, other units). Raises RangeNotSatisfiable.
+    """
+    if not header:
+        return None
+    m = _RANGE.match(header.strip())
+    if not m:
+        return None   # multipart ranges are optional - send it all
+    first, last = m.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # suffix: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+class _RangeFile:
+    """
+    read() limited to `length` bytes of `f` from where it is now. No fileno():
+    a WSGI file_wrapper would otherwise sendfile() the rest of the file.
+    """
+
+    def __init__(self, f, length):
+        self._f = f
+        self._left = length
+
+    def read(self, size=-1):
+        if self._left <= 0:
+            return b""
+        if size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+def _content_disposition(filename, as_attachment=False):
+    disposition = "attachment" if as_attachment else "inline"
+    try:
+        filename.encode("ascii")
+        return '{}; filename="{}"'.format(disposition, filename.replace("\\", "\\\\").replace('"', r"\""))
+    except UnicodeEncodeError:
+        return "{}; filename*=utf-8''{}".format(disposition, quote(filename))
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        return _etag_matches(if_none_match, etag)
+    # only without If-None-Match (RFC 7232 section 6)
+    since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE") or "")
+    return bool(last_modified and since and int(last_modified.timestamp()) <= since)
+
+
+def serve_file(request, field_file, filename="", *, etag=None, last_modified=None, as_attachment=False):
+    """
+    Response for a stored FileField value; filename is what the browser is
+    told. etag / last_modified (datetime) replace the ones from the file.
+    """
+    if not field_file or not field_file.name:
+        raise Http404("No file")
+    try:
+        path = field_file.path
+        stat = os.stat(path)
+    except (NotImplementedError, ValueError, OSError):
+        raise Http404("File not found")
+
+    filename = filename or os.path.basename(field_file.name)
+    etag = etag or etag_for(field_file.name, stat)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": _content_disposition(filename, as_attachment),
+    }
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified.timestamp())
+
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponse(status=304)
+        for header in ("ETag", "Cache-Control", "Last-Modified"):
+            if header in headers:
+                response[header] = headers[header]
+        return response
+
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    backend = getattr(settings, "SENDFILE_BACKEND", None)
+    if backend:
+        # the front-end server sends the body and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        if backend == "nginx":
+            prefix = getattr(settings, "SENDFILE_NGINX_PREFIX", "/protected-media/")
+            response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(field_file.name)
+        else:
+            response["X-Sendfile"] = path
+    else:
+        byte_range = None
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if not if_range or if_range.strip() == etag:
+            try:
+                byte_range = parse_range(request.META.get("HTTP_RANGE"), stat.st_size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stat.st_size}"
+                return response
+
+        f = open(path, "rb")
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            start, end = byte_range
+            f.seek(start)
+            response = FileResponse(_RangeFile(f, end - start + 1), status=206, content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(end - start + 1)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def public_media(request, path):
+    """
+    MEDIA_URL/<path> under DEBUG: only PUBLIC_MEDIA_PREFIXES, uploads are
+    served by their download views.
+    """
+    path = posixpath.normpath(path).lstrip("/")
+    if not path.startswith(PUBLIC_MEDIA_PREFIXES):
+        raise Http404("Not found")
+    return serve(request, path, document_root=settings.MEDIA_ROOT)
+
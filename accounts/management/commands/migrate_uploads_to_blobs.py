@@ -0,0 +1,83 @@
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.blobs import blob_storage, collect, is_blob
+from certificates.models import CertificateAttachment
+from permissions.models import AttachmentText, PermissionRequest
+
+
+class Command(BaseCommand):
+    help = (
+        "Move uploads stored before BlobStorage (request letters, certificate "
+        "attachments) into it - one file per distinct content - then remove the old files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved.")
+        parser.add_argument("--keep-old", action="store_true", help="Leave the old files where they are.")
+        parser.add_argument("--collect", action="store_true",
+                            help="Also remove blobs nothing references any more.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        legacy = FileSystemStorage()   # MEDIA_ROOT, where they were written so far
+
+        moved = 0
+        missing = 0
+        old_bytes = 0
+        blob_names = set()
+        old_names = set()
+
+        for model in (PermissionRequest, CertificateAttachment):
+            rows = (
+                model.objects
+                .exclude(file="").exclude(file__isnull=True)
+                .only("id", "file", "original_filename")
+                .order_by("id")
+            )
+            for row in rows.iterator():
+                old = row.file.name
+                if is_blob(old):
+                    continue
+                if not legacy.exists(old):
+                    missing += 1
+                    self.stdout.write(self.style.WARNING(f"{model.__name__} {row.id}: {old} is missing"))
+                    continue
+
+                moved += 1
+                if old not in old_names:
+                    old_bytes += legacy.size(old)
+                old_names.add(old)
+                if dry_run:
+                    continue
+
+                with transaction.atomic():
+                    with legacy.open(old, "rb") as f:
+                        new = blob_storage.save(old, File(f))
+                    model.objects.filter(id=row.id).update(
+                        file=new,
+                        original_filename=row.original_filename or os.path.basename(old)[:255],
+                    )
+                    if model is PermissionRequest:
+                        # same bytes -> the extracted text still applies
+                        AttachmentText.objects.filter(request_id=row.id, file_name=old).update(file_name=new)
+                blob_names.add(new)
+
+        if not dry_run and not options["keep_old"]:
+            # only after every row that could share an old file (REQ-TMP) has moved
+            for old in old_names:
+                legacy.delete(old)
+
+        collected = collect() if options["collect"] and not dry_run else 0
+
+        new_bytes = sum(blob_storage.size(name) for name in blob_names)
+        prefix = "Would move" if dry_run else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}: {moved} upload(s) | old files: {len(old_names)} ({old_bytes} bytes) "
+            f"-> blobs: {len(blob_names)} ({new_bytes} bytes) | missing: {missing} "
+            f"| unreferenced blobs removed: {collected}"
+        ))
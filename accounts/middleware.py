@@ -0,0 +1,29 @@
+from django.utils.functional import SimpleLazyObject
+
+from .models import UserProfile
+
+
+def get_profile(request):
+    """The signed-in user's UserProfile (user joined), fetched once per request."""
+    if not hasattr(request, "_cached_profile"):
+        user = request.user
+        request._cached_profile = (
+            UserProfile.objects.select_related("user").filter(user_id=user.id).first()
+            if user.is_authenticated else None
+        )
+    return request._cached_profile
+
+
+class ProfileMiddleware:
+    """
+    Sets request.profile, resolved lazily like request.user: views that
+    never touch it cost no query, views that touch it several times cost one.
+    It is falsy for anonymous users and users without a profile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request))
+        return self.get_response(request)
@@ -47,3 +47,36 @@ class PasswordResetOTP(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
+
+
+class CodeSequence(models.Model):
+    """
+    Counter behind the human readable codes (REQ-000123, CERTREQ-..., CERT-...).
+    Processes reserve blocks of values from it, see accounts/codes.py.
+    """
+    name = models.CharField(max_length=30, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} -> {self.next_value}"
+
+
+class Blob(models.Model):
+    """
+    One file of BlobStorage (accounts/blobs.py): stored once per distinct
+    content, `refcount` = how many FileField values point at it.
+    """
+    name = models.CharField(max_length=100, unique=True)   # blobs/ab/cd/<sha256><ext>
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # collect(): refcount=0
+            models.Index(fields=["refcount"], name="blob_refcount_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
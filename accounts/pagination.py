@@ -0,0 +1,105 @@
+"""
+Keyset (cursor) pagination for the dashboard / my-requests lists.
+
+keys -> list of (field_or_annotation, descending, type), the LAST one must be
+unique (id); type is int, bool or datetime - a cursor value of any other type
+is a BadCursor, never a query error.
+The cursor is the key values of the last row on the page, so the next page is
+"rows after this one" in the same ORDER BY - no OFFSET scan, stable while new
+requests arrive.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class BadCursor(ValueError):
+    pass
+
+
+def _encode_value(v):
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    return v
+
+
+def _decode_value(v):
+    if isinstance(v, dict) and "dt" in v:
+        dt = parse_datetime(v["dt"]) if isinstance(v["dt"], str) else None
+        if dt is None:
+            raise BadCursor("bad datetime in cursor")
+        return dt
+    return v
+
+
+def encode_values(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def encode_cursor(obj, keys):
+    return encode_values([getattr(obj, field) for field, _, _ in keys])
+
+
+def decode_cursor(cursor, keys):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode())
+    except (ValueError, UnicodeDecodeError):
+        raise BadCursor("cursor is not valid")
+
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise BadCursor("cursor does not match this list")
+    values = [_decode_value(v) for v in values]
+    for (field, _, kind), value in zip(keys, values):
+        # bool is an int subclass - an int key takes no true / false
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            raise BadCursor(f"bad {field} in cursor")
+    return values
+
+
+def _after(keys, values):
+    """
+    (a, b, c) > (a0, b0, c0) in ORDER BY terms, per-column direction aware:
+      a >a0  OR  (a = a0 AND b >b0)  OR  (a = a0 AND b = b0 AND c >c0)
+    """
+    q = Q()
+    equal = {}
+    for (field, desc, _), value in zip(keys, values):
+        op = "lt" if desc else "gt"
+        q |= Q(**equal, **{f"{field}__{op}": value})
+        equal[field] = value
+    return q
+
+
+def order_by_keys(keys):
+    return [("-" if desc else "") + field for field, desc, _ in keys]
+
+
+def keyset_page(qs, keys, cursor=None, page_size=25):
+    """
+    Returns (rows, next_cursor). next_cursor is None on the last page.
+    Raises BadCursor for a cursor that can't be decoded.
+    """
+    if cursor:
+        qs = qs.filter(_after(keys, decode_cursor(cursor, keys)))
+
+    rows = list(qs.order_by(*order_by_keys(keys))[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = encode_cursor(rows[-1], keys) if has_more and rows else None
+    return rows, next_cursor
+
+
+def rows_after(qs, keys, cursor, limit):
+    """
+    Up to `limit` rows strictly after the cursor, in keys order.
+    Returns (rows, has_more). Used to poll for changes since a cursor.
+    """
+    qs = qs.filter(_after(keys, decode_cursor(cursor, keys)))
+    rows = list(qs.order_by(*order_by_keys(keys))[:limit + 1])
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from permissions.models import PermissionRequest
+from . import directory
+from .dashboard_cache import bump
+from .models import UserProfile
+
+
+# ---------------- DASHBOARD CACHE INVALIDATION ---------------- #
+
+@receiver(post_init, sender=PermissionRequest)
+def remember_assignee(sender, instance, **kwargs):
+    # assignee as loaded, so a forward/reassign also refreshes the previous inbox
+    instance._loaded_request_to_id = instance.__dict__.get("request_to_id")
+
+
+@receiver(post_save, sender=PermissionRequest)
+@receiver(post_delete, sender=PermissionRequest)
+def permission_request_changed(sender, instance, **kwargs):
+    bump(
+        instance.student_id,
+        instance.request_to_id,
+        getattr(instance, "_loaded_request_to_id", None),
+    )
+    instance._loaded_request_to_id = instance.request_to_id
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    bump(instance.user_id)
+
+
+# ---------------- DIRECTORY INVALIDATION ---------------- #
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_directory_changed(sender, instance, **kwargs):
+    directory.invalidate()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_directory_changed(sender, instance, update_fields=None, **kwargs):
+    # every login saves last_login - that doesn't change the directory
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    directory.invalidate()
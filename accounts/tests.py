@@ -1,3 +1,512 @@
-from django.test import TestCase
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, timedelta
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import Http404
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from certificates.models import CertificateAttachment, CertificateRequest, IssuedCertificate
+from permissions.models import AttachmentText, PermissionRequest, RequestHistory
+from . import blobs, dashboard_cache, directory
+from .codes import CodeAllocator, allocator
+from .downloads import public_media
+from .middleware import ProfileMiddleware
+from .models import Blob, CodeSequence, UserProfile
+from .pagination import encode_values
+
+
+_PROFILE_SELECT = re.compile(r"\bFROM\s+[\"`]?accounts_userprofile\b", re.I)
+
+
+def profile_lookups(client, method, path, data=None):
+    """(response, number of UserProfile SELECTs the request made)."""
+    with CaptureQueriesContext(connection) as queries:
+        response = getattr(client, method)(path, data or {})
+    return response, sum(1 for q in queries if _PROFILE_SELECT.search(q["sql"]))
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class CodeAllocatorConcurrencyTests(TransactionTestCase):
+    """
+    Many threads create requests / certificates at once (each with its own
+    DB connection), some through private allocators standing in for other
+    processes, and every code must come out exactly once.
+    """
+
+    THREADS = 8
+    PER_THREAD = 15
+
+    def setUp(self):
+        self.student = User.objects.create_user(username="stu", password="x")
+        self.staff = User.objects.create_user(username="staff", password="x")
+
+    def _run(self, work):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker(n):
+            try:
+                barrier.wait()
+                work(n)
+            except Exception as e:  # pragma: no cover - surfaced below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_creates_get_unique_codes(self):
+        def create(n, i):
+            PermissionRequest.objects.create(
+                student=self.student,
+                request_to=self.staff,
+                title=f"{n}-{i}",
+                reason="test",
+                from_date=date.today(),
+                to_date=date.today(),
+            )
+            cert = CertificateRequest.objects.create(
+                cert_type="study", student=self.student, request_to=self.staff,
+            )
+            IssuedCertificate.objects.create(request=cert)
+
+        def work(n):
+            for i in range(self.PER_THREAD):
+                if i % 2:
+                    # like the views: the block is reserved on a side connection
+                    with transaction.atomic():
+                        create(n, i)
+                else:
+                    create(n, i)
+
+        self._run(work)
+
+        total = self.THREADS * self.PER_THREAD
+        for model, field in (
+            (PermissionRequest, "request_code"),
+            (CertificateRequest, "request_code"),
+            (IssuedCertificate, "cert_code"),
+        ):
+            codes = list(model.objects.values_list(field, flat=True))
+            self.assertEqual(len(codes), total)
+            self.assertEqual(len(set(codes)), total, f"duplicate {model.__name__}.{field}")
+            self.assertTrue(all(c for c in codes))
+
+    def test_create_is_a_single_insert(self):
+        allocator._blocks.pop("REQ", None)  # warm-up below reserves a fresh block
+        PermissionRequest.objects.create(
+            student=self.student, request_to=self.staff, title="warm up", reason="-",
+            from_date=date.today(), to_date=date.today(),
+        )
+        # the search index is written after the INSERT (permissions/signals.py) - not counted here
+        with CaptureQueriesContext(connection) as queries, \
+                patch("permissions.signals.search.index_requests") as index:
+            req = PermissionRequest.objects.create(
+                student=self.student, request_to=self.staff, title="one", reason="-",
+                from_date=date.today(), to_date=date.today(),
+            )
+        self.assertEqual([q["sql"].split()[0] for q in queries], ["INSERT"])
+        index.assert_called_once_with([req.pk])
+
+    def test_separate_allocators_never_share_a_block(self):
+        handed_out = []
+        lock = threading.Lock()
+
+        def work(n):
+            # one allocator per thread = one per process
+            allocator = CodeAllocator(block_size=3)
+            values = [allocator.next_value("TEST") for _ in range(self.PER_THREAD)]
+            with lock:
+                handed_out.extend(values)
+
+        self._run(work)
+
+        duplicates = [v for v, c in Counter(handed_out).items() if c > 1]
+        self.assertEqual(duplicates, [])
+        self.assertGreaterEqual(
+            CodeSequence.objects.get(name="TEST").next_value,
+            self.THREADS * self.PER_THREAD + 1,
+        )
+
+
+class DirectoryTests(TestCase):
+    def setUp(self):
+        self.hod = User.objects.create_user(username="hod", password="x")
+        self.dean = User.objects.create_user(username="dean", password="x")
+        UserProfile.objects.create(user=self.hod, role="hod", department="CSE")
+        UserProfile.objects.create(user=self.dean, role="Dean", department="CSE")
+
+    def test_repeat_lookups_hit_no_database(self):
+        directory.first_user("CSE", "hod")  # builds the index
+        with self.assertNumQueries(0):
+            self.assertEqual(directory.first_user("CSE", "dean"), self.dean)
+            self.assertEqual(directory.profile_of(str(self.hod.id), department="CSE", role="hod").user, self.hod)
+            self.assertIsNone(directory.profile_of(self.hod.id, role="dean"))
+            self.assertEqual(
+                [p.user for p in directory.staff_in_department("CSE", exclude_user_id=self.hod.id)],
+                [self.dean],
+            )
+            self.assertEqual(directory.targets()["CSE"]["hod"], self.hod)
+
+    def test_profile_change_invalidates(self):
+        self.assertEqual(directory.first_user("CSE", "principal"), None)
+        principal = User.objects.create_user(username="principal", password="x")
+        UserProfile.objects.create(user=principal, role="principal", department="CSE")
+        self.assertEqual(directory.first_user("CSE", "principal"), principal)
+
+        UserProfile.objects.filter(user=self.hod).first().delete()
+        self.assertIsNone(directory.profile_of(self.hod.id))
+
+    def test_login_does_not_invalidate(self):
+        directory.first_user("CSE", "hod")
+        self.hod.save(update_fields=["last_login"])
+        with self.assertNumQueries(0):
+            directory.first_user("CSE", "hod")
+
+
+class ProfileMiddlewareTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user(username="stu", password="x", first_name="Stu")
+        self.proctor = User.objects.create_user(username="proc", password="x")
+        UserProfile.objects.create(user=self.student, role="student", department="CSE", roll_number="21CS001")
+        UserProfile.objects.create(user=self.proctor, role="proctor", department="CSE")
+        PermissionRequest.objects.create(
+            student=self.student, request_to=self.proctor, title="t", reason="-",
+            from_date=date.today(), to_date=date.today(), current_level="proctor",
+        )
+        directory.targets()  # built here, not counted against the views
+
+    def test_profile_is_lazy_and_memoized(self):
+        request = RequestFactory().get("/")
+        request.user = self.student
+        ProfileMiddleware(lambda r: None)(request)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(request.profile.roll_number, "21CS001")
+            self.assertEqual(request.profile.user.first_name, "Stu")  # joined
+            self.assertTrue(request.profile)
+
+    def test_views_look_the_profile_up_once(self):
+        self.client.force_login(self.student)
+        for method, path in (
+            ("get", "/accounts/dashboard/"),
+            ("get", "/accounts/request_permission/"),
+            ("get", "/accounts/dashboard/more/?list=submitted"),
+        ):
+            response, lookups = profile_lookups(self.client, method, path)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertLessEqual(lookups, 1, path)
+
+        # cached dashboard: the profile comes with the cached data
+        self.assertEqual(profile_lookups(self.client, "get", "/accounts/dashboard/")[1], 0)
+        # views that don't need it don't pay for it
+        self.assertEqual(profile_lookups(self.client, "get", "/accounts/my-requests/")[1], 0)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class DashboardQueryTests(TestCase):
+    """The dashboard costs a fixed number of queries however many rows it shows."""
+
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create_user(username="stu", password="x")
+        self.proctor = User.objects.create_user(username="proc", password="x")
+        self.hod = User.objects.create_user(username="hod", password="x")
+        UserProfile.objects.create(user=self.student, role="student", department="CSE", roll_number="21CS001")
+        UserProfile.objects.create(user=self.proctor, role="proctor", department="CSE")
+        UserProfile.objects.create(user=self.hod, role="hod", department="CSE")
+
+    def _requests(self, n):
+        for i in range(n):
+            req = PermissionRequest.objects.create(
+                student=self.student, request_to=self.proctor, title=f"r{i}", reason="-",
+                from_date=date.today(), to_date=date.today(), current_level="proctor",
+                status=("pending", "approved", "rejected")[i % 3], is_urgent=i % 2 == 0,
+            )
+            RequestHistory.objects.create(request=req, action="created", actor=self.student)
+            if i % 4 == 0:
+                req.request_to = self.hod
+                req.current_level = "hod"
+                req.was_auto_escalated = True
+                req.escalation_count = 1
+                req.save()
+                RequestHistory.objects.create(request=req, action="auto_escalated", from_user=self.proctor)
+        call_command("rebuild_queue_stats", stdout=StringIO())
+
+    def _assert_dashboard_queries(self, user, expected):
+        self.client.force_login(user)
+        cache.clear()   # the rebuild, not the cached copy
+        with self.assertNumQueries(expected):
+            response = self.client.get("/accounts/dashboard/")
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_student_dashboard(self):
+        self._requests(3)
+        self._assert_dashboard_queries(self.student, 6)
+        self._requests(9)
+        response = self._assert_dashboard_queries(self.student, 6)
+        self.assertEqual(len(response.context["submitted_requests"]), 12)
+
+    def test_authority_dashboard(self):
+        self._requests(3)
+        self._assert_dashboard_queries(self.proctor, 7)
+        self._assert_dashboard_queries(self.hod, 7)
+        self._requests(9)
+        response = self._assert_dashboard_queries(self.proctor, 7)
+        self.assertEqual(len(response.context["received_requests"]), 8)
+        response = self._assert_dashboard_queries(self.hod, 7)
+        self.assertEqual(len(response.context["received_requests"]), 4)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class DashboardCacheTests(TestCase):
+    """A change made through the views is on the next dashboard render, not the cached one."""
+
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create_user(username="stu", password="x")
+        self.proctor = User.objects.create_user(username="proc", password="x")
+        self.hod = User.objects.create_user(username="hod", password="x")
+        UserProfile.objects.create(user=self.student, role="student", department="CSE", roll_number="21CS001")
+        UserProfile.objects.create(user=self.proctor, role="proctor", department="CSE")
+        UserProfile.objects.create(user=self.hod, role="hod", department="CSE")
+        self.req = PermissionRequest.objects.create(
+            student=self.student, request_to=self.proctor, title="Hackathon", reason="-",
+            from_date=date.today(), to_date=date.today(), current_level="proctor",
+        )
+        call_command("rebuild_queue_stats", stdout=StringIO())
+
+    def _dashboard(self, user):
+        self.client.force_login(user)
+        response = self.client.get("/accounts/dashboard/")
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def _received_ids(self, user):
+        return [r.id for r in self._dashboard(user)["received_requests"]]
+
+    def test_unchanged_dashboard_is_served_from_the_cache(self):
+        first = self._dashboard(self.proctor)["changes_gen"]
+        with self.assertNumQueries(2):   # session + user, nothing for the dashboard itself
+            response = self.client.get("/accounts/dashboard/")
+        self.assertEqual(response.context["changes_gen"], first)
+
+    def test_status_change_refreshes_student_and_assignee(self):
+        self._dashboard(self.student)
+        self._dashboard(self.proctor)
+        before = {u.id: dashboard_cache.generation(u.id) for u in (self.student, self.proctor, self.hod)}
+
+        self.client.force_login(self.proctor)
+        self.client.get(f"/permissions/approve/{self.req.id}/")
+
+        after = {u.id: dashboard_cache.generation(u.id) for u in (self.student, self.proctor, self.hod)}
+        self.assertNotEqual(after[self.student.id], before[self.student.id])
+        self.assertNotEqual(after[self.proctor.id], before[self.proctor.id])
+        self.assertEqual(after[self.hod.id], before[self.hod.id])
+
+        student = self._dashboard(self.student)
+        self.assertEqual([r.status for r in student["submitted_requests"]], ["approved"])
+        self.assertEqual(self._dashboard(self.proctor)["received_counts"]["approved"], 1)
+
+    def test_forward_refreshes_the_previous_assignee(self):
+        self.assertEqual(self._received_ids(self.proctor), [self.req.id])
+        self.assertEqual(self._received_ids(self.hod), [])
+        before = dashboard_cache.generation(self.proctor.id)
+
+        self.client.force_login(self.proctor)
+        self.client.post(
+            f"/permissions/requests/{self.req.id}/forward-do/",
+            {"target_role": "hod", "target_user_id": self.hod.id},
+        )
+
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.request_to_id, self.hod.id)
+        self.assertNotEqual(dashboard_cache.generation(self.proctor.id), before)
+        self.assertEqual(self._received_ids(self.proctor), [])
+        self.assertEqual(self._received_ids(self.hod), [self.req.id])
+
+
+class LoadMoreCursorTests(TestCase):
+    """A cursor that decodes but doesn't fit the list is a 400, not a query error."""
+
+    def setUp(self):
+        self.proctor = User.objects.create_user(username="proc", password="x")
+        UserProfile.objects.create(user=self.proctor, role="proctor", department="CSE")
+        self.client.force_login(self.proctor)
+
+    def _more(self, name, values):
+        return self.client.get("/accounts/dashboard/more/", {"list": name, "cursor": encode_values(values)})
+
+    def test_valid_cursor(self):
+        response = self._more("received", [0, True, timezone.now(), 10])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 0)
+
+    def test_wrongly_typed_values(self):
+        now = timezone.now()
+        for name, values in [
+            ("received", ["x", True, now, 10]),
+            ("received", [0, 1, now, 10]),
+            ("received", [0, True, "2020-01-01", 10]),
+            ("received", [0, True, now, True]),
+            ("submitted", [{"x": 1}, 10]),
+            ("submitted", [{"dt": 5}, 10]),
+            ("submitted", [now, None]),
+            ("submitted", [now, [10]]),
+        ]:
+            with self.subTest(name=name, values=values):
+                response = self._more(name, values)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()["ok"])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user(username="stu", password="x")
+        self.staff = User.objects.create_user(username="staff", password="x")
+
+    def _request(self, upload=None):
+        return PermissionRequest.objects.create(
+            student=self.student, request_to=self.staff, title="t", reason="-",
+            from_date=date.today(), to_date=date.today(), file=upload,
+        )
+
+    def test_same_bytes_are_stored_once(self):
+        first = self._request(SimpleUploadedFile("Circular.PDF", b"%PDF same bytes"))
+        second = self._request(SimpleUploadedFile("circular (1).pdf", b"%PDF same bytes"))
+        cert = CertificateRequest.objects.create(student=self.student, request_to=self.staff, cert_type="study")
+        attachment = CertificateAttachment.objects.create(
+            request=cert, file=SimpleUploadedFile("proof.pdf", b"%PDF same bytes")
+        )
+        other = self._request(SimpleUploadedFile("other.pdf", b"%PDF other bytes"))
+
+        name = first.file.name
+        self.assertRegex(name, r"^blobs/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.pdf$")
+        self.assertEqual({second.file.name, attachment.file.name}, {name})
+        self.assertNotEqual(other.file.name, name)
+        self.assertEqual(
+            (first.original_filename, second.original_filename, attachment.original_filename),
+            ("Circular.PDF", "circular (1).pdf", "proof.pdf"),
+        )
+
+        blob = Blob.objects.get(name=name)
+        self.assertEqual((blob.refcount, blob.size), (3, len(b"%PDF same bytes")))
+        with first.file.open("rb") as f:
+            self.assertEqual(f.read(), b"%PDF same bytes")
+        self.assertEqual(len(os.listdir(os.path.dirname(first.file.path))), 1)
+
+    def test_last_reference_removes_the_file(self):
+        first = self._request(SimpleUploadedFile("a.pdf", b"shared"))
+        second = self._request(SimpleUploadedFile("b.pdf", b"shared"))
+        name, path = first.file.name, first.file.path
+
+        first.delete()
+        self.assertEqual(blobs.collect(), 0)
+        self.assertTrue(os.path.exists(path))
+
+        # replacing the file releases the old one
+        second.file = SimpleUploadedFile("c.pdf", b"new content")
+        second.save()
+        self.assertEqual(Blob.objects.get(name=name).refcount, 0)
+
+        self.assertEqual(blobs.collect(), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(list(Blob.objects.values_list("refcount", flat=True)), [1])
+
+        # the same bytes again after that are stored again
+        again = self._request(SimpleUploadedFile("a.pdf", b"shared"))
+        self.assertEqual(again.file.path, path)
+        self.assertTrue(os.path.exists(path))
+
+    def test_files_of_rolled_back_uploads_are_swept(self):
+        kept = self._request(SimpleUploadedFile("kept.pdf", b"referenced"))
+        try:
+            with transaction.atomic():
+                orphan = self._request(SimpleUploadedFile("gone.pdf", b"rolled back"))
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertTrue(os.path.exists(orphan.file.path))
+        self.assertFalse(Blob.objects.filter(name=orphan.file.name).exists())
+
+        # too recent: may still be an upload whose transaction is open
+        blobs.collect()
+        self.assertTrue(os.path.exists(orphan.file.path))
+
+        later = timezone.now() + timedelta(hours=2)
+        self.assertGreaterEqual(blobs.sweep_orphans(now=later), 1)
+        self.assertFalse(os.path.exists(orphan.file.path))
+        self.assertTrue(os.path.exists(kept.file.path))
+        self.assertFalse(Blob.objects.filter(name=orphan.file.name).exists())
+
+    def test_migrate_command_moves_old_uploads(self):
+        legacy = "permissions/view/33/media/permissions/REQ-TMP.pdf"
+        FileSystemStorage().save(legacy, ContentFile(b"%PDF old upload"))
+
+        # two requests sharing the REQ-TMP file, one whose file is gone
+        reqs = [self._request() for _ in range(3)]
+        PermissionRequest.objects.filter(id__in=[reqs[0].id, reqs[1].id]).update(file=legacy)
+        PermissionRequest.objects.filter(id=reqs[2].id).update(file="permissions/REQ-000001.pdf")
+        AttachmentText.objects.create(request=reqs[0], file_name=legacy, status="done", text="old upload")
+
+        out = StringIO()
+        call_command("migrate_uploads_to_blobs", "--dry-run", stdout=out)
+        self.assertIn("Would move: 2 upload(s)", out.getvalue())
+        self.assertTrue(FileSystemStorage().exists(legacy))
+
+        call_command("migrate_uploads_to_blobs", stdout=StringIO())
+        moved = {r.id: r for r in PermissionRequest.objects.filter(id__in=[reqs[0].id, reqs[1].id])}
+        names = {r.file.name for r in moved.values()}
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(blobs.is_blob(name))
+        self.assertEqual({r.original_filename for r in moved.values()}, {"REQ-TMP.pdf"})
+        self.assertEqual(Blob.objects.get(name=name).refcount, 2)
+        self.assertEqual(AttachmentText.objects.get(request=reqs[0]).file_name, name)
+
+        self.assertFalse(FileSystemStorage().exists(legacy))
+        self.assertEqual(PermissionRequest.objects.get(id=reqs[2].id).file.name, "permissions/REQ-000001.pdf")
+
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PublicMediaTests(TestCase):
+    """MEDIA_URL under DEBUG serves signatures / stamps only, never uploads."""
+
+    def setUp(self):
+        for name in ("signatures/s.png", "permissions/REQ-1/letter.pdf", "certificates/CERT-1/CERT-1.pdf"):
+            FileSystemStorage().save(name, ContentFile(b"x"))
+
+    def _get(self, path):
+        return public_media(RequestFactory().get("/media/" + path), path)
+
+    def test_only_public_prefixes_are_served(self):
+        self.assertEqual(self._get("signatures/s.png").status_code, 200)
+        for path in (
+            "permissions/REQ-1/letter.pdf",
+            "certificates/CERT-1/CERT-1.pdf",
+            "signatures/../permissions/REQ-1/letter.pdf",
+        ):
+            with self.assertRaises(Http404, msg=path):
+                self._get(path)
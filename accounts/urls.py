@@ -14,8 +14,10 @@ urlpatterns = [
 
     # ✅ After login
     path("dashboard/", views.dashboard, name="dashboard"),
+    path("dashboard/more/", views.load_more_requests, name="load_more_requests"),
 
     # ✅ Permission pages
     path("request_permission/", views.request_permission, name="request_permission"),
+    path("request_permission/bulk/", views.bulk_request_permission, name="bulk_request_permission"),
     path("my-requests/", views.my_requests, name="my_requests"),
 ]
@@ -1,7 +1,5 @@
 # accounts/views.py  ✅ FULL UPDATED FILE (your same file, only updated request_permission + added email helper + imports)
 
-from datetime import timedelta
-
 from django.shortcuts import render, redirect
 from django.contrib.auth.models import User
 from .models import UserProfile, PasswordResetOTP
@@ -9,18 +7,27 @@ from permissions.models import PermissionRequest, RequestHistory
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
+from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.db import transaction
+from permissions.email_utils import queue_email
+from permissions.escalations import escalate_at_for
+from permissions.extraction import queue_extraction
+from permissions.events import publish, request_payload
+from permissions import bulk_submit, queue_stats
+from . import directory
+from .dashboard_cache import cached_dashboard
+from .pagination import BadCursor, encode_cursor, encode_values, keyset_page
 
-from django.db.models import Exists, OuterRef, Case, When, Value, IntegerField
-from django.db.models import Max
+from django.db.models import Case, When, Value, IntegerField, Count, Q
 
 
 
 from .models import PasswordResetOTP
 import random
+from datetime import datetime, timedelta
 
 
 
@@ -110,73 +117,145 @@ def employee_login(request):
 
 # -------------------- DASHBOARD -------------------- #
 
-@login_required
-def dashboard(request):
-    user = request.user
-    profile = UserProfile.objects.filter(user=user).first()
-    role = (profile.role or "").strip().lower() if profile else ""
+# keyset order for the lists (last key must be unique)
+RECEIVED_KEYS = [
+    ("is_urgent_rank", False, int), ("was_auto_escalated", True, bool), ("applied_at", True, datetime), ("id", True, int),
+]
+SUBMITTED_KEYS = [("applied_at", True, datetime), ("id", True, int)]
 
-    roll_number = user.first_name or user.username
-    if role == "student" and profile and getattr(profile, "roll_number", None):
-        roll_number = profile.roll_number
+# only the columns the row templates render
+SUBMITTED_FIELDS = (
+    "id", "title", "status", "current_level", "applied_at",
+    "request_to__first_name", "request_to__last_name", "request_to__username",
+)
+RECEIVED_FIELDS = (
+    "id", "title", "status", "current_level", "is_urgent", "applied_at", "was_auto_escalated",
+    "from_date", "to_date", "student__username",
+)
+
+
+# live refresh cursor, see permissions.views.changes_since
+CHANGE_KEYS = [("updated_at", False, datetime), ("id", False, int)]
+# commits can land slightly out of updated_at order -> keep re-reading this tail
+CHANGES_OVERLAP_SECONDS = 5
 
-    submitted_requests = (
+
+def latest_change_cursor(user):
+    """Cursor after the user's last changed request, no older than the overlap tail."""
+    tail = timezone.now() - timedelta(seconds=CHANGES_OVERLAP_SECONDS)
+    last = (
+        PermissionRequest.objects.filter(Q(student=user) | Q(request_to=user))
+        .only("id", "updated_at").order_by("-updated_at", "-id").first()
+    )
+    if last is None or last.updated_at < tail:
+        return encode_values([tail, 0])
+    return encode_cursor(last, CHANGE_KEYS)
+
+
+def _page_size():
+    return getattr(settings, "DASHBOARD_PAGE_SIZE", 25)
+
+
+def _submitted_queryset(user):
+    return (
         PermissionRequest.objects
         .filter(student=user)
         .select_related("request_to")
-        .order_by("-applied_at")
+        .only(*SUBMITTED_FIELDS)
     )
 
-    
 
-    received_requests = (
+def _received_queryset(user):
+    return (
         PermissionRequest.objects
         .filter(request_to=user)
         .select_related("student")
+        .only(*RECEIVED_FIELDS)
         .annotate(
-        is_urgent_rank=Case(
-            When(is_urgent=True, status="pending", then=Value(0)),  # urgent pending first
-            When(status="pending", then=Value(1)),                  # normal pending next
-            When(status="approved", then=Value(2)),
-            When(status="rejected", then=Value(3)),
-            default=Value(9),
-            output_field=IntegerField(),
-        ),
-        was_auto_escalated=Exists(
-            RequestHistory.objects.filter(
-                request_id=OuterRef("pk"),
-                action="auto_escalated"
-            )
-        ),
+            is_urgent_rank=Case(
+                When(is_urgent=True, status="pending", then=Value(0)),  # urgent pending first
+                When(status="pending", then=Value(1)),                  # normal pending next
+                When(status="approved", then=Value(2)),
+                When(status="rejected", then=Value(3)),
+                default=Value(9),
+                output_field=IntegerField(),
+            ),
+        )
     )
-    .order_by("is_urgent_rank", "-was_auto_escalated", "-applied_at")
-)
 
 
-    submitted_counts = {
-        "total": submitted_requests.count(),
-        "pending": submitted_requests.filter(status="pending").count(),
-        "approved": submitted_requests.filter(status="approved").count(),
-        "rejected": submitted_requests.filter(status="rejected").count(),
-    }
+def dashboard_counts(user, role):
+    """
+    ✅ one aggregate per side (no per-status .count() round trips).
+    Counts run on the plain filter, not on the annotated list queryset.
+    """
+    submitted_counts = (
+        PermissionRequest.objects
+        .filter(student=user)
+        .aggregate(
+            total=Count("id"),
+            pending=Count("id", filter=Q(status="pending")),
+            approved=Count("id", filter=Q(status="approved")),
+            rejected=Count("id", filter=Q(status="rejected")),
+        )
+    )
 
     received_counts = {"pending": 0, "approved": 0, "rejected": 0}
     if role != "student":
-        received_counts["approved"] = received_requests.filter(status="approved").count()
-        received_counts["rejected"] = received_requests.filter(status="rejected").count()
-        received_counts["pending"] = received_requests.filter(status="pending", current_level=role).count()
+        # ✅ materialized per (assignee, level) - see permissions/queue_stats.py
+        received_counts = queue_stats.received_counts(user, role)
 
-    context = {
+    return {**submitted_counts, "received_counts": received_counts}
+
+
+def _dashboard_data(user, profile):
+    # taken BEFORE the lists: anything that changes while we read them is
+    # picked up again by the first /permissions/changes/ poll
+    changes_cursor = latest_change_cursor(user)
+
+    role = (profile.role or "").strip().lower() if profile else ""
+
+    page_size = _page_size()
+
+    # students see their submitted list, authorities their inbox
+    submitted_requests, submitted_next = [], None
+    received_requests, received_next = [], None
+    if role == "student":
+        submitted_requests, submitted_next = keyset_page(
+            _submitted_queryset(user), SUBMITTED_KEYS, page_size=page_size
+        )
+    else:
+        received_requests, received_next = keyset_page(
+            _received_queryset(user), RECEIVED_KEYS, page_size=page_size
+        )
+
+    return {
         "profile": profile,
-        "roll_number": roll_number,
+        "changes_cursor": changes_cursor,
         "submitted_requests": submitted_requests,
+        "submitted_next": submitted_next,
         "received_requests": received_requests,
-        "total": submitted_counts["total"],
-        "pending": submitted_counts["pending"],
-        "approved": submitted_counts["approved"],
-        "rejected": submitted_counts["rejected"],
-        "received_counts": received_counts,
+        "received_next": received_next,
+        **dashboard_counts(user, role),
     }
+
+
+@login_required
+def dashboard(request):
+    user = request.user
+
+    # ✅ served from the cache until one of the user's requests / profile changes
+    gen, data = cached_dashboard(user.id, lambda: _dashboard_data(user, request.profile))
+    context = dict(data, changes_gen=gen)
+
+    profile = context["profile"]
+    role = (profile.role or "").strip().lower() if profile else ""
+
+    roll_number = user.first_name or user.username
+    if role == "student" and profile and getattr(profile, "roll_number", None):
+        roll_number = profile.roll_number
+
+    context["roll_number"] = roll_number
     return render(request, "dashboard/dashboard.html", context)
 
 
@@ -189,7 +268,8 @@ def _full_name_or_username(u):
 
 def _send_assigned_email(req):
     """
-    ✅ Sends email to the assigned authority when a NEW permission request is created/assigned.
+    ✅ Queues email to the assigned authority when a NEW permission request is created/assigned.
+    (delivered by `manage.py send_outbox`)
     """
     if not req.request_to:
         return
@@ -220,21 +300,16 @@ def _send_assigned_email(req):
         f"CampusIQ Team"
     )
 
-    # IMPORTANT: keep fail_silently=False while testing so you can see the real error in console
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[to_email],
-        fail_silently=False,
-    )
+    queue_email(subject, message, to_email)
 
 
 # -------------------- REQUEST PERMISSION (UPDATED) -------------------- #
 
 @login_required
 def request_permission(request):
-    profile = request.user.userprofile
+    profile = request.profile
+    if not profile:
+        return HttpResponseForbidden("Profile not found")
     my_role = (profile.role or "").strip().lower()
 
     if my_role == "student":
@@ -248,130 +323,183 @@ def request_permission(request):
     else:
         roles = []
 
-    users_by_role = {
-        role: list(
-            UserProfile.objects.filter(role=role, department=profile.department)
-            .select_related("user")
-            .values("user__id", "user__first_name", "user__last_name", "user__username")
-        )
-        for role in roles
-    }
-
     if request.method == "POST":
         selected_user_id = request.POST.get("request_to")
         if not selected_user_id:
             return redirect("request_permission")
 
-        selected_user = User.objects.get(id=selected_user_id)
-
-        target_profile = UserProfile.objects.filter(user=selected_user).first()
+        # ✅ from the in-memory directory (accounts/directory.py)
+        target_profile = directory.profile_of(selected_user_id)
         if not target_profile:
             return HttpResponseForbidden("Selected user has no profile")
+        selected_user = target_profile.user
 
         target_role = (target_profile.role or "").strip().lower()
 
-        max_id = PermissionRequest.objects.aggregate(Max("id"))["id__max"] or 0
-        next_id = max_id + 1
-        request_code = f"REQ-{next_id:06d}"
-
         is_urgent = request.POST.get("is_urgent") == "on"
-        urgent_minutes = request.POST.get("urgent_minutes")
-
-        if is_urgent:
-            try:
-                m = int(urgent_minutes or 0)
-            except:
-                m = getattr(settings, "URGENT_MIN_MINUTES", 10)
-
-            m = max(getattr(settings, "URGENT_MIN_MINUTES", 10),
-                    min(getattr(settings, "URGENT_MAX_MINUTES", 360), m))
-            escalate_at = timezone.now() + timedelta(minutes=m)
-        else:
-            escalate_at = timezone.now() + timedelta(hours=getattr(settings, "NORMAL_ESCALATION_HOURS", 24))
-
-        req = PermissionRequest.objects.create(
-            student=request.user,
-            request_to=selected_user,
-            request_code=request_code,
-            title=request.POST.get("title") or "",
-            reason=request.POST.get("reason") or "",
-            from_date=request.POST.get("from_date"),
-            to_date=request.POST.get("to_date"),
-            current_level=target_role,
-            file=request.FILES.get("permission_file"),
-            is_urgent=is_urgent,
-            escalate_at=escalate_at,
-        )
+        escalate_at = escalate_at_for(is_urgent, request.POST.get("urgent_minutes"))
+
+        with transaction.atomic():
+            req = PermissionRequest.objects.create(
+                student=request.user,
+                request_to=selected_user,
+                title=request.POST.get("title") or "",
+                reason=request.POST.get("reason") or "",
+                from_date=request.POST.get("from_date"),
+                to_date=request.POST.get("to_date"),
+                current_level=target_role,
+                file=request.FILES.get("permission_file"),
+                is_urgent=is_urgent,
+                escalate_at=escalate_at,
+                last_action_at=timezone.now(),
+            )
 
-        RequestHistory.objects.create(
-            request=req,
-            action="created",
-            from_role=my_role,
-            to_role=target_role,
-            actor=request.user,
-            note="Request created"
-        )
+            RequestHistory.objects.create(
+                request=req,
+                action="created",
+                from_role=my_role,
+                to_role=target_role,
+                actor=request.user,
+                note="Request created"
+            )
+
+            # ✅ NEW: email to assigned person (outbox row, same transaction)
+            _send_assigned_email(req)
+
+            queue_stats.record(None, queue_stats.snapshot(req))
 
-        # ✅ NEW: send email to assigned person
-        _send_assigned_email(req)
+            # ✅ letter text is extracted in the background (`manage.py extract_attachments`)
+            queue_extraction(req)
+
+            # ✅ push to the assignee's open dashboards
+            publish([selected_user.id], "assigned", request_payload(req))
 
         return redirect("dashboard")
 
     return render(request, "permissions/permission.html", {
-        "users_by_role": users_by_role,
+        "users_by_role": _users_by_role(profile.department, roles),
         "profile": profile,
         "today": timezone.localdate(),  # useful for date min in template
     })
 
 
+def _users_by_role(department, roles):
+    """role -> users of that role in the department (from the directory), for the role/user dropdowns."""
+    return {
+        role: [
+            {
+                "user__id": p.user.id,
+                "user__first_name": p.user.first_name,
+                "user__last_name": p.user.last_name,
+                "user__username": p.user.username,
+            }
+            for p in directory.profiles(department, role)
+        ]
+        for role in roles
+    }
+
+
+# -------------------- BULK REQUEST PERMISSION (CLASS) -------------------- #
+
+@login_required
+def bulk_request_permission(request):
+    """
+    Staff submit the same request for a whole class: a CSV of roll numbers
+    (or pasted ones) + shared title / reason / dates / authority.
+    See permissions/bulk_submit.py.
+    """
+    profile = request.profile
+    my_role = (profile.role or "").strip().lower() if profile else ""
+    if my_role not in bulk_submit.ROLE_FLOW:
+        return HttpResponseForbidden("Only staff can submit requests for a class")
+
+    context = {
+        "users_by_role": _users_by_role(profile.department, bulk_submit.ROLE_FLOW[my_role]),
+        "profile": profile,
+        "max_rows": bulk_submit.max_rows(),
+    }
+
+    if request.method == "POST":
+        upload = request.FILES.get("roll_csv")
+        try:
+            roll_numbers = bulk_submit.parse_roll_numbers(upload.read() if upload else request.POST.get("roll_numbers") or "")
+            reqs = bulk_submit.submit_bulk(
+                request.user,
+                roll_numbers,
+                target_user_id=request.POST.get("request_to"),
+                title=request.POST.get("title"),
+                reason=request.POST.get("reason"),
+                from_date=request.POST.get("from_date"),
+                to_date=request.POST.get("to_date"),
+                is_urgent=request.POST.get("is_urgent") == "on",
+                urgent_minutes=request.POST.get("urgent_minutes"),
+            )
+        except UnicodeDecodeError:
+            context.update(errors=["The roll number file must be a UTF-8 CSV"], form=request.POST)
+            return render(request, "permissions/bulk_permission.html", context, status=400)
+        except bulk_submit.BulkSubmitError as e:
+            context.update(errors=e.errors, form=request.POST)
+            return render(request, "permissions/bulk_permission.html", context, status=400)
+
+        messages.success(request, f"{len(reqs)} permission requests submitted.")
+        return redirect("dashboard")
+
+    return render(request, "permissions/bulk_permission.html", context)
+
+
 # -------------------- MY REQUESTS -------------------- #
 
 @login_required
 def my_requests(request):
-    user = request.user
-    requests = (
-        PermissionRequest.objects
-        .filter(student=user)
-        .select_related("request_to")
-        .order_by("-applied_at")
+    requests, next_cursor = keyset_page(
+        _submitted_queryset(request.user), SUBMITTED_KEYS, page_size=_page_size()
     )
-    return render(request, "dashboard/my_requests.html", {"requests": requests})
+    return render(request, "dashboard/my_requests.html", {
+        "requests": requests,
+        "next_cursor": next_cursor,
+    })
 
 
-# -------------------- FILE TEXT EXTRACT -------------------- #
+# list name -> (queryset builder, keys, row template)
+_MORE_LISTS = {
+    "received": (_received_queryset, RECEIVED_KEYS, "dashboard/_received_rows.html"),
+    "submitted": (_submitted_queryset, SUBMITTED_KEYS, "dashboard/_submitted_rows.html"),
+    "my_requests": (_submitted_queryset, SUBMITTED_KEYS, "dashboard/_my_request_rows.html"),
+}
 
-from PyPDF2 import PdfReader
-import docx
 
-def extract_text_from_file(uploaded_file):
+@login_required
+def load_more_requests(request):
     """
-    Returns extracted text from pdf/doc/docx.
-    If extraction fails, returns empty string.
+    ✅ "Load more" for dashboard / my-requests.
+    GET ?list=received|submitted|my_requests&cursor=<next_cursor>
+    -> {"ok": true, "html": "<tr>...</tr>", "count": n, "next_cursor": "..." | null}
     """
-    if not uploaded_file:
-        return ""
-
-    name = uploaded_file.name.lower()
+    spec = _MORE_LISTS.get(request.GET.get("list") or "")
+    if not spec:
+        return JsonResponse({"ok": False, "error": "Unknown list"}, status=400)
 
+    build_qs, keys, row_template = spec
     try:
-        if name.endswith(".pdf"):
-            reader = PdfReader(uploaded_file)
-            text = []
-            for page in reader.pages:
-                text.append(page.extract_text() or "")
-            return "\n".join(text).strip()
+        rows, next_cursor = keyset_page(
+            build_qs(request.user), keys,
+            cursor=request.GET.get("cursor") or None,
+            page_size=_page_size(),
+        )
+    except BadCursor as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
 
-        if name.endswith(".docx"):
-            d = docx.Document(uploaded_file)
-            return "\n".join([p.text for p in d.paragraphs]).strip()
+    profile = request.profile
+    html = render_to_string(row_template, {"rows": rows, "profile": profile}, request=request)
 
-        if name.endswith(".doc"):
-            return ""
+    return JsonResponse({
+        "ok": True,
+        "html": html,
+        "count": len(rows),
+        "next_cursor": next_cursor,
+    })
 
-    except Exception:
-        return ""
 
-    return ""
 def forgot_password(request):
     if request.method == "POST":
         username = request.POST.get("username")
@@ -393,12 +521,10 @@ def forgot_password(request):
             otp=otp
         )
 
-        send_mail(
-            subject="CampusIQ Password Reset OTP",
-            message=f"Your OTP is: {otp}\n\nValid for 5 minutes.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=False
+        queue_email(
+            "CampusIQ Password Reset OTP",
+            f"Your OTP is: {otp}\n\nValid for 5 minutes.",
+            user.email,
         )
 
         request.session["reset_user"] = user.id
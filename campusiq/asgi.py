@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'campusiq.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# needs the app registry -> imported after get_asgi_application()
+from permissions.sse import STREAM_PATH, inbox_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # the SSE stream is a long-lived async response, everything else is Django
+    if scope["type"] == "http" and scope["path"] == STREAM_PATH:
+        return await inbox_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +91,19 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared between the web workers and management commands (run_escalations bumps
+# dashboard generations), so not the per-process LocMemCache default.
+# Use memcached here when running on more than one host.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'campusiq_cache'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -145,6 +160,22 @@ NORMAL_ESCALATION_HOURS = 24
 URGENT_MIN_MINUTES = 5
 URGENT_MAX_MINUTES = 360   # 6 hours limit 
 URGENT_WARNING_MINUTES = 10
+DASHBOARD_PAGE_SIZE = 25   # rows per page / "load more" batch
+DASHBOARD_CACHE_SECONDS = 300   # per-user dashboard cache (invalidated on change)
+INBOX_EVENTS_BACKEND = "database"   # SSE push: "database" (cross-process), "local" (single process / tests) or "none" (no ASGI app)
+INBOX_EVENTS_POLL_SECONDS = 2
+INBOX_EVENTS_OVERLAP_SECONDS = 60   # re-read window for events of late-committing transactions
+INBOX_EVENTS_RETENTION_MINUTES = 10   # older InboxEvent rows are pruned (pump, send_outbox, run_escalations)
+CODE_BLOCK_SIZE = 20   # REQ-/CERTREQ-/CERT- codes reserved per process at a time
+EXTRACTION_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'campusiq_extract_cache')   # extracted text by file SHA-256
+EXTRACTION_CACHE_MAX_BYTES = 256 * 1024 * 1024   # LRU-evicted above this
+EXTRACTION_WORKERS = min(4, os.cpu_count() or 1)   # PDF page-parsing processes (0 = parse in the worker itself)
+EXTRACTION_PAGES_PER_TASK = 20   # pages per process-pool task
+EXTRACTION_PAGE_CAP = 200   # pages extracted per document, the rest is marked truncated
+EXTRACTION_TIME_BUDGET_SECONDS = 30   # per document; partial text after that
+SENDFILE_BACKEND = None   # protected uploads: "nginx" (X-Accel-Redirect), "xsendfile", or None = Django streams them
+SENDFILE_NGINX_PREFIX = "/protected-media/"   # nginx `internal` location aliased to MEDIA_ROOT
+BLOB_ORPHAN_MINUTES = 60   # blob files with no Blob row (rolled-back uploads) are swept by collect() after this
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
@@ -36,8 +36,12 @@ urlpatterns = [
       # Django auth URLs now at /auth/
 ]
 
+import re
+
 from django.conf import settings
-from django.conf.urls.static import static
+from django.urls import re_path
+from accounts.downloads import public_media
 
 if settings.DEBUG and settings.MEDIA_URL:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # uploads only through their download views (access checks), not as plain media
+    urlpatterns += [re_path(r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")), public_media)]
\ No newline at end of file
@@ -0,0 +1,26 @@
+# Generated by Django 3.0 on 2026-10-17 00:49
+
+import accounts.blobs
+import certificates.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_blob'),
+        ('certificates', '0002_certificateattachment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificateattachment',
+            name='original_filename',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='certificateattachment',
+            name='file',
+            field=models.FileField(storage=accounts.blobs.BlobStorage(), upload_to=certificates.models.cert_attachment_path),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0 on 2026-10-17 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0003_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issuedcertificate',
+            name='pdf_generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='issuedcertificate',
+            name='pdf_inputs',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='issuedcertificate',
+            name='pdf_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -3,6 +3,9 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 import os
 
+from accounts.blobs import blob_storage
+from accounts.codes import next_code
+
 CERT_TYPES = [
     ("study", "Study Certificate"),
     ("bonafide", "Bonafide Certificate"),
@@ -18,9 +21,11 @@ STATUS = [
 
 
 def cert_pdf_upload_path(instance, filename):
+    # private/: never served as plain media (the verify code is public),
+    # only through download_certificate_pdf
     ext = os.path.splitext(filename)[1] or ".pdf"
     code = instance.cert_code or "CERT-TMP"
-    return f"certificates/{code}/{code}{ext}"
+    return f"private/certificates/{code}/{code}{ext}"
 
 
 class Semester(models.Model):
@@ -64,11 +69,10 @@ class CertificateRequest(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
+        # code allocated before the INSERT (accounts/codes.py) -> single query
+        if self.pk is None and not self.request_code:
+            self.request_code = next_code("CERTREQ", CertificateRequest, "request_code")
         super().save(*args, **kwargs)
-        if is_new and not self.request_code:
-            self.request_code = f"CERTREQ-{self.pk:06d}"
-            super().save(update_fields=["request_code"])
 
     def __str__(self):
         return f"{self.request_code} - {self.cert_type} - {self.student.username}"
@@ -80,13 +84,16 @@ class IssuedCertificate(models.Model):
     approved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     approved_at = models.DateTimeField(null=True, blank=True)
     pdf_file = models.FileField(upload_to=cert_pdf_upload_path, null=True, blank=True)
+    # rendered once, see certificates/views.py ensure_certificate_pdf()
+    pdf_sha256 = models.CharField(max_length=64, blank=True, default="")     # ETag
+    pdf_inputs = models.CharField(max_length=64, blank=True, default="")     # approver / signature / stamp it was drawn with
+    pdf_generated_at = models.DateTimeField(null=True, blank=True)           # Last-Modified
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
+        # code allocated before the INSERT, so upload_to already sees it
+        if self.pk is None and not self.cert_code:
+            self.cert_code = next_code("CERT", IssuedCertificate, "cert_code")
         super().save(*args, **kwargs)
-        if is_new and not self.cert_code:
-            self.cert_code = f"CERT-{self.pk:06d}"
-            super().save(update_fields=["cert_code"])
     
 
     def __str__(self):
@@ -94,9 +101,8 @@ class IssuedCertificate(models.Model):
     
 
 def cert_attachment_path(instance, filename):
-    ext = os.path.splitext(filename)[1]
-    code = instance.request.request_code or "CERT-TMP"
-    return f"certificates/{code}/attachments/{code}-{instance.id or 'tmp'}{ext}"
+    # stored by content (accounts/blobs.py), this only gives the extension
+    return filename
 
 class CertificateAttachment(models.Model):
     request = models.ForeignKey(
@@ -104,7 +110,8 @@ class CertificateAttachment(models.Model):
         on_delete=models.CASCADE,
         related_name="attachments"
     )
-    file = models.FileField(upload_to=cert_attachment_path)
+    file = models.FileField(upload_to=cert_attachment_path, storage=blob_storage)
+    original_filename = models.CharField(max_length=255, blank=True, default="")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
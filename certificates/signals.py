@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+
+from accounts import blobs
+from .models import CertificateAttachment
+
+
+# ---------------- UPLOAD REFERENCES (accounts/blobs.py) ---------------- #
+
+@receiver(pre_save, sender=CertificateAttachment)
+def remember_original_filename(sender, instance, **kwargs):
+    blobs.remember_original_name(instance, "file")
+
+
+@receiver(post_delete, sender=CertificateAttachment)
+def release_file(sender, instance, **kwargs):
+    blobs.release(blobs.file_name_of(instance.__dict__.get("file")))
@@ -1,3 +1,169 @@
-from django.test import TestCase
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from accounts import directory
+from accounts.models import UserProfile
+from accounts.tests import profile_lookups
+from . import views
+from .models import CertificateAttachment, CertificateRequest, IssuedCertificate
+
+
+class ProfileLookupTests(TestCase):
+    """Role checks and templates share one profile lookup (request.profile)."""
+
+    def setUp(self):
+        self.student = User.objects.create_user(username="stu", password="x")
+        self.dean = User.objects.create_user(username="dean", password="x")
+        self.principal = User.objects.create_user(username="principal", password="x")
+        UserProfile.objects.create(user=self.student, role="student", department="CSE")
+        UserProfile.objects.create(user=self.dean, role="dean", department="CSE")
+        UserProfile.objects.create(user=self.principal, role="principal", department="CSE")
+        self.req = CertificateRequest.objects.create(
+            cert_type="study", student=self.student, request_to=self.dean,
+        )
+        directory.targets()  # built here, not counted against the views
+
+    def test_views_look_the_profile_up_once(self):
+        self.client.force_login(self.dean)
+        for method, path, status in (
+            ("get", "/certificates/received/", 200),
+            ("get", f"/certificates/review/{self.req.id}/", 200),
+            ("post", f"/certificates/forward/{self.req.id}/", 302),
+        ):
+            response, lookups = profile_lookups(self.client, method, path)
+            self.assertEqual(response.status_code, status, path)
+            self.assertEqual(lookups, 1, path)
+
+        self.client.force_login(self.student)
+        response, lookups = profile_lookups(self.client, "get", "/certificates/apply/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lookups, 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AttachmentDownloadTests(TestCase):
+    def test_only_student_and_reviewer(self):
+        student = User.objects.create_user(username="stu", password="x")
+        dean = User.objects.create_user(username="dean", password="x")
+        other = User.objects.create_user(username="other", password="x")
+        req = CertificateRequest.objects.create(cert_type="study", student=student, request_to=dean)
+        attachment = CertificateAttachment.objects.create(
+            request=req, file=SimpleUploadedFile("marks.pdf", b"%PDF marks")
+        )
+        url = f"/certificates/attachment/{attachment.id}/"
+
+        for user in (student, dean):
+            self.client.force_login(user)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF marks")
+            self.assertEqual(response["Content-Disposition"], 'inline; filename="marks.pdf"')
+
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+def _png(color):
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new("RGB", (40, 20), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CertificatePdfCacheTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user(username="stu", password="x")
+        self.dean = User.objects.create_user(username="dean", password="x")
+        UserProfile.objects.create(user=self.student, role="student", department="CSE")
+        self.dean_profile = UserProfile.objects.create(user=self.dean, role="dean", department="CSE")
+        self.dean_profile.signature.save("sig.png", ContentFile(_png("black")))
+        self.req = CertificateRequest.objects.create(cert_type="study", student=self.student, request_to=self.dean)
+        self.url = f"/certificates/download/{self.req.id}/"
+
+    def _download(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_rendered_at_approval_and_served_from_disk(self):
+        self.client.force_login(self.dean)
+        self.client.post(f"/certificates/approve/{self.req.id}/")
+
+        issued = IssuedCertificate.objects.get(request=self.req)
+        self.assertEqual(issued.pdf_file.name, f"private/certificates/{issued.cert_code}/{issued.cert_code}.pdf")
+        with issued.pdf_file.open("rb") as f:
+            stored = f.read()
+        self.assertTrue(stored.startswith(b"%PDF"))
+        self.assertEqual(issued.pdf_sha256, hashlib.sha256(stored).hexdigest())
+
+        self.client.force_login(self.student)
+        with patch("certificates.views._render_certificate_pdf") as render:
+            response, body = self._download()
+            render.assert_not_called()
+        self.assertEqual(body, stored)
+        self.assertEqual(response["ETag"], f'"{issued.pdf_sha256}"')
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="{issued.cert_code}.pdf"')
+
+        response, _ = self._download(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response, _ = self._download(HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_signature_renders_again(self):
+        self.req.status = "approved"
+        self.req.save()
+        IssuedCertificate.objects.create(request=self.req, approved_by=self.dean)
+
+        self.client.force_login(self.student)
+        with patch("certificates.views._render_certificate_pdf", wraps=views._render_certificate_pdf) as render:
+            first, first_body = self._download()
+            self._download()
+            self.assertEqual(render.call_count, 1)   # first download renders it, once
+
+            self.dean_profile.signature.save("sig2.png", ContentFile(_png("blue")))
+            second, second_body = self._download()
+            self.assertEqual(render.call_count, 2)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertNotEqual(first["ETag"], second["ETag"])
+        self.assertNotEqual(first_body, second_body)
+        # replaced in place, no "_abc123" copies next to it
+        issued = IssuedCertificate.objects.get(request=self.req)
+        storage = issued.pdf_file.storage
+        self.assertEqual(storage.listdir(os.path.dirname(issued.pdf_file.name))[1], [f"{issued.cert_code}.pdf"])
+
+    def test_pdf_under_the_old_public_path_is_moved(self):
+        self.client.force_login(self.dean)
+        self.client.post(f"/certificates/approve/{self.req.id}/")
+        issued = IssuedCertificate.objects.get(request=self.req)
+        storage = issued.pdf_file.storage
+        old = storage.save(f"certificates/{issued.cert_code}/{issued.cert_code}.pdf", ContentFile(b"%PDF old"))
+        storage.delete(issued.pdf_file.name)
+        IssuedCertificate.objects.filter(pk=issued.pk).update(pdf_file=old)
+
+        self.client.force_login(self.student)
+        response, body = self._download()
+        issued.refresh_from_db()
+        self.assertTrue(issued.pdf_file.name.startswith("private/"))
+        self.assertFalse(storage.exists(old))
+        self.assertNotEqual(body, b"%PDF old")
+
+    def test_render_failure_at_approval_is_logged(self):
+        self.client.force_login(self.dean)
+        with patch("certificates.views._render_certificate_pdf", side_effect=OSError("disk full")), \
+                self.assertLogs("certificates.views", "ERROR") as logs:
+            self.client.post(f"/certificates/approve/{self.req.id}/")
+
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.status, "approved")
+        self.assertIn("disk full", logs.output[0])
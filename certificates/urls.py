@@ -18,5 +18,6 @@ urlpatterns = [
     path("download/<int:id>/", views.download_certificate_pdf, name="download_certificate_pdf"),
     path("qr/<str:code>/", views.certificate_qr, name="certificate_qr"),
     path("review/<int:id>/", views.review_certificate_request, name="review_certificate_request"),
+    path("attachment/<int:pk>/", views.download_attachment, name="download_certificate_attachment"),
 
 ]
@@ -1,11 +1,15 @@
 from io import BytesIO
+import hashlib
+import logging
 import os
 import qrcode
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.http import HttpResponse, HttpResponseForbidden
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 
@@ -13,9 +17,14 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 
+from accounts import directory
+from accounts.downloads import serve_file
 from accounts.models import UserProfile
+from permissions.email_utils import queue_email
 from .models import CertificateRequest, IssuedCertificate, StudentMark, CertificateAttachment
 
+logger = logging.getLogger(__name__)
+
 
 # ---------------- HELPERS ---------------- #
 
@@ -24,36 +33,31 @@ def _full_name(u):
     return s if s else u.username
 
 
-def _get_profile(user):
-    return UserProfile.objects.filter(user=user).first()
-
-
-def _role(user):
-    p = _get_profile(user)
+def _role(request):
+    p = request.profile
     return (p.role or "").strip().lower() if p else ""
 
 
-def _is_dean(user):
-    return _role(user) == "dean"
+def _is_dean(request):
+    return _role(request) == "dean"
 
 
-def _can_review(user):
-    return _role(user) in ("dean", "principal")
+def _can_review(request):
+    return _role(request) in ("dean", "principal")
 
 
 def _dean_for_department(dept):
-    p = UserProfile.objects.filter(role__iexact="dean", department=dept).select_related("user").first()
-    return p.user if p else None
+    return directory.first_user(dept, "dean")
 
 
 def _principal_for_department(dept):
-    p = UserProfile.objects.filter(role__iexact="principal", department=dept).select_related("user").first()
-    return p.user if p else None
+    return directory.first_user(dept, "principal")
 
 
 def _send_mail(to_email, subject, body):
+    # outbox row -> delivered by `manage.py send_outbox`
     if to_email:
-        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to_email], fail_silently=True)
+        queue_email(subject, body, to_email)
 
 
 def _email_text_request(req, event, extra=""):
@@ -122,7 +126,7 @@ def _build_certificate_context(req, issued):
 
 @login_required
 def apply_certificate(request):
-    profile = _get_profile(request.user)
+    profile = request.profile
     dept = profile.department if profile else ""
     dean_user = _dean_for_department(dept)
 
@@ -148,37 +152,38 @@ def apply_certificate(request):
                 "dean": dean_user,
             })
 
-        req = CertificateRequest.objects.create(
-            cert_type=cert_type,
-            student=request.user,
-            request_to=dean_user,
-            purpose=purpose,
-            status="pending",
-        )
+        with transaction.atomic():
+            req = CertificateRequest.objects.create(
+                cert_type=cert_type,
+                student=request.user,
+                request_to=dean_user,
+                purpose=purpose,
+                status="pending",
+            )
 
-        # supporting files
-        for f in request.FILES.getlist("supporting_files"):
-            CertificateAttachment.objects.create(request=req, file=f)
+            # supporting files
+            for f in request.FILES.getlist("supporting_files"):
+                CertificateAttachment.objects.create(request=req, file=f)
 
-        # emails
-        _send_mail(
-            request.user.email,
-            f"Certificate request submitted ({req.request_code})",
-            _email_text_request(req, "REQUEST SUBMITTED")
-        )
+            # emails
+            _send_mail(
+                request.user.email,
+                f"Certificate request submitted ({req.request_code})",
+                _email_text_request(req, "REQUEST SUBMITTED")
+            )
 
-        _send_mail(
-            dean_user.email,
-            f"New certificate request assigned ({req.request_code})",
-            (
-                f"Hello {_full_name(dean_user)},\n\n"
-                f"A new certificate request has been assigned to you.\n"
-                f"Request ID: {req.request_code}\n"
-                f"Student: {_full_name(req.student)} ({req.student.username})\n"
-                f"Certificate: {req.get_cert_type_display()}\n\n"
-                f"Regards,\nCampusIQ"
+            _send_mail(
+                dean_user.email,
+                f"New certificate request assigned ({req.request_code})",
+                (
+                    f"Hello {_full_name(dean_user)},\n\n"
+                    f"A new certificate request has been assigned to you.\n"
+                    f"Request ID: {req.request_code}\n"
+                    f"Student: {_full_name(req.student)} ({req.student.username})\n"
+                    f"Certificate: {req.get_cert_type_display()}\n\n"
+                    f"Regards,\nCampusIQ"
+                )
             )
-        )
 
         return redirect("my_certificates")
 
@@ -198,19 +203,19 @@ def my_certificates(request):
 
 @login_required
 def received_certificate_requests(request):
-    if not _can_review(request.user):
+    if not _can_review(request):
         return HttpResponseForbidden("Only Dean/Principal can access")
 
     qs = CertificateRequest.objects.filter(request_to=request.user).select_related("student").order_by("-created_at")
     return render(request, "certificates/authority_inbox.html", {
         "requests": qs,
-        "profile": _get_profile(request.user),
+        "profile": request.profile,
     })
 
 
 @login_required
 def review_certificate_request(request, id):
-    if not _can_review(request.user):
+    if not _can_review(request):
         return HttpResponseForbidden("Only Dean/Principal can review")
 
     req = get_object_or_404(CertificateRequest, id=id)
@@ -227,10 +232,24 @@ def review_certificate_request(request, id):
     })
 
 
+@login_required
+def download_attachment(request, pk):
+    """✅ A supporting file, for the student and the assigned reviewer (one query)."""
+    attachment = (
+        CertificateAttachment.objects
+        .filter(Q(request__student=request.user) | Q(request__request_to=request.user), pk=pk)
+        .only("id", "file", "original_filename")
+        .first()
+    )
+    if attachment is None:
+        raise Http404("Not found")
+    return serve_file(request, attachment.file, attachment.original_filename)
+
+
 
 @login_required
 def forward_certificate_to_principal(request, id):
-    if not _is_dean(request.user):
+    if not _is_dean(request):
         return HttpResponseForbidden("Only Dean can forward to Principal")
 
     req = get_object_or_404(CertificateRequest, id=id)
@@ -240,41 +259,42 @@ def forward_certificate_to_principal(request, id):
     if req.status != "pending":
         return redirect("received_certificate_requests")
 
-    dean_profile = _get_profile(request.user)
+    dean_profile = request.profile
     dept = dean_profile.department if dean_profile else ""
     principal_user = _principal_for_department(dept)
 
     if not principal_user:
         return HttpResponse("Principal not found for your department", status=404)
 
-    req.request_to = principal_user
-    req.save(update_fields=["request_to", "updated_at"])
+    with transaction.atomic():
+        req.request_to = principal_user
+        req.save(update_fields=["request_to", "updated_at"])
 
-    _send_mail(
-        req.student.email,
-        f"Certificate request forwarded ({req.request_code})",
-        _email_text_request(req, "FORWARDED", extra="Forwarded to Principal for final approval.")
-    )
+        _send_mail(
+            req.student.email,
+            f"Certificate request forwarded ({req.request_code})",
+            _email_text_request(req, "FORWARDED", extra="Forwarded to Principal for final approval.")
+        )
 
-    _send_mail(
-        principal_user.email,
-        f"Certificate request assigned ({req.request_code})",
-        (
-            f"Hello {_full_name(principal_user)},\n\n"
-            f"A certificate request was forwarded to you for approval.\n"
-            f"Request ID: {req.request_code}\n"
-            f"Student: {_full_name(req.student)} ({req.student.username})\n"
-            f"Certificate: {req.get_cert_type_display()}\n\n"
-            f"Regards,\nCampusIQ"
+        _send_mail(
+            principal_user.email,
+            f"Certificate request assigned ({req.request_code})",
+            (
+                f"Hello {_full_name(principal_user)},\n\n"
+                f"A certificate request was forwarded to you for approval.\n"
+                f"Request ID: {req.request_code}\n"
+                f"Student: {_full_name(req.student)} ({req.student.username})\n"
+                f"Certificate: {req.get_cert_type_display()}\n\n"
+                f"Regards,\nCampusIQ"
+            )
         )
-    )
 
     return redirect("received_certificate_requests")
 
 
 @login_required
 def approve_certificate_request(request, id):
-    if not _can_review(request.user):
+    if not _can_review(request):
         return HttpResponseForbidden("Only Dean/Principal can approve")
 
     req = get_object_or_404(CertificateRequest, id=id)
@@ -284,26 +304,33 @@ def approve_certificate_request(request, id):
     if req.status != "pending":
         return redirect("received_certificate_requests")
 
-    req.status = "approved"
-    req.save(update_fields=["status", "updated_at"])
+    with transaction.atomic():
+        req.status = "approved"
+        req.save(update_fields=["status", "updated_at"])
 
-    issued, _ = IssuedCertificate.objects.get_or_create(request=req)
-    issued.approved_by = request.user
-    issued.approved_at = timezone.now()
-    issued.save()
+        issued, _ = IssuedCertificate.objects.get_or_create(request=req)
+        issued.approved_by = request.user
+        issued.approved_at = timezone.now()
+        issued.save()
 
-    _send_mail(
-        req.student.email,
-        f"Certificate Approved ({req.request_code})",
-        _email_text_request(req, "APPROVED", extra=f"Certificate Code: {issued.cert_code}")
-    )
+        _send_mail(
+            req.student.email,
+            f"Certificate Approved ({req.request_code})",
+            _email_text_request(req, "APPROVED", extra=f"Certificate Code: {issued.cert_code}")
+        )
+
+    try:
+        ensure_certificate_pdf(issued, _verify_url(request, issued))
+    except Exception:
+        # the approval stands - the first download renders it instead
+        logger.exception("Could not render the PDF of %s at approval", issued.cert_code)
 
     return redirect("received_certificate_requests")
 
 
 @login_required
 def reject_certificate_request(request, id):
-    if not _can_review(request.user):
+    if not _can_review(request):
         return HttpResponseForbidden("Only Dean/Principal can reject")
 
     req = get_object_or_404(CertificateRequest, id=id)
@@ -313,14 +340,15 @@ def reject_certificate_request(request, id):
     if req.status != "pending":
         return redirect("received_certificate_requests")
 
-    req.status = "rejected"
-    req.save(update_fields=["status", "updated_at"])
+    with transaction.atomic():
+        req.status = "rejected"
+        req.save(update_fields=["status", "updated_at"])
 
-    _send_mail(
-        req.student.email,
-        f"Certificate Rejected ({req.request_code})",
-        _email_text_request(req, "REJECTED")
-    )
+        _send_mail(
+            req.student.email,
+            f"Certificate Rejected ({req.request_code})",
+            _email_text_request(req, "REJECTED")
+        )
 
     return redirect("received_certificate_requests")
 
@@ -331,7 +359,7 @@ def reject_certificate_request(request, id):
 def view_certificate(request, id):
     req = get_object_or_404(CertificateRequest, id=id)
 
-    role = _role(request.user)
+    role = _role(request)
     if req.student_id != request.user.id and req.request_to_id != request.user.id and role not in ("dean", "principal"):
         return HttpResponseForbidden("Not allowed")
 
@@ -356,22 +384,41 @@ def certificate_qr(request, code):
     return HttpResponse(buf.getvalue(), content_type="image/png")
 
 
-@login_required
-def download_certificate_pdf(request, id):
-    req = get_object_or_404(CertificateRequest, id=id)
+# ---------------- CERTIFICATE PDF (cached in IssuedCertificate.pdf_file) ---------------- #
 
-    role = _role(request.user)
-    if req.student_id != request.user.id and req.request_to_id != request.user.id and role not in ("dean", "principal"):
-        return HttpResponseForbidden("Not allowed")
+# part of pdf_inputs - bump when the layout below changes
+PDF_LAYOUT_VERSION = 1
 
-    issued = IssuedCertificate.objects.filter(request=req).select_related("approved_by").first()
-    if not issued or req.status != "approved":
-        return HttpResponse("Certificate not approved yet", status=400)
 
-    approver_profile = None
-    if issued.approved_by:
-        approver_profile = UserProfile.objects.filter(user=issued.approved_by).first()
+def _approver_profile(issued):
+    if not issued.approved_by_id:
+        return None
+    return UserProfile.objects.filter(user_id=issued.approved_by_id).only("id", "user_id", "signature", "stamp").first()
+
 
+def _image_fingerprint(image):
+    if not image or not image.name:
+        return ""
+    try:
+        st = os.stat(os.path.join(settings.MEDIA_ROOT, image.name))
+    except OSError:
+        return f"{image.name}:missing"
+    # a file replaced under the same name still changes size / mtime
+    return f"{image.name}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def certificate_pdf_inputs(issued, approver_profile):
+    """Hash of everything that can change a rendered certificate after approval."""
+    parts = [
+        f"v{PDF_LAYOUT_VERSION}",
+        str(issued.approved_by_id or ""),
+        _image_fingerprint(approver_profile.signature if approver_profile else None),
+        _image_fingerprint(approver_profile.stamp if approver_profile else None),
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def _render_certificate_pdf(req, issued, approver_profile, verify_url):
     buffer = BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
@@ -424,7 +471,6 @@ def download_certificate_pdf(request, id):
 
     # QR
     try:
-        verify_url = request.build_absolute_uri(f"/certificates/verify/{issued.cert_code}/")
         img = qrcode.make(verify_url)
         qr_buf = BytesIO()
         img.save(qr_buf, format="PNG")
@@ -437,8 +483,80 @@ def download_certificate_pdf(request, id):
 
     pdf.showPage()
     pdf.save()
+    return buffer.getvalue()
+
+
+def _pdf_name(issued):
+    return issued.pdf_file.field.generate_filename(issued, f"{issued.cert_code}.pdf")
+
+
+def _pdf_is_current(issued, inputs):
+    # a file stored under an older cert_pdf_upload_path is rendered (and moved) again
+    return bool(
+        issued.pdf_file and issued.pdf_file.name == _pdf_name(issued)
+        and issued.pdf_inputs == inputs
+        and issued.pdf_file.storage.exists(issued.pdf_file.name)
+    )
 
-    buffer.seek(0)
-    response = HttpResponse(buffer.getvalue(), content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="{issued.cert_code}.pdf"'
-    return response
+
+def ensure_certificate_pdf(issued, verify_url):
+    """
+    The certificate's PDF in issued.pdf_file, rendered only if there is none
+    yet or the approver / their signature / stamp changed since. Returns the
+    (re-read) IssuedCertificate.
+    """
+    approver_profile = _approver_profile(issued)
+    inputs = certificate_pdf_inputs(issued, approver_profile)
+    if _pdf_is_current(issued, inputs):
+        return issued
+
+    with transaction.atomic():
+        # one renderer per certificate; the others use its file
+        issued = (
+            IssuedCertificate.objects.select_for_update(of=("self",))
+            .select_related("request__student", "approved_by")
+            .get(pk=issued.pk)
+        )
+        if _pdf_is_current(issued, inputs):
+            return issued
+
+        data = _render_certificate_pdf(issued.request, issued, approver_profile, verify_url)
+
+        # cert codes are unique: anything under this name is an older render -
+        # replace it rather than get a "_abc123" copy next to it
+        name = _pdf_name(issued)
+        if issued.pdf_file.name and issued.pdf_file.name != name:
+            issued.pdf_file.delete(save=False)
+        issued.pdf_file.storage.delete(name)
+        issued.pdf_file.save(name, ContentFile(data), save=False)
+        issued.pdf_sha256 = hashlib.sha256(data).hexdigest()
+        issued.pdf_inputs = inputs
+        issued.pdf_generated_at = timezone.now()
+        issued.save(update_fields=["pdf_file", "pdf_sha256", "pdf_inputs", "pdf_generated_at"])
+    return issued
+
+
+def _verify_url(request, issued):
+    return request.build_absolute_uri(f"/certificates/verify/{issued.cert_code}/")
+
+
+@login_required
+def download_certificate_pdf(request, id):
+    req = get_object_or_404(CertificateRequest, id=id)
+
+    role = _role(request)
+    if req.student_id != request.user.id and req.request_to_id != request.user.id and role not in ("dean", "principal"):
+        return HttpResponseForbidden("Not allowed")
+
+    issued = IssuedCertificate.objects.filter(request=req).select_related("approved_by").first()
+    if not issued or req.status != "approved":
+        return HttpResponse("Certificate not approved yet", status=400)
+
+    # ✅ rendered at approval (or here, once) - served from disk after that
+    issued = ensure_certificate_pdf(issued, _verify_url(request, issued))
+    return serve_file(
+        request, issued.pdf_file, f"{issued.cert_code}.pdf",
+        etag=f'"{issued.pdf_sha256}"',
+        last_modified=issued.pdf_generated_at,
+        as_attachment=True,
+    )
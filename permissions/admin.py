@@ -1,7 +1,30 @@
 from django.contrib import admin
-from .models import PermissionRequest
+from .models import PermissionRequest, OutboxEmail, AssigneeQueueStats, AttachmentText
 
 @admin.register(PermissionRequest)
 class PermissionRequestAdmin(admin.ModelAdmin):
     list_display = ('student', 'from_date', 'to_date', 'status', 'current_level')
     list_filter = ('status',)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+
+
+@admin.register(AssigneeQueueStats)
+class AssigneeQueueStatsAdmin(admin.ModelAdmin):
+    # maintained by the app, fixed by `manage.py rebuild_queue_stats`
+    list_display = ('user', 'level', 'pending', 'urgent_pending', 'approved', 'rejected', 'oldest_pending_at')
+    list_filter = ('level',)
+    readonly_fields = ('user', 'level', 'pending', 'approved', 'rejected', 'urgent_pending', 'oldest_pending_at')
+
+
+@admin.register(AttachmentText)
+class AttachmentTextAdmin(admin.ModelAdmin):
+    # written by `manage.py extract_attachments`
+    list_display = ('request', 'file_name', 'status', 'page_count', 'truncated', 'attempts', 'finished_at')
+    list_filter = ('status', 'truncated')
+    readonly_fields = ('request', 'file_name', 'status', 'text', 'page_count', 'error', 'truncated',
+                       'attempts', 'started_at', 'finished_at', 'created_at')
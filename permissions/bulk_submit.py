@@ -0,0 +1,228 @@
+"""
+Class-wide submission: the same permission (title / reason / dates /
+authority) for every student of a CSV of roll numbers.
+
+Everything is validated first - the directory plus one student query - and
+nothing is written unless all of it is valid. The requests (codes from one
+allocator reservation), their "created" history rows and ONE digest mail
+for the authority are then written with bulk operations in one transaction.
+
+Used by accounts.views.bulk_request_permission and
+`manage.py bulk_submit_requests`.
+"""
+import csv
+import io
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts import directory
+from accounts.codes import next_codes
+from accounts.dashboard_cache import bump
+from accounts.models import UserProfile
+from .email_utils import queue_email
+from .escalations import escalate_at_for
+from .events import publish_many, request_payload
+from .models import PermissionRequest, RequestHistory
+from . import queue_stats, search
+
+
+# who may a class be sent to, by the submitter's role (students can't submit for a class)
+ROLE_FLOW = {
+    "proctor": ["hod", "dean", "principal"],
+    "staff": ["hod", "dean", "principal"],
+    "hod": ["dean", "principal"],
+    "dean": ["principal"],
+    "principal": [],
+}
+
+HEADER_NAMES = {"roll_number", "roll number", "roll_no", "roll no", "rollno"}
+
+BATCH_SIZE = 500
+
+
+class BulkSubmitError(ValueError):
+    """Nothing was created; `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+
+def max_rows():
+    return getattr(settings, "BULK_SUBMIT_MAX_ROWS", 1000)
+
+
+def _norm(value):
+    return (value or "").strip().lower()
+
+
+def _full_name_or_username(u):
+    full = (f"{u.first_name} {u.last_name}").strip()
+    return full if full else (u.username or "User")
+
+
+def parse_roll_numbers(data):
+    """CSV text / bytes -> roll numbers of the first column (header optional), duplicates dropped."""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+
+    rolls = []
+    seen = set()
+    for row in csv.reader(io.StringIO(data)):
+        value = (row[0] if row else "").strip()
+        if not value or value.lower() in HEADER_NAMES or value in seen:
+            continue
+        seen.add(value)
+        rolls.append(value)
+    return rolls
+
+
+def _parse_date(value, label, errors):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat((value or "").strip())
+    except ValueError:
+        errors.append(f"{label} must be a date (YYYY-MM-DD)")
+        return None
+
+
+def _validate(actor, roll_numbers, target_user_id, title, reason, from_date, to_date):
+    errors = []
+
+    actor_profile = directory.profile_of(actor.id)
+    if not actor_profile:
+        raise BulkSubmitError(["Only staff can submit requests for a class"])
+    dept = actor_profile.department
+
+    target_profile = directory.profile_of(target_user_id, department=dept)
+    if not target_profile or _norm(target_profile.role) not in ROLE_FLOW.get(_norm(actor_profile.role), []):
+        errors.append("Selected authority is not in your department or not allowed for your role")
+
+    if not title:
+        errors.append("Title is required")
+    if not reason:
+        errors.append("Reason is required")
+
+    from_date = _parse_date(from_date, "From date", errors)
+    to_date = _parse_date(to_date, "To date", errors)
+    if from_date and to_date and from_date > to_date:
+        errors.append("From date is after to date")
+
+    students = {}
+    if not roll_numbers:
+        errors.append("No roll numbers given")
+    elif len(roll_numbers) > max_rows():
+        errors.append(f"At most {max_rows()} students per submission (got {len(roll_numbers)})")
+    else:
+        # ✅ one query for the whole class
+        qs = (
+            UserProfile.objects
+            .filter(roll_number__in=roll_numbers, role="student", department=dept)
+            .select_related("user")
+        )
+        students = {p.roll_number: p.user for p in qs}
+        unknown = [r for r in roll_numbers if r not in students]
+        if unknown:
+            shown = ", ".join(unknown[:20]) + (" ..." if len(unknown) > 20 else "")
+            errors.append(f"{len(unknown)} roll number(s) are not students of {dept}: {shown}")
+
+    if errors:
+        raise BulkSubmitError(errors)
+    return actor_profile, target_profile, students, from_date, to_date
+
+
+def _assignee_digest(target_user, reqs, actor):
+    to_email = (target_user.email or "").strip()
+    if not to_email:
+        return
+
+    first = reqs[0]
+    lines = [
+        f"Hello {_full_name_or_username(target_user)},",
+        "",
+        f"{_full_name_or_username(actor)} submitted the same permission request for {len(reqs)} student(s).",
+        "",
+        f"Title      : {first.title}",
+        f"Date Range : {first.from_date} to {first.to_date}",
+        f"Urgent     : {'YES' if first.is_urgent else 'NO'}",
+        "",
+    ]
+    lines += [f"- {req.request_code} | {req.student.username} | {_full_name_or_username(req.student)}" for req in reqs]
+    lines += ["", "Please login to CampusIQ and review them from your dashboard.", "", "Regards,", "CampusIQ Team"]
+
+    queue_email(f"{len(reqs)} New Permission Requests Assigned", "\n".join(lines), to_email)
+
+
+def submit_bulk(actor, roll_numbers, *, target_user_id, title, reason, from_date, to_date,
+                is_urgent=False, urgent_minutes=None):
+    """
+    Creates one pending request per roll number, assigned to target_user_id.
+    Returns the requests in roll number order; raises BulkSubmitError.
+    """
+    title = (title or "").strip()
+    reason = (reason or "").strip()
+    actor_profile, target_profile, students, from_date, to_date = _validate(
+        actor, roll_numbers, target_user_id, title, reason, from_date, to_date
+    )
+
+    target_user = target_profile.user
+    target_role = _norm(target_profile.role)
+    actor_role = _norm(actor_profile.role)
+    now = timezone.now()
+    escalate_at = escalate_at_for(is_urgent, urgent_minutes, now=now)
+
+    with transaction.atomic():
+        codes = next_codes("REQ", PermissionRequest, "request_code", len(roll_numbers))
+        reqs = [
+            PermissionRequest(
+                request_code=code,
+                student=students[roll],
+                request_to=target_user,
+                title=title,
+                reason=reason,
+                from_date=from_date,
+                to_date=to_date,
+                current_level=target_role,
+                is_urgent=is_urgent,
+                escalate_at=escalate_at,
+                last_action_at=now,
+            )
+            for roll, code in zip(roll_numbers, codes)
+        ]
+        PermissionRequest.objects.bulk_create(reqs, batch_size=BATCH_SIZE)
+
+        if reqs[0].pk is None:
+            # only PostgreSQL hands the new ids back from a bulk INSERT
+            ids = dict(
+                PermissionRequest.objects
+                .filter(request_code__in=codes)
+                .values_list("request_code", "id")
+            )
+            for req in reqs:
+                req.pk = ids[req.request_code]
+
+        RequestHistory.objects.bulk_create([
+            RequestHistory(
+                request=req,
+                action="created",
+                from_role=actor_role,
+                to_role=target_role,
+                actor=actor,
+                note="Request created (class submission)"
+            )
+            for req in reqs
+        ], batch_size=BATCH_SIZE)
+
+        queue_stats.record_many((None, queue_stats.snapshot(req)) for req in reqs)
+        _assignee_digest(target_user, reqs, actor)
+        publish_many((target_user.id, "assigned", request_payload(req)) for req in reqs)
+
+        # bulk_create sends no post_save -> invalidate the dashboards / index here
+        bump(target_user.id, *{req.student_id for req in reqs})
+        search.index_requests(req.pk for req in reqs)
+
+    return reqs
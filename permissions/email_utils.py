@@ -1,5 +1,6 @@
 from django.conf import settings
-from django.core.mail import send_mail
+
+from .models import OutboxEmail
 
 
 def _full_name_or_username(user):
@@ -7,14 +8,49 @@ def _full_name_or_username(user):
     return full if full else user.username
 
 
+def _outbox_row(subject, message, to_email):
+    return OutboxEmail(
+        subject=(subject or "")[:255],
+        message=message or "",
+        from_email=settings.DEFAULT_FROM_EMAIL or "",
+        to_email=to_email,
+    )
+
+
+def queue_email(subject, message, to_email):
+    """
+    Puts one mail in the outbox instead of talking to SMTP in the request.
+    Call it inside the same transaction.atomic() block as the state change,
+    so the mail only goes out if the change is committed.
+    `manage.py send_outbox` does the actual delivery.
+    """
+    to_email = (to_email or "").strip()
+    if not to_email:
+        return None
+
+    row = _outbox_row(subject, message, to_email)
+    row.save()
+    return row
+
+
+def queue_emails(items):
+    """
+    Bulk version of queue_email().
+    items -> iterable of (subject, message, to_email)
+    """
+    rows = []
+    for subject, message, to_email in items:
+        to_email = (to_email or "").strip()
+        if to_email:
+            rows.append(_outbox_row(subject, message, to_email))
+
+    if rows:
+        OutboxEmail.objects.bulk_create(rows)
+    return len(rows)
+
+
 def send_request_email(subject, message, to_email):
     if not to_email:
         return
 
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[to_email],
-        fail_silently=True,
-    )
+    queue_email(subject, message, to_email)
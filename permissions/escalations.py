@@ -0,0 +1,492 @@
+"""
+Escalation passes shared by `manage.py run_escalations` (one-shot / cron)
+and `run_escalations --daemon` (deadline heap).
+"""
+import heapq
+import time
+
+from django.utils import timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField, Q, Value
+from django.db.models.functions import Mod
+from datetime import timedelta
+
+from accounts import directory
+from accounts.dashboard_cache import bump
+from accounts.models import UserProfile
+from .models import PermissionRequest, RequestHistory
+from .email_utils import queue_emails
+from .events import publish_many, request_payload
+from . import queue_stats
+
+
+ROLE_FLOW = {
+    "student": ["proctor", "staff", "hod", "dean", "principal"],
+    "proctor": ["hod", "dean", "principal"],
+    "staff": ["hod", "dean", "principal"],
+    "hod": ["dean", "principal"],
+    "dean": ["principal"],
+    "principal": [],
+}
+
+CHUNK_SIZE = 500
+
+
+def _full_name_or_username(user):
+    full = (user.get_full_name() or "").strip()
+    return full if full else user.username
+
+
+# ---------------- EMAIL TEXT ---------------- #
+
+def _warning_email(req, now):
+    local_escalate = timezone.localtime(req.escalate_at)
+    mins_left = int((req.escalate_at - now).total_seconds() // 60)
+
+    return (
+        f"[{req.request_code}] URGENT: Auto-escalation in {mins_left} minutes",
+        (
+            f"Hello {_full_name_or_username(req.request_to)},\n\n"
+            f"This is a reminder that an URGENT permission request assigned to you will be auto-escalated soon.\n\n"
+            f"Request ID: {req.request_code}\n"
+            f"Title: {req.title}\n"
+            f"Requested by: {_full_name_or_username(req.student)} ({req.student.username})\n"
+            f"From: {req.from_date}  To: {req.to_date}\n"
+            f"Auto-escalation time: {local_escalate.strftime('%Y-%m-%d %H:%M')}\n\n"
+            f"Please take action before escalation.\n\n"
+            f"Regards,\nCampusIQ"
+        ),
+        req.request_to.email,
+    )
+
+
+def _escalated_student_email(req, old_role, next_role):
+    return (
+        f"[{req.request_code}] Request auto-escalated",
+        (
+            f"Hi {_full_name_or_username(req.student)},\n\n"
+            f"Your permission request has been auto-escalated.\n\n"
+            f"Request ID: {req.request_code}\n"
+            f"Title: {req.title}\n"
+            f"Moved from: {old_role.upper()} to {next_role.upper()}\n"
+        ),
+        req.student.email,
+    )
+
+
+def _escalated_assignee_email(req, target_user, next_role):
+    return (
+        f"[{req.request_code}] New permission request assigned to you",
+        (
+            f"Hello {_full_name_or_username(target_user)},\n\n"
+            f"A permission request has been assigned to you.\n\n"
+            f"Request ID: {req.request_code}\n"
+            f"Title: {req.title}\n"
+            f"Requested by: {_full_name_or_username(req.student)} ({req.student.username})\n"
+            f"Current Level: {next_role.upper()}\n"
+        ),
+        target_user.email,
+    )
+
+
+# ---------------- SET-BASED PASSES ---------------- #
+
+def student_departments(student_ids):
+    """{student_id: department} in one query."""
+    return dict(
+        UserProfile.objects
+        .filter(user_id__in=set(student_ids))
+        .values_list("user_id", "department")
+    )
+
+
+def load_targets():
+    """
+    {department: {role: User}} for the whole pass, from the directory index.
+    First profile by pk wins (same as the old .first() lookup).
+    """
+    return directory.targets()
+
+
+def partition(qs, department=None, shard=None):
+    """
+    Restricts a PermissionRequest queryset to one worker's slice.
+      department -> student's department (subquery, no join, so row locks stay on permissionrequest)
+      shard      -> (n, m): id % m == n
+    """
+    if department:
+        qs = qs.filter(student_id__in=UserProfile.objects.filter(department=department).values("user_id"))
+    if shard:
+        n, m = shard
+        qs = qs.annotate(shard_no=Mod("id", Value(m, output_field=IntegerField()))).filter(shard_no=n)
+    return qs
+
+
+def for_each_claimed(qs, chunk_size, apply):
+    """
+    Claims matching rows chunk by chunk with SELECT ... FOR UPDATE SKIP LOCKED
+    and calls apply(rows) inside the same transaction.
+    Rows another worker holds are skipped; once it commits they no longer
+    match `qs`, so every row is handled by exactly one worker.
+    Only ids are locked (no joins) - related rows are loaded afterwards.
+    """
+    done = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                qs.filter(id__gt=last_id)
+                .order_by("id")
+                .select_for_update(skip_locked=True)
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not ids:
+                return done
+            last_id = ids[-1]
+
+            rows = list(
+                PermissionRequest.objects
+                .filter(id__in=ids)
+                .select_related("student", "request_to")
+                .order_by("id")
+            )
+            done += apply(rows)
+
+        if len(ids) < chunk_size:
+            return done
+
+
+def apply_warnings(rows, now):
+    """Marks warning_sent_at + history + outbox rows. Caller holds the transaction."""
+    rows = [r for r in rows if r.request_to and r.request_to.email]
+    if not rows:
+        return 0
+
+    history = []
+    emails = []
+    events = []
+    for req in rows:
+        level = (req.current_level or "").strip().lower()
+        emails.append(_warning_email(req, now))
+        events.append((req.request_to_id, "urgent_warning", request_payload(
+            req, escalate_at=req.escalate_at.isoformat() if req.escalate_at else None,
+        )))
+        req.warning_sent_at = now
+        req.updated_at = now
+        history.append(RequestHistory(
+            request=req,
+            action="urgent_warning",
+            from_role=level,
+            to_role=level,
+            actor=None,
+            note="10-minute urgent escalation warning email sent",
+        ))
+
+    PermissionRequest.objects.bulk_update(rows, ["warning_sent_at", "updated_at"])
+    RequestHistory.objects.bulk_create(history)
+    queue_emails(emails)
+    publish_many(events)
+    return len(rows)
+
+
+def apply_escalations(rows, now, targets):
+    """Moves each due request one level up ROLE_FLOW. Caller holds the transaction."""
+    student_dept = student_departments(r.student_id for r in rows)
+
+    moves = []
+    for req in rows:
+        current_role = (req.current_level or "").strip().lower()
+
+        # find next role
+        next_roles = ROLE_FLOW.get(current_role, [])
+        if not next_roles:
+            continue  # no escalation possible
+
+        next_role = next_roles[0]
+        target_user = targets.get(student_dept.get(req.student_id), {}).get(next_role)
+        if not target_user:
+            continue
+
+        moves.append((req, current_role, next_role, target_user))
+
+    if not moves:
+        return 0
+
+    history = []
+    emails = []
+    events = []
+    touched_users = set()
+    stat_changes = []
+    for req, old_role, next_role, target_user in moves:
+        # bulk_update sends no post_save -> invalidate the dashboards here
+        touched_users.update((req.student_id, req.request_to_id, target_user.id))
+        old_user_id = req.request_to_id
+        before = queue_stats.snapshot(req)
+
+        req.request_to = target_user
+        req.current_level = next_role
+        req.escalate_at = None  # clear after escalation
+        req.was_auto_escalated = True
+        req.escalation_count += 1
+        req.last_action_at = now
+        req.updated_at = now
+        stat_changes.append((before, queue_stats.snapshot(req)))
+
+        history.append(RequestHistory(
+            request=req,
+            action="auto_escalated",
+            from_role=old_role,
+            to_role=next_role,
+            actor=None,
+            from_user_id=old_user_id,
+            note=f"Auto escalated from {old_role} to {next_role}",
+        ))
+        emails.append(_escalated_student_email(req, old_role, next_role))
+        emails.append(_escalated_assignee_email(req, target_user, next_role))
+
+        payload = request_payload(req, from_user_id=old_user_id, to_user_id=target_user.id)
+        events += [(target_user.id, "auto_escalated", payload), (old_user_id, "auto_escalated", payload)]
+
+    PermissionRequest.objects.bulk_update(
+        [m[0] for m in moves],
+        [
+            "request_to", "current_level", "escalate_at",
+            "was_auto_escalated", "escalation_count", "last_action_at", "updated_at",
+        ],
+    )
+    queue_stats.record_many(stat_changes)
+    RequestHistory.objects.bulk_create(history)
+    queue_emails(emails)
+    publish_many(events)
+    bump(*touched_users)
+    return len(moves)
+
+
+# defaults of the settings, the same as campusiq/settings.py
+NORMAL_ESCALATION_HOURS = 24
+URGENT_MIN_MINUTES = 5
+URGENT_MAX_MINUTES = 360
+URGENT_WARNING_MINUTES = 10
+
+
+def warning_minutes():
+    return getattr(settings, "URGENT_WARNING_MINUTES", URGENT_WARNING_MINUTES)
+
+
+def escalate_at_for(is_urgent, urgent_minutes=None, now=None):
+    """escalate_at of a new request: urgent -> chosen minutes (clamped), else NORMAL_ESCALATION_HOURS."""
+    now = now or timezone.now()
+    if not is_urgent:
+        return now + timedelta(hours=getattr(settings, "NORMAL_ESCALATION_HOURS", NORMAL_ESCALATION_HOURS))
+
+    low = getattr(settings, "URGENT_MIN_MINUTES", URGENT_MIN_MINUTES)
+    high = getattr(settings, "URGENT_MAX_MINUTES", URGENT_MAX_MINUTES)
+    try:
+        m = int(urgent_minutes or 0)
+    except (TypeError, ValueError):
+        m = low
+
+    m = max(low, min(high, m))
+    return now + timedelta(minutes=m)
+
+
+def warn_queryset(now):
+    """Urgent requests whose escalation is inside the warning window (preq_warn_idx)."""
+    return PermissionRequest.objects.filter(
+        status="pending",
+        is_urgent=True,
+        warning_sent_at__isnull=True,         # not warned before
+        escalate_at__isnull=False,
+        escalate_at__gt=now,                  # still not escalated
+        escalate_at__lte=now + timedelta(minutes=warning_minutes()),
+    )
+
+
+def due_queryset(now):
+    """Pending requests past escalate_at (preq_due_idx)."""
+    return PermissionRequest.objects.filter(
+        status="pending",
+        escalate_at__isnull=False,
+        escalate_at__lte=now,
+    )
+
+
+def run_pass(now=None, chunk_size=CHUNK_SIZE, ids=None, department=None, shard=None):
+    """
+    One full warning + escalation pass.
+    ids             -> restrict to these request ids (daemon); None -> everything due.
+    department/shard -> this worker's partition (see partition()).
+    Safe to run from several processes at once (see for_each_claimed()).
+    Returns (warned, escalated, timings_ms).
+    """
+    now = now or timezone.now()
+    timings = {}
+    t = time.perf_counter()
+
+    def lap(name, started):
+        timings[name] = (time.perf_counter() - started) * 1000
+        return time.perf_counter()
+
+    warn_qs = warn_queryset(now)
+    due_qs = due_queryset(now)
+    if ids is not None:
+        warn_qs = warn_qs.filter(id__in=ids)
+        due_qs = due_qs.filter(id__in=ids)
+    warn_qs = partition(warn_qs, department, shard)
+    due_qs = partition(due_qs, department, shard)
+
+    # -------------------------------
+    # 1) ✅ WARNING MAIL (urgent only, sent ONLY ONCE)
+    # -------------------------------
+    warned = for_each_claimed(warn_qs, chunk_size, lambda rows: apply_warnings(rows, now))
+    t = lap("warn", t)
+
+    # -------------------------------
+    # 2) DIRECTORY department -> role -> user (once per pass)
+    # -------------------------------
+    targets = load_targets()
+    t = lap("directory", t)
+
+    # -------------------------------
+    # 3) ✅ AUTO ESCALATION
+    # -------------------------------
+    escalated = for_each_claimed(due_qs, chunk_size, lambda rows: apply_escalations(rows, now, targets))
+    lap("escalate", t)
+
+    return warned, escalated, timings
+
+
+# ---------------- DAEMON (deadline heap) ---------------- #
+
+class DeadlineScheduler:
+    """
+    In-memory min-heap of (deadline, request_id) for every pending request
+    with an escalate_at. Each request contributes its escalate_at and, for
+    urgent ones not warned yet, escalate_at - URGENT_WARNING_MINUTES.
+
+    The heap is only a hint: due ids are handed to run_pass(ids=...), which
+    re-checks them against the DB, so stale entries are harmless.
+    New / changed rows are picked up with an (updated_at, id) cursor.
+    Due ids that run_pass() left as they were (no escalation target yet, row
+    locked by another worker) come back after a doubling backoff, see retry().
+    """
+
+    def __init__(self, overlap_seconds=5, department=None, shard=None,
+                 retry_seconds=60, max_retry_seconds=3600):
+        self.department = department
+        self.shard = shard
+        self.heap = []
+        self.state = {}          # id -> (escalate_at, warning_sent_at) last seen
+        self.retries = {}        # id -> failed attempts since it last changed
+        self.cursor = None       # (updated_at, id)
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+
+    def __len__(self):
+        return len(self.state)
+
+    def _fields(self):
+        return ("id", "status", "is_urgent", "escalate_at", "warning_sent_at", "updated_at")
+
+    def _track(self, row):
+        rid = row["id"]
+        escalate_at = row["escalate_at"]
+
+        if row["status"] != "pending" or escalate_at is None:
+            self.state.pop(rid, None)
+            self.retries.pop(rid, None)
+            return
+
+        key = (escalate_at, row["warning_sent_at"])
+        if self.state.get(rid) == key:
+            return
+        self.state[rid] = key
+        self.retries.pop(rid, None)
+
+        heapq.heappush(self.heap, (escalate_at, rid))
+        if row["is_urgent"] and row["warning_sent_at"] is None:
+            heapq.heappush(self.heap, (escalate_at - timedelta(minutes=warning_minutes()), rid))
+
+    def _advance(self, row):
+        c = (row["updated_at"], row["id"])
+        if self.cursor is None or c > self.cursor:
+            self.cursor = c
+
+    def load(self):
+        """Full (re)load: every pending request with a deadline."""
+        self.heap = []
+        self.state = {}
+        self.retries = {}
+        self.cursor = None
+
+        qs = PermissionRequest.objects.filter(
+            status="pending",
+            escalate_at__isnull=False,
+        )
+        qs = partition(qs, self.department, self.shard).values(*self._fields())
+        for row in qs.iterator():
+            self._track(row)
+            self._advance(row)
+
+        if self.cursor is None:
+            self.cursor = (timezone.now(), 0)
+        return len(self.state)
+
+    def refresh(self):
+        """
+        Incremental: rows touched since the cursor.
+        The cursor is rewound by `overlap` so rows committed slightly out of
+        order are not missed; re-seen rows are ignored by _track().
+        """
+        since, last_id = self.cursor
+        since = since - self.overlap
+
+        qs = PermissionRequest.objects.filter(
+            Q(updated_at__gt=since) | Q(updated_at=since, id__gt=last_id)
+        )
+        qs = partition(qs, self.department, self.shard).order_by("updated_at", "id").values(*self._fields())
+        seen = 0
+        for row in qs.iterator():
+            self._track(row)
+            self._advance(row)
+            seen += 1
+        return seen
+
+    def next_deadline(self):
+        while self.heap:
+            deadline, rid = self.heap[0]
+            if rid in self.state:
+                return deadline
+            heapq.heappop(self.heap)   # request left the queue
+        return None
+
+    def pop_due(self, now):
+        due = set()
+        while self.heap and self.heap[0][0] <= now:
+            _, rid = heapq.heappop(self.heap)
+            if rid in self.state:
+                due.add(rid)
+        return due
+
+    def keys(self, ids):
+        """Last seen (escalate_at, warning_sent_at) of each id - pass to retry() after run_pass()."""
+        return {rid: self.state.get(rid) for rid in ids}
+
+    def retry(self, keys, now):
+        """
+        Pushes back every id whose row did not change since `keys` were taken
+        (call after refresh()), due again after retry_seconds * 2^attempts.
+        Returns how many.
+        """
+        retried = 0
+        for rid, key in keys.items():
+            if key is None or self.state.get(rid) != key:
+                continue   # escalated / warned / gone
+            attempts = self.retries.get(rid, 0)
+            self.retries[rid] = attempts + 1
+            delay = min(self.retry_seconds * 2 ** attempts, self.max_retry_seconds)
+            heapq.heappush(self.heap, (now + timedelta(seconds=delay), rid))
+            retried += 1
+        return retried
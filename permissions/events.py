@@ -0,0 +1,182 @@
+"""
+In-process pub/sub for the inbox push channel (SSE, see permissions/sse.py).
+
+publish() is called by the lifecycle views and run_escalations. Delivery
+depends on settings.INBOX_EVENTS_BACKEND:
+
+  "database" (default) -> rows in InboxEvent, written in the caller's
+                          transaction. Every ASGI process runs one pump that
+                          reads new rows and fans them out to its own
+                          connections, so cron / other workers reach them too.
+  "local"              -> handed straight to this process's hub. Only
+                          useful when everything runs in one process (tests).
+  "none"               -> dropped. For deployments without the ASGI app,
+                          where nobody would ever read the rows.
+
+InboxEvent rows older than INBOX_EVENTS_RETENTION_MINUTES are removed by
+prune_events(): from the pump, and from send_outbox / run_escalations so the
+table stays small when no stream is open.
+"""
+import asyncio
+import json
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+# ---------------- PAYLOAD ---------------- #
+
+def request_payload(req, **extra):
+    return {
+        "id": req.id,
+        "request_code": req.request_code or "",
+        "title": req.title or "",
+        "current_level": req.current_level or "",
+        "is_urgent": bool(req.is_urgent),
+        **extra,
+    }
+
+
+# ---------------- HUB (this process's open streams) ---------------- #
+
+class EventHub:
+    """user_id -> set of asyncio.Queue, one queue per open stream."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue()
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add((loop, queue))
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subs = self._subscribers.get(user_id, set())
+            subs.difference_update({s for s in subs if s[1] is queue})
+            if not subs:
+                self._subscribers.pop(user_id, None)
+
+    def user_ids(self):
+        with self._lock:
+            return set(self._subscribers)
+
+    def deliver(self, user_id, event, payload):
+        """Thread-safe: may be called from sync code outside the event loop."""
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subs:
+            loop.call_soon_threadsafe(queue.put_nowait, (event, payload))
+        return len(subs)
+
+
+hub = EventHub()
+
+
+def backend_name():
+    return getattr(settings, "INBOX_EVENTS_BACKEND", "database")
+
+
+def event_overlap():
+    # longer than the longest transaction that publishes: its rows carry the
+    # time they were written, not the (later) time they became visible
+    return timedelta(seconds=getattr(settings, "INBOX_EVENTS_OVERLAP_SECONDS", 60))
+
+
+def retention():
+    minutes = getattr(settings, "INBOX_EVENTS_RETENTION_MINUTES", 10)
+    return max(timedelta(minutes=minutes), 2 * event_overlap())
+
+
+def prune_events(now=None):
+    """Removes InboxEvent rows past retention(). Returns how many."""
+    from .models import InboxEvent
+
+    now = now or timezone.now()
+    deleted, _ = InboxEvent.objects.filter(created_at__lt=now - retention()).delete()
+    return deleted
+
+
+# ---------------- PUBLISH ---------------- #
+
+def publish_many(items):
+    """items: iterable of (user_id, event, payload). Returns how many were published."""
+    items = [(u, e, p) for u, e, p in items if u]
+    if not items:
+        return 0
+
+    backend = backend_name()
+    if backend == "none":
+        return 0
+
+    if backend == "local":
+        for user_id, event, payload in items:
+            hub.deliver(user_id, event, payload)
+        return len(items)
+
+    from .models import InboxEvent
+
+    InboxEvent.objects.bulk_create([
+        InboxEvent(user_id=user_id, event=event, payload=json.dumps(payload))
+        for user_id, event, payload in items
+    ])
+    return len(items)
+
+
+def publish(user_ids, event, payload):
+    return publish_many((u, event, payload) for u in set(user_ids))
+
+
+# ---------------- DATABASE PUMP ---------------- #
+
+class DatabasePump:
+    """
+    Reads InboxEvent rows created since the last read and hands them to the
+    hub. Rows of a transaction that commits late show up with an older
+    created_at (or a lower id) than ones already read, so every poll re-reads
+    the last event_overlap() and skips the ids it has delivered. Sync; the
+    SSE module runs it in a worker thread.
+    """
+
+    def __init__(self, overlap_seconds=None):
+        self.overlap = event_overlap() if overlap_seconds is None else timedelta(seconds=overlap_seconds)
+        self.since = timezone.now()
+        self.seen = {}  # event id -> created_at, for the overlap window
+        self.next_prune = timezone.now()
+
+    def poll(self):
+        from .models import InboxEvent
+
+        now = timezone.now()
+        start = self.since - self.overlap
+        users = hub.user_ids()
+
+        rows = []
+        if users:
+            rows = list(
+                InboxEvent.objects
+                .filter(created_at__gte=start, user_id__in=users)
+                .order_by("created_at", "id")
+                .values_list("id", "user_id", "event", "payload", "created_at")
+            )
+
+        delivered = 0
+        for event_id, user_id, event, payload, created_at in rows:
+            if event_id in self.seen:
+                continue
+            self.seen[event_id] = created_at
+            delivered += hub.deliver(user_id, event, json.loads(payload or "{}"))
+
+        self.since = now
+        self.seen = {k: v for k, v in self.seen.items() if v >= start}
+
+        if now >= self.next_prune:
+            prune_events(now)
+            self.next_prune = now + timedelta(minutes=1)
+
+        return delivered
@@ -0,0 +1,334 @@
+"""
+Text of uploaded letters (PDF / DOCX), extracted once in the background.
+
+request_permission calls queue_extraction() in the same transaction as the
+upload; `manage.py extract_attachments` claims pending AttachmentText rows
+(skip_locked, several workers can run) and parses the files outside of any
+transaction. view_request only reads the stored result.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import search
+from .extraction_cache import file_sha256, get_cache
+from .models import AttachmentText, PermissionRequest
+from .pdf_pages import count_pages, parse_pages
+
+
+def _stale_after():
+    # a "processing" row older than this belonged to a worker that died
+    return timedelta(seconds=getattr(settings, "EXTRACTION_STALE_SECONDS", 600))
+
+
+def _max_attempts():
+    return getattr(settings, "EXTRACTION_MAX_ATTEMPTS", 3)
+
+
+# ---------------- PARSING ---------------- #
+
+# part of the cache key - bump when the parsers' output changes
+EXTRACTOR_VERSION = 2
+
+PARSED_TYPES = (".pdf", ".docx")
+
+Extracted = namedtuple("Extracted", "text page_count error truncated")
+
+SCANNED_PDF = "This PDF looks like scanned/image-based, so text can't be extracted (OCR needed)."
+
+# extra wait for ranges that stop at their deadline on their own
+_DEADLINE_GRACE_SECONDS = 1.0
+
+
+def _page_cap():
+    return getattr(settings, "EXTRACTION_PAGE_CAP", 200)
+
+
+def _time_budget():
+    return getattr(settings, "EXTRACTION_TIME_BUDGET_SECONDS", 30)
+
+
+def _pages_per_task():
+    return max(1, getattr(settings, "EXTRACTION_PAGES_PER_TASK", 20))
+
+
+def _workers():
+    return getattr(settings, "EXTRACTION_WORKERS", min(4, os.cpu_count() or 1))
+
+
+def _pdf_result(texts, total, complete, error=None):
+    """
+    truncated: not every page is in the text - past EXTRACTION_PAGE_CAP
+    (error stays None) or cut short by the time budget / a crash (error set).
+    """
+    text = "\n\n".join([t for t in texts if t]).strip()
+    truncated = not complete or (total or 0) > len(texts)
+    if not complete and not error:
+        error = f"Time budget ran out after {len(texts)} of {total} pages."
+    elif not text and not error:
+        error = SCANNED_PDF
+    return Extracted(text, total, error, truncated)
+
+
+def _parse_docx(f):
+    try:
+        import docx
+        doc = docx.Document(f)
+        text = "\n".join([p.text for p in doc.paragraphs]).strip()
+        return Extracted(text, None, None if text else "DOCX has no readable text.", False)
+    except Exception as e:
+        return Extracted("", None, f"Could not read DOCX: {e}", False)
+
+
+def parse_pdf_serial(f):
+    """In-process PDF parse (page cap + time budget checked between pages)."""
+    try:
+        from PyPDF2 import PdfReader
+        reader = PdfReader(f)
+        total = len(reader.pages)
+        deadline = time.time() + _time_budget()
+        texts = []
+        for page in reader.pages[:_page_cap()]:
+            if time.time() > deadline:
+                return _pdf_result(texts, total, complete=False)
+            texts.append((page.extract_text() or "").strip())
+        return _pdf_result(texts, total, complete=True)
+    except Exception as e:
+        return Extracted("", None, f"Could not read PDF: {e}", False)
+
+
+# ---------------- PROCESS POOL ---------------- #
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the workers don't inherit this process' DB connections / threads
+            _pool = multiprocessing.get_context("spawn").Pool(processes=_workers())
+        return _pool
+
+
+def _kill_pool():
+    """
+    A running page can't be cancelled, so a document over its budget takes
+    the workers down with it; the next document starts a fresh pool.
+    terminate() returns once every worker has exited.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.terminate()
+
+
+def parse_pdf_pooled(path):
+    """
+    PDF parse in the process pool: the first EXTRACTION_PAGE_CAP pages, split
+    into ranges of EXTRACTION_PAGES_PER_TASK pages parsed in parallel, all
+    within EXTRACTION_TIME_BUDGET_SECONDS. Returns whatever was parsed in
+    time, with truncated=True if that isn't the whole document. A worker
+    that crashes loses its range, which then runs out the budget like a
+    slow one.
+    """
+    budget = _time_budget()
+    deadline = time.time() + budget
+    pool = _get_pool()
+
+    try:
+        total = pool.apply_async(count_pages, (path,)).get(timeout=budget)
+    except multiprocessing.TimeoutError:
+        _kill_pool()
+        return Extracted("", None, "PDF took too long to open (time budget exceeded).", True)
+    except Exception as e:
+        return Extracted("", None, f"Could not read PDF: {e}", False)
+
+    pages = min(total, _page_cap())
+    step = _pages_per_task()
+    ranges = [
+        pool.apply_async(parse_pages, (path, start, min(start + step, pages), deadline))
+        for start in range(0, pages, step)
+    ]
+    for result in ranges:
+        result.wait(max(0.0, deadline - time.time()) + _DEADLINE_GRACE_SECONDS)
+    done = [result.ready() for result in ranges]
+    if not all(done):
+        _kill_pool()
+
+    # ranges in page order, up to the first one that didn't finish
+    texts = []
+    complete = all(done)
+    error = None
+    for result, ready in zip(ranges, done):
+        if not ready:
+            break
+        try:
+            _, range_texts, finished = result.get()
+        except Exception as e:
+            complete = False
+            error = f"Could not read PDF: {e}"
+            break
+        texts.extend(range_texts)
+        if not finished:
+            complete = False
+            break
+
+    return _pdf_result(texts, total, complete, error)
+
+
+def _parse_pdf(file_field, f):
+    if _workers() > 0:
+        try:
+            path = file_field.path
+        except NotImplementedError:
+            path = None     # not on local disk -> in-process
+        if path:
+            return parse_pdf_pooled(path)
+    return parse_pdf_serial(f)
+
+
+def extract_text(file_field):
+    """
+    Returns Extracted(text, page_count, error, truncated) for a stored upload.
+    page_count is None when the format has no pages (DOCX).
+    Identical files (same SHA-256) are parsed once, see extraction_cache.py.
+    """
+    if not file_field or not file_field.name:
+        return Extracted("", None, "No file uploaded.", False)
+
+    ext = os.path.splitext(file_field.name)[1].lower()
+
+    if ext == ".doc":
+        return Extracted("", None, "Old .DOC format can't be extracted directly. Upload .DOCX or PDF text file.", False)
+    if ext not in PARSED_TYPES:
+        return Extracted("", None, f"Unsupported file type: {ext}", False)
+
+    cache = get_cache()
+    try:
+        with file_field.storage.open(file_field.name, "rb") as f:
+            key = f"{file_sha256(f)}-v{EXTRACTOR_VERSION}-p{_page_cap()}{ext}"
+            hit = cache.get(key)
+            if hit is not None:
+                return Extracted(*hit)
+
+            f.seek(0)
+            result = _parse_docx(f) if ext == ".docx" else _parse_pdf(file_field, f)
+    except OSError as e:
+        return Extracted("", None, f"Could not open file: {e}", False)
+
+    # a page-cap cut is the same every time, a time-budget cut / crash is not
+    if not (result.truncated and result.error):
+        try:
+            cache.put(key, list(result))
+        except OSError:
+            pass   # a full / read-only cache dir must not fail the extraction
+    return result
+
+
+# ---------------- QUEUE ---------------- #
+
+def queue_extraction(req):
+    """(Re)queue the request's current upload. Call inside the upload's transaction."""
+    if not req.file or not req.file.name:
+        AttachmentText.objects.filter(request=req).delete()
+        return None
+
+    row, _ = AttachmentText.objects.update_or_create(
+        request=req,
+        defaults={
+            "file_name": req.file.name,
+            "status": "pending",
+            "text": "",
+            "page_count": None,
+            "error": "",
+            "truncated": False,
+            "attempts": 0,
+            "started_at": None,
+            "finished_at": None,
+        },
+    )
+    return row
+
+
+def claim(batch_size):
+    """Marks up to batch_size queued rows as "processing" for this worker and returns them."""
+    now = timezone.now()
+
+    # claimed max_attempts times and never finished: the file kills / hangs
+    # the worker every time - stop retrying, view_request shows the error
+    AttachmentText.objects.filter(
+        status="processing", started_at__lt=now - _stale_after(), attempts__gte=_max_attempts(),
+    ).update(
+        status="failed",
+        error="Text extraction did not finish (gave up after repeated attempts).",
+        finished_at=now,
+    )
+
+    with transaction.atomic():
+        rows = list(
+            AttachmentText.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status="pending")
+                | Q(status="processing", started_at__lt=now - _stale_after(), attempts__lt=_max_attempts())
+            )
+            .order_by("id")[:batch_size]
+        )
+        if rows:
+            AttachmentText.objects.filter(id__in=[r.id for r in rows]).update(
+                status="processing", started_at=now, attempts=F("attempts") + 1,
+            )
+    # the files, without locking the requests (no join in the FOR UPDATE)
+    reqs = PermissionRequest.objects.only("id", "file").in_bulk([r.request_id for r in rows])
+    claimed = []
+    for row in rows:
+        if row.request_id in reqs:   # else deleted meanwhile (and this row with it)
+            row.started_at = now
+            row.request = reqs[row.request_id]
+            claimed.append(row)
+    return claimed
+
+
+def process(row):
+    """Parses the file of one claimed row and stores the result. Returns the new status."""
+    req = row.request
+    if not req.file or req.file.name != row.file_name:
+        # the upload changed / went away after it was queued
+        text, page_count, error, truncated = ("", None, "File was replaced or removed.", False)
+    else:
+        text, page_count, error, truncated = extract_text(req.file)
+
+    status = "failed" if error and not text else "done"
+    # only if nobody re-queued / re-claimed the row in the meantime
+    updated = AttachmentText.objects.filter(id=row.id, status="processing", started_at=row.started_at).update(
+        status=status,
+        text=text,
+        page_count=page_count,
+        error=error or "",
+        truncated=truncated,
+        finished_at=timezone.now(),
+    )
+    if updated and status == "done":
+        search.index_requests([row.request_id])
+    return status
+
+
+def run_batch(batch_size):
+    """claim() + process() -> {"done": n, "failed": n, "claimed": n}."""
+    counts = {"done": 0, "failed": 0}
+    rows = claim(batch_size)
+    for row in rows:
+        counts[process(row)] += 1
+    counts["claimed"] = len(rows)
+    return counts
@@ -0,0 +1,107 @@
+"""
+Disk cache of extraction results, keyed by the SHA-256 of the file's bytes
+(+ extractor version + extension), so the same circular / letter uploaded
+again under any name or request is parsed once.
+
+One small JSON file per entry under EXTRACTION_CACHE_DIR/<2 hex>/. A hit
+touches the entry's mtime; when a write takes the directory over
+EXTRACTION_CACHE_MAX_BYTES the least recently used entries are removed
+(down to 90%). Writes only happen on a miss, right after a parse that costs
+far more than the directory scan, and several workers can share the
+directory (atomic renames, vanished files are fine).
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(f):
+    """SHA-256 hex digest of an open binary file, read in chunks."""
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+class DiskLRUCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)   # most recently used
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        self.evict()
+
+    def _entries(self):
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield st.st_mtime, st.st_size, entry.path
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Drops least recently used entries until the cache is under 90% of max_bytes."""
+        entries = list(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return 0
+
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+def get_cache():
+    return DiskLRUCache(
+        getattr(settings, "EXTRACTION_CACHE_DIR",
+                os.path.join(tempfile.gettempdir(), "campusiq_extract_cache")),
+        getattr(settings, "EXTRACTION_CACHE_MAX_BYTES", 256 * 1024 * 1024),
+    )
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from accounts.dashboard_cache import bump
+from permissions.models import PermissionRequest, RequestHistory
+
+
+# history actions that move a request one level up
+ESCALATION_ACTIONS = ("auto_escalated", "forwarded")
+
+
+class Command(BaseCommand):
+    help = "Fill was_auto_escalated / escalation_count / last_action_at on PermissionRequest from RequestHistory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options["chunk_size"])
+
+        last_id = 0
+        changed = 0
+        while True:
+            rows = list(
+                PermissionRequest.objects
+                .filter(id__gt=last_id)
+                .order_by("id")
+                .only(
+                    "id", "student_id", "request_to_id", "applied_at",
+                    "was_auto_escalated", "escalation_count", "last_action_at",
+                )
+                [:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            stats = {
+                s["request_id"]: s
+                for s in (
+                    RequestHistory.objects
+                    .filter(request_id__in=[r.id for r in rows])
+                    .values("request_id")
+                    .annotate(
+                        auto=Count("id", filter=Q(action="auto_escalated")),
+                        moves=Count("id", filter=Q(action__in=ESCALATION_ACTIONS)),
+                        last=Max("created_at", filter=~Q(action="urgent_warning")),
+                    )
+                )
+            }
+
+            dirty = []
+            for req in rows:
+                s = stats.get(req.id, {})
+                values = (
+                    bool(s.get("auto")),
+                    s.get("moves") or 0,
+                    s.get("last") or req.applied_at,
+                )
+                if values != (req.was_auto_escalated, req.escalation_count, req.last_action_at):
+                    req.was_auto_escalated, req.escalation_count, req.last_action_at = values
+                    dirty.append(req)
+
+            if dirty:
+                # updated_at left alone: the request itself did not change
+                with transaction.atomic():
+                    PermissionRequest.objects.bulk_update(
+                        dirty, ["was_auto_escalated", "escalation_count", "last_action_at"]
+                    )
+                    # received lists are ordered on was_auto_escalated
+                    bump(*{u for r in dirty for u in (r.student_id, r.request_to_id)})
+                changed += len(dirty)
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Requests updated: {changed}"))
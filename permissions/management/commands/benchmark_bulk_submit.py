@@ -0,0 +1,74 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts import directory
+from accounts.models import UserProfile
+from permissions.bulk_submit import submit_bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput of class-wide submission: one submit_bulk() for N students vs "
+        "N one-student submissions. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=300)
+        parser.add_argument("--department", default="BENCH")
+
+    def handle(self, *args, **options):
+        n = max(1, options["students"])
+        dept = options["department"]
+        tag = f"b{int(time.time()) % 1000000}"
+
+        try:
+            with transaction.atomic():
+                staff, hod, rolls = self._seed(tag, dept, n)
+
+                kwargs = dict(
+                    target_user_id=hod.id, title="Sports meet", reason="Benchmark",
+                    from_date=timezone.localdate(), to_date=timezone.localdate(),
+                )
+                one_by_one = self._measure(lambda: [submit_bulk(staff, [r], **kwargs) for r in rolls])
+                bulk = self._measure(lambda: submit_bulk(staff, rolls, **kwargs))
+
+                transaction.set_rollback(True)
+        finally:
+            # the seeded profiles were rolled back - don't keep them in the directory
+            directory.invalidate()
+
+        for label, (seconds, queries) in (("one by one", one_by_one), ("bulk", bulk)):
+            self.stdout.write(
+                f"{label:>10}: {n} requests in {seconds * 1000:8.1f} ms "
+                f"| {n / seconds:8.0f} req/s | {queries} queries"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {one_by_one[0] / bulk[0]:.1f}x (rolled back)"))
+
+    def _seed(self, tag, dept, n):
+        staff = User.objects.create_user(username=f"{tag}-staff", email=f"{tag}-staff@campusiq.test")
+        hod = User.objects.create_user(username=f"{tag}-hod", email=f"{tag}-hod@campusiq.test")
+        UserProfile.objects.create(user=staff, role="staff", department=dept)
+        UserProfile.objects.create(user=hod, role="hod", department=dept)
+
+        User.objects.bulk_create([
+            User(username=f"{tag}-n{i}", email=f"{tag}-n{i}@campusiq.test") for i in range(n)
+        ])
+        students = User.objects.filter(username__startswith=f"{tag}-n").order_by("id")
+        rolls = [f"{tag}-{i:05d}" for i in range(n)]
+        UserProfile.objects.bulk_create([
+            UserProfile(user=u, role="student", department=dept, roll_number=roll)
+            for u, roll in zip(students, rolls)
+        ])
+        return staff, hod, rolls
+
+    def _measure(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - started
+        return seconds, len(queries)
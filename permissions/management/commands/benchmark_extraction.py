@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from permissions import extraction
+
+
+class Command(BaseCommand):
+    help = (
+        "PDF text extraction throughput (pages/s): in-process vs the page-range "
+        "process pool, over generated PDFs. The extraction cache is not used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs", type=int, default=4)
+        parser.add_argument("--pages", type=int, default=120, help="Pages per generated PDF.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        docs = max(1, options["docs"])
+        pages = max(1, options["pages"])
+        workers = max(1, options["workers"])
+
+        corpus = tempfile.mkdtemp(prefix="campusiq-bench-")
+        try:
+            paths = [self._make_pdf(os.path.join(corpus, f"doc{i}.pdf"), pages) for i in range(docs)]
+
+            # whole documents, no budget - only the parsing is compared
+            with override_settings(EXTRACTION_WORKERS=workers, EXTRACTION_PAGE_CAP=pages,
+                                   EXTRACTION_TIME_BUDGET_SECONDS=3600):
+                extraction._kill_pool()
+                extraction.parse_pdf_pooled(paths[0])   # start the workers outside the timing
+
+                serial = self._measure(paths, self._serial)
+                pooled = self._measure(paths, extraction.parse_pdf_pooled)
+                extraction._kill_pool()
+        finally:
+            shutil.rmtree(corpus, ignore_errors=True)
+
+        total = docs * pages
+        for label, seconds in (("serial", serial), (f"{workers} workers", pooled)):
+            self.stdout.write(
+                f"{label:>10}: {total} pages in {seconds * 1000:8.1f} ms | {total / seconds:8.1f} pages/s"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {serial / pooled:.1f}x"))
+
+    def _serial(self, path):
+        with open(path, "rb") as f:
+            return extraction.parse_pdf_serial(f)
+
+    def _measure(self, paths, parse):
+        started = time.perf_counter()
+        for path in paths:
+            result = parse(path)
+            if result.error or result.truncated:
+                raise RuntimeError(f"{path}: {result.error or 'truncated'}")
+        return time.perf_counter() - started
+
+    def _make_pdf(self, path, pages):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        c = canvas.Canvas(path, pagesize=A4)
+        for n in range(pages):
+            for line in range(50):
+                c.drawString(40, 800 - line * 15, f"Page {n + 1} line {line + 1}: permission letter text for the benchmark.")
+            c.showPage()
+        c.save()
+        return path
@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from permissions.bulk_submit import BulkSubmitError, parse_roll_numbers, submit_bulk
+
+
+class Command(BaseCommand):
+    help = "Submit the same permission request for every roll number of a CSV (class-wide submission)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="CSV file, roll numbers in the first column (header optional).")
+        parser.add_argument("--by", required=True, help="Username of the staff member submitting.")
+        parser.add_argument("--to", required=True, help="Username of the authority the requests go to.")
+        parser.add_argument("--title", required=True)
+        parser.add_argument("--reason", required=True)
+        parser.add_argument("--from-date", required=True, help="YYYY-MM-DD")
+        parser.add_argument("--to-date", required=True, help="YYYY-MM-DD")
+        parser.add_argument("--urgent", action="store_true")
+        parser.add_argument("--urgent-minutes", type=int)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["csv_path"], "rb") as f:
+                roll_numbers = parse_roll_numbers(f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"Cannot read {options['csv_path']}: {e}")
+
+        actor = User.objects.filter(username=options["by"]).first()
+        target = User.objects.filter(username=options["to"]).first()
+        if not actor or not target:
+            raise CommandError("--by / --to must be existing usernames")
+
+        started = time.perf_counter()
+        try:
+            reqs = submit_bulk(
+                actor,
+                roll_numbers,
+                target_user_id=target.id,
+                title=options["title"],
+                reason=options["reason"],
+                from_date=options["from_date"],
+                to_date=options["to_date"],
+                is_urgent=options["urgent"],
+                urgent_minutes=options["urgent_minutes"],
+            )
+        except BulkSubmitError as e:
+            raise CommandError("Nothing submitted:\n- " + "\n- ".join(e.errors))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Submitted {len(reqs)} requests to {target.username} "
+            f"({reqs[0].request_code} .. {reqs[-1].request_code}) in {elapsed * 1000:.1f} ms"
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from permissions.extraction import run_batch
+
+
+class Command(BaseCommand):
+    help = "Extract the text of uploaded request letters (PDF / DOCX) into AttachmentText, once per upload."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep running and pick up new uploads every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+
+        done = 0
+        failed = 0
+        while True:
+            counts = run_batch(batch_size)
+            done += counts["done"]
+            failed += counts["failed"]
+
+            if counts["claimed"] == batch_size:
+                continue            # more waiting, go on right away
+            if not options["loop"]:
+                break
+
+            close_old_connections()
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Extracted: {done} | Failed: {failed}"))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from permissions.models import AssigneeQueueStats
+from permissions.queue_stats import actual_stats
+
+
+FIELDS = ("pending", "approved", "rejected", "urgent_pending", "oldest_pending_at")
+
+
+class Command(BaseCommand):
+    help = "Compare AssigneeQueueStats with PermissionRequest and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Only report drift (exit code 1 if there is any), change nothing.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # lock the counters first: views that change a request block on
+            # their stats row until we are done, so their delta lands on top
+            stored = {
+                (s.user_id, s.level): s
+                for s in AssigneeQueueStats.objects.select_for_update()
+            }
+            actual = actual_stats()
+
+            drift = []
+            to_create = []
+            to_update = []
+            to_delete = []
+
+            for bucket, values in actual.items():
+                row = stored.get(bucket)
+                if row is None:
+                    if any(values[f] for f in FIELDS):
+                        drift.append((bucket, "missing"))
+                        to_create.append(AssigneeQueueStats(user_id=bucket[0], level=bucket[1], **values))
+                    continue
+
+                wrong = [f for f in FIELDS if getattr(row, f) != values[f]]
+                if wrong:
+                    drift.append((bucket, ", ".join(f"{f} {getattr(row, f)} -> {values[f]}" for f in wrong)))
+                    for f in FIELDS:
+                        setattr(row, f, values[f])
+                    to_update.append(row)
+
+            for bucket, row in stored.items():
+                if bucket not in actual and any(getattr(row, f) for f in FIELDS):
+                    drift.append((bucket, "no requests left"))
+                    to_delete.append(row.id)
+
+            for (user_id, level), what in drift:
+                self.stdout.write(f"user={user_id} level={level}: {what}")
+
+            if options["check"]:
+                if drift:
+                    raise CommandError(f"{len(drift)} queue counter(s) out of date")
+                self.stdout.write(self.style.SUCCESS("Queue counters are up to date."))
+                return
+
+            AssigneeQueueStats.objects.bulk_create(to_create)
+            AssigneeQueueStats.objects.bulk_update(to_update, FIELDS)
+            AssigneeQueueStats.objects.filter(id__in=to_delete).delete()
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Buckets fixed: {len(drift)}"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from permissions.models import PermissionRequest
+from permissions.search import BATCH_SIZE, index_requests
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index (SearchDocument) of every permission request, e.g. after deploying search."
+
+    def handle(self, *args, **options):
+        ids = PermissionRequest.objects.order_by("id").values_list("id", flat=True)
+        done = 0
+        batch = []
+        for request_id in ids.iterator(chunk_size=BATCH_SIZE):
+            batch.append(request_id)
+            if len(batch) == BATCH_SIZE:
+                index_requests(batch)
+                done += len(batch)
+                batch = []
+        index_requests(batch)
+        done += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Requests indexed: {done}"))
@@ -1,181 +1,109 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from django.conf import settings
-from django.core.mail import send_mail
+import time
 from datetime import timedelta
 
-from permissions.models import PermissionRequest, RequestHistory
-from accounts.models import UserProfile
-
-
-ROLE_FLOW = {
-    "student": ["proctor", "staff", "hod", "dean", "principal"],
-    "proctor": ["hod", "dean", "principal"],
-    "staff": ["hod", "dean", "principal"],
-    "hod": ["dean", "principal"],
-    "dean": ["principal"],
-    "principal": [],
-}
-
-
-def _full_name_or_username(user):
-    full = (user.get_full_name() or "").strip()
-    return full if full else user.username
-
-
-def send_request_email(subject, message, to_email, extra_note=None):
-    if not to_email:
-        return
-
-    final_message = message
-    if extra_note:
-        final_message = f"{message}\n\nNote:\n{extra_note}"
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
 
-    send_mail(
-        subject=subject,
-        message=final_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[to_email],
-        fail_silently=True,   # keep like your original
-    )
+from permissions.escalations import CHUNK_SIZE, DeadlineScheduler, run_pass
+from permissions.events import prune_events
 
 
 class Command(BaseCommand):
     help = "Warn 10 minutes before urgent escalation + auto escalates pending permission requests based on escalate_at time."
 
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--daemon", action="store_true",
+                            help="Stay running and wake up exactly at the next warning/escalation deadline.")
+        parser.add_argument("--refresh-seconds", type=float, default=30.0,
+                            help="Daemon: how often to pick up new/changed requests (updated_at cursor).")
+        parser.add_argument("--resync-minutes", type=float, default=60.0,
+                            help="Daemon: full reload of the deadline heap.")
+        parser.add_argument("--department",
+                            help="Only handle requests of students in this department.")
+        parser.add_argument("--shard",
+                            help="N/M -> only handle requests with id %% M == N (e.g. 0/4).")
+
     def handle(self, *args, **options):
+        chunk_size = max(1, options["chunk_size"])
+        self.department = (options["department"] or "").strip() or None
+        self.shard = self._parse_shard(options["shard"])
+
+        if options["daemon"]:
+            return self._daemon(chunk_size, options["refresh_seconds"], options["resync_minutes"])
+
+        warned, updated, timings = run_pass(
+            timezone.now(), chunk_size, department=self.department, shard=self.shard
+        )
+        prune_events()
+        self._report(warned, updated, timings)
+
+    def _parse_shard(self, value):
+        if not value:
+            return None
+        try:
+            n, m = (int(x) for x in value.split("/"))
+        except ValueError:
+            raise CommandError("--shard must look like N/M, e.g. 0/4")
+        if m < 1 or not 0 <= n < m:
+            raise CommandError("--shard needs 0 <= N < M")
+        return (n, m)
+
+    def _report(self, warned, updated, timings):
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Warning emails sent: {warned} | Auto-escalated: {updated}"
+        ))
+        self.stdout.write(
+            "Timings (ms): " + " | ".join(f"{k}={v:.1f}" for k, v in timings.items())
+        )
+
+    def _daemon(self, chunk_size, refresh_seconds, resync_minutes):
+        refresh_every = timedelta(seconds=max(1.0, refresh_seconds))
+        resync_every = timedelta(minutes=max(1.0, resync_minutes))
+
+        scheduler = DeadlineScheduler(
+            overlap_seconds=max(1.0, refresh_seconds / 2),
+            department=self.department,
+            shard=self.shard,
+        )
+        loaded = scheduler.load()
         now = timezone.now()
-        updated = 0
-        warned = 0
-
-        # -------------------------------
-        # 1) ✅ 10-minute WARNING MAIL (urgent only)
-        # -------------------------------
-        warn_window_end = now + timedelta(minutes=10)
-
-        qs_warn = PermissionRequest.objects.filter(
-            status="pending",
-            is_urgent=True,
-            escalate_at__isnull=False,
-            escalate_at__gt=now,                  # still not escalated
-            escalate_at__lte=warn_window_end,     # within next 10 minutes
-            warning_sent_at__isnull=True,         # not warned before
-        ).select_related("student", "request_to")
-
-        for req in qs_warn:
-            # must have current assignee + email
-            if req.request_to and req.request_to.email:
-                local_escalate = timezone.localtime(req.escalate_at)
-                mins_left = int((req.escalate_at - now).total_seconds() // 60)
-
-                send_request_email(
-                    subject=f"[{req.request_code}] URGENT: Auto-escalation in {mins_left} minutes",
-                    message=(
-                        f"Hello {_full_name_or_username(req.request_to)},\n\n"
-                        f"This is a reminder that an URGENT permission request assigned to you will be auto-escalated soon.\n\n"
-                        f"Request ID: {req.request_code}\n"
-                        f"Title: {req.title}\n"
-                        f"Requested by: {_full_name_or_username(req.student)} ({req.student.username})\n"
-                        f"From: {req.from_date}  To: {req.to_date}\n"
-                        f"Auto-escalation time: {local_escalate.strftime('%Y-%m-%d %H:%M')}\n\n"
-                        f"Please take action before escalation.\n\n"
-                        f"Regards,\nCampusIQ"
-                    ),
-                    to_email=req.request_to.email,
+        next_refresh = now + refresh_every
+        next_resync = now + resync_every
+        self.stdout.write(f"Escalation daemon started. Tracking {loaded} pending deadlines.")
+
+        while True:
+            now = timezone.now()
+
+            if now >= next_resync:
+                close_old_connections()
+                scheduler.load()
+                next_resync = now + resync_every
+                next_refresh = now + refresh_every
+            elif now >= next_refresh:
+                close_old_connections()
+                scheduler.refresh()
+                prune_events(now)
+                next_refresh = now + refresh_every
+
+            due = scheduler.pop_due(now)
+            if due:
+                keys = scheduler.keys(due)
+                warned, updated, timings = run_pass(
+                    now, chunk_size, ids=due, department=self.department, shard=self.shard
                 )
-
-                # mark warned (so it sends ONLY ONCE)
-                req.warning_sent_at = now
-                req.save(update_fields=["warning_sent_at"])
-                warned += 1
-
-                # optional history entry
-                RequestHistory.objects.create(
-                    request=req,
-                    action="urgent_warning",
-                    from_role=(req.current_level or "").strip().lower(),
-                    to_role=(req.current_level or "").strip().lower(),
-                    actor=None,
-                    note="10-minute urgent escalation warning email sent",
-                )
-
-        # -------------------------------
-        # 2) ✅ AUTO ESCALATION (your existing)
-        # -------------------------------
-        qs = PermissionRequest.objects.filter(
-            status="pending",
-            escalate_at__isnull=False,
-            escalate_at__lte=now,
-        ).select_related("student", "request_to")
-
-        for req in qs:
-            current_role = (req.current_level or "").strip().lower()
-
-            # find next role
-            next_roles = ROLE_FLOW.get(current_role, [])
-            if not next_roles:
-                continue  # no escalation possible
-
-            next_role = next_roles[0]
-
-            # find next user in same dept
-            student_profile = UserProfile.objects.filter(user=req.student).first()
-            dept = student_profile.department if student_profile else None
-
-            target_profile = UserProfile.objects.filter(
-                role=next_role,
-                department=dept
-            ).select_related("user").first()
-
-            if not target_profile:
+                if warned or updated:
+                    self._report(warned, updated, timings)
+                # rows we just touched have a new updated_at -> pick them up now
+                scheduler.refresh()
+                # the rest (no target yet, locked elsewhere) again after a backoff
+                scheduler.retry(keys, now)
                 continue
 
-            old_role = current_role
-            old_request_to = req.request_to
-
-            req.request_to = target_profile.user
-            req.current_level = next_role
-            req.escalate_at = None  # clear after escalation
-            req.save(update_fields=["request_to", "current_level", "escalate_at"])
-
-            RequestHistory.objects.create(
-                request=req,
-                action="auto_escalated",
-                from_role=old_role,
-                to_role=next_role,
-                actor=None,
-                note=f"Auto escalated from {old_role} to {next_role}",
-            )
-
-            # email to student
-            send_request_email(
-                subject=f"[{req.request_code}] Request auto-escalated",
-                message=(
-                    f"Hi {_full_name_or_username(req.student)},\n\n"
-                    f"Your permission request has been auto-escalated.\n\n"
-                    f"Request ID: {req.request_code}\n"
-                    f"Title: {req.title}\n"
-                    f"Moved from: {old_role.upper()} to {next_role.upper()}\n"
-                ),
-                to_email=req.student.email,
-            )
-
-            # email to new receiver
-            send_request_email(
-                subject=f"[{req.request_code}] New permission request assigned to you",
-                message=(
-                    f"Hello {_full_name_or_username(target_profile.user)},\n\n"
-                    f"A permission request has been assigned to you.\n\n"
-                    f"Request ID: {req.request_code}\n"
-                    f"Title: {req.title}\n"
-                    f"Requested by: {_full_name_or_username(req.student)} ({req.student.username})\n"
-                    f"Current Level: {next_role.upper()}\n"
-                ),
-                to_email=target_profile.user.email,
-            )
-
-            updated += 1
+            wake_at = next_refresh
+            deadline = scheduler.next_deadline()
+            if deadline is not None and deadline < wake_at:
+                wake_at = deadline
 
-        self.stdout.write(self.style.SUCCESS(
-            f"Done. Warning emails sent: {warned} | Auto-escalated: {updated}"
-        ))
+            time.sleep(max(0.0, (wake_at - timezone.now()).total_seconds()))
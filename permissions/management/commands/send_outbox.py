@@ -0,0 +1,141 @@
+import time
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from permissions.events import prune_events
+from permissions.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails in batches over one reused SMTP connection (retry with backoff)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument("--backoff-seconds", type=int, default=60,
+                            help="First retry delay, doubled after every failed attempt.")
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep running and poll the outbox every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument("--lease-seconds", type=int, default=600,
+                            help="A claimed row not finished by then (worker died) is sent again.")
+
+    def handle(self, *args, **options):
+        self.batch_size = max(1, options["batch_size"])
+        self.max_attempts = max(1, options["max_attempts"])
+        self.backoff_seconds = max(1, options["backoff_seconds"])
+        self.lease = timedelta(seconds=max(1, options["lease_seconds"]))
+
+        # one SMTP connection for the whole run, reopened only if it breaks
+        self.connection = get_connection(fail_silently=False)
+
+        total_sent = 0
+        total_failed = 0
+        try:
+            while True:
+                sent, failed = self._drain()
+                total_sent += sent
+                total_failed += failed
+                # the SSE pump prunes only while a stream is open
+                prune_events()
+
+                if not options["loop"]:
+                    break
+
+                if not sent and not failed:
+                    # idle -> don't keep the SMTP session open
+                    self.connection.close()
+                    time.sleep(options["interval"])
+        finally:
+            self.connection.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Sent: {total_sent} | Failed attempts: {total_failed}"
+        ))
+
+    # ---------------------------------------------------------
+
+    def _drain(self):
+        """Sends every due row, one claimed batch at a time."""
+        sent = 0
+        failed = 0
+        while True:
+            batch = self._claim()
+            for row in batch:
+                if self._send(row):
+                    sent += 1
+                else:
+                    failed += 1
+            if len(batch) < self.batch_size:
+                return sent, failed
+
+    def _claim(self):
+        """
+        Leases a batch: status "sending", next_attempt_at = end of the lease,
+        one attempt counted. Short transaction - no SMTP while the rows are
+        locked. A worker that dies mid-batch leaves its rows "sending"; they
+        are claimed again once the lease runs out.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            # leases that ran out on the last allowed attempt
+            OutboxEmail.objects.filter(
+                status="sending", next_attempt_at__lte=now, attempts__gte=self.max_attempts,
+            ).update(status="failed", last_error="Delivery did not finish (lease expired).")
+
+            # skip_locked -> several workers can drain the same outbox
+            batch = list(
+                OutboxEmail.objects
+                .select_for_update(skip_locked=True)
+                .filter(status__in=("pending", "sending"), next_attempt_at__lte=now)
+                .order_by("next_attempt_at", "id")[:self.batch_size]
+            )
+            if batch:
+                OutboxEmail.objects.filter(id__in=[row.id for row in batch]).update(
+                    status="sending", next_attempt_at=now + self.lease, attempts=F("attempts") + 1,
+                )
+        for row in batch:
+            row.status = "sending"
+            row.next_attempt_at = now + self.lease
+            row.attempts += 1
+        return batch
+
+    def _send(self, row):
+        """Delivers one leased row and records the result right away. True if sent."""
+        msg = EmailMessage(
+            subject=row.subject,
+            body=row.message,
+            from_email=row.from_email or None,
+            to=[row.to_email],
+            connection=self.connection,
+        )
+        try:
+            msg.send()
+        except Exception as e:
+            # drop the (possibly broken) session, next send reconnects
+            self.connection.close()
+
+            if row.attempts >= self.max_attempts:
+                changes = {"status": "failed"}
+            else:
+                delay = self.backoff_seconds * (2 ** (row.attempts - 1))
+                changes = {"status": "pending", "next_attempt_at": timezone.now() + timedelta(seconds=delay)}
+            changes["last_error"] = str(e)[:1000]
+            self._record(row, changes)
+            return False
+
+        self._record(row, {"status": "sent", "sent_at": timezone.now(), "last_error": ""})
+        return True
+
+    def _record(self, row, changes):
+        # only while our lease holds - else another worker owns the row now
+        OutboxEmail.objects.filter(
+            id=row.id, status="sending", next_attempt_at=row.next_attempt_at,
+        ).update(**changes)
+        for field, value in changes.items():
+            setattr(row, field, value)
@@ -0,0 +1,41 @@
+# Generated by Django 3.0 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permissions', '0011_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='permissionrequest',
+            index=models.Index(fields=['status', 'escalate_at'], name='preq_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='permissionrequest',
+            index=models.Index(fields=['status', 'is_urgent', 'warning_sent_at', 'escalate_at'], name='preq_warn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='permissionrequest',
+            index=models.Index(fields=['request_to', 'status', 'current_level', 'applied_at'], name='preq_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='permissionrequest',
+            index=models.Index(fields=['student', '-applied_at'], name='preq_student_applied_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='permissionrequest',
+            index=models.Index(fields=['updated_at', 'id'], name='preq_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requesthistory',
+            index=models.Index(fields=['request', 'action'], name='rhist_request_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requesthistory',
+            index=models.Index(fields=['request', 'created_at'], name='rhist_request_created_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.0 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permissions', '0012_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permissionrequest',
+            name='escalation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='permissionrequest',
+            name='last_action_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='permissionrequest',
+            name='was_auto_escalated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='permissionrequest',
+            index=models.Index(fields=['request_to', 'status', 'is_urgent', 'was_auto_escalated', 'applied_at'], name='preq_inbox_order_idx'),
+        ),
+    ]
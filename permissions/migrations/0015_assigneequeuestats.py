@@ -0,0 +1,61 @@
+# Generated by Django 3.0 on 2026-10-17 00:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Min, Q
+
+
+def fill_queue_stats(apps, schema_editor):
+    PermissionRequest = apps.get_model("permissions", "PermissionRequest")
+    AssigneeQueueStats = apps.get_model("permissions", "AssigneeQueueStats")
+
+    rows = (
+        PermissionRequest.objects
+        .filter(request_to__isnull=False)
+        .values("request_to_id", "current_level")
+        .annotate(
+            pending=Count("id", filter=Q(status="pending")),
+            approved=Count("id", filter=Q(status="approved")),
+            rejected=Count("id", filter=Q(status="rejected")),
+            urgent_pending=Count("id", filter=Q(status="pending", is_urgent=True)),
+            oldest_pending_at=Min("applied_at", filter=Q(status="pending")),
+        )
+        .order_by()
+    )
+    AssigneeQueueStats.objects.bulk_create([
+        AssigneeQueueStats(
+            user_id=r.pop("request_to_id"),
+            level=r.pop("current_level"),
+            **r,
+        )
+        for r in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('permissions', '0014_inboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssigneeQueueStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=50)),
+                ('pending', models.IntegerField(default=0)),
+                ('approved', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('urgent_pending', models.IntegerField(default=0)),
+                ('oldest_pending_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queue_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'level')},
+            },
+        ),
+        migrations.RunPython(fill_queue_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.0 on 2026-10-17 00:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def queue_existing_files(apps, schema_editor):
+    # every letter already uploaded gets extracted once by `manage.py extract_attachments`
+    PermissionRequest = apps.get_model("permissions", "PermissionRequest")
+    AttachmentText = apps.get_model("permissions", "AttachmentText")
+
+    rows = PermissionRequest.objects.exclude(file="").exclude(file__isnull=True).values_list("id", "file")
+    AttachmentText.objects.bulk_create(
+        [AttachmentText(request_id=rid, file_name=name) for rid, name in rows.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permissions', '0015_assigneequeuestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentText',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('text', models.TextField(blank=True, default='')),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='attachment_text', to='permissions.PermissionRequest')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='attachmenttext',
+            index=models.Index(fields=['status', 'id'], name='attachtext_queue_idx'),
+        ),
+        migrations.RunPython(queue_existing_files, migrations.RunPython.noop),
+    ]
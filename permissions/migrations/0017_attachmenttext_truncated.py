@@ -0,0 +1,18 @@
+# Generated by Django 3.0 on 2026-10-17 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permissions', '0016_attachmenttext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmenttext',
+            name='truncated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
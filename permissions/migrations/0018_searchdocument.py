@@ -0,0 +1,77 @@
+# Generated by Django 3.0 on 2026-10-17 00:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# SQLite: FTS5 table over permissions_searchdocument (external content, kept
+# in sync by triggers). MySQL: a FULLTEXT index. Anything else searches with
+# LIKE (see permissions/search.py).
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE permissions_searchdocument_fts USING fts5(
+        title, people, body,
+        content='permissions_searchdocument', content_rowid='request_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER permissions_searchdocument_ai AFTER INSERT ON permissions_searchdocument BEGIN
+        INSERT INTO permissions_searchdocument_fts(rowid, title, people, body)
+        VALUES (new.request_id, new.title, new.people, new.body);
+    END""",
+    """CREATE TRIGGER permissions_searchdocument_ad AFTER DELETE ON permissions_searchdocument BEGIN
+        INSERT INTO permissions_searchdocument_fts(permissions_searchdocument_fts, rowid, title, people, body)
+        VALUES ('delete', old.request_id, old.title, old.people, old.body);
+    END""",
+    """CREATE TRIGGER permissions_searchdocument_au AFTER UPDATE ON permissions_searchdocument BEGIN
+        INSERT INTO permissions_searchdocument_fts(permissions_searchdocument_fts, rowid, title, people, body)
+        VALUES ('delete', old.request_id, old.title, old.people, old.body);
+        INSERT INTO permissions_searchdocument_fts(rowid, title, people, body)
+        VALUES (new.request_id, new.title, new.people, new.body);
+    END""",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS permissions_searchdocument_au",
+    "DROP TRIGGER IF EXISTS permissions_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS permissions_searchdocument_ai",
+    "DROP TABLE IF EXISTS permissions_searchdocument_fts",
+]
+
+MYSQL_FULLTEXT = [
+    "ALTER TABLE permissions_searchdocument ADD FULLTEXT INDEX psearch_fulltext_idx (title, people, body)",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_FTS, "mysql": MYSQL_FULLTEXT}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    # the MySQL index goes away with the table
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in SQLITE_FTS_DROP:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permissions', '0017_attachmenttext_truncated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='permissions.PermissionRequest')),
+                ('title', models.CharField(blank=True, default='', max_length=100)),
+                ('people', models.CharField(blank=True, default='', max_length=255)),
+                ('body', models.TextField(blank=True, default='')),
+                ('indexed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0 on 2026-10-17 00:49
+
+import accounts.blobs
+from django.db import migrations, models
+import permissions.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_blob'),
+        ('permissions', '0018_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permissionrequest',
+            name='original_filename',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='permissionrequest',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=accounts.blobs.BlobStorage(), upload_to=permissions.models.permission_upload_path),
+        ),
+    ]
@@ -1,20 +1,18 @@
 from django.db import models
 from django.contrib.auth.models import User
-import os
+from django.utils import timezone
+
+from accounts.blobs import blob_storage
+from accounts.codes import next_code
 
 
 def permission_upload_path(instance, filename):
     """
-    Files go to:
-    media/permissions/<REQUEST_CODE>/<REQUEST_CODE>.<ext>
-
-    If request_code is not yet available (first save),
-    temporarily store under REQ-TMP.
+    Files are stored by content (accounts/blobs.py: blobs/ab/cd/<sha256><ext>),
+    this name only gives the extension. The uploaded name is kept in
+    original_filename.
     """
-    ext = os.path.splitext(filename)[1]  # .pdf, .docx etc
-    code = instance.request_code or "REQ-TMP"
-    return f"permissions/view/33/media/permissions/{code}{ext}"
-    #return f"permissions/{code}/{code}{ext}"
+    return filename
 
 
 class PermissionRequest(models.Model):
@@ -68,28 +66,57 @@ class PermissionRequest(models.Model):
     applied_at = models.DateTimeField(auto_now_add=True)
     warning_sent_at = models.DateTimeField(null=True, blank=True)
 
+    # denormalized from RequestHistory (kept up to date by run_escalations
+    # and the lifecycle views, `manage.py backfill_request_flags` for old rows)
+    was_auto_escalated = models.BooleanField(default=False)
+    escalation_count = models.PositiveIntegerField(default=0)
+    last_action_at = models.DateTimeField(null=True, blank=True)
+
 
     file = models.FileField(
         upload_to=permission_upload_path,
+        storage=blob_storage,
         null=True,
         blank=True
     )
+    original_filename = models.CharField(max_length=255, blank=True, default="")
 
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # run_escalations: status="pending" AND escalate_at <= now
+            models.Index(fields=["status", "escalate_at"], name="preq_due_idx"),
+            # urgent warning: pending + urgent + not warned + escalate_at in window
+            models.Index(
+                fields=["status", "is_urgent", "warning_sent_at", "escalate_at"],
+                name="preq_warn_idx",
+            ),
+            # dashboard received list + counters (status / current_level per assignee)
+            models.Index(
+                fields=["request_to", "status", "current_level", "applied_at"],
+                name="preq_inbox_idx",
+            ),
+            # dashboard received ordering without the history subquery
+            models.Index(
+                fields=["request_to", "status", "is_urgent", "was_auto_escalated", "applied_at"],
+                name="preq_inbox_order_idx",
+            ),
+            # dashboard / my_requests: student=... ORDER BY applied_at DESC
+            models.Index(fields=["student", "-applied_at"], name="preq_student_applied_idx"),
+            # escalation daemon cursor: updated_at > ... ORDER BY updated_at, id
+            models.Index(fields=["updated_at", "id"], name="preq_updated_idx"),
+        ]
+
     def save(self, *args, **kwargs):
         """
-        1️⃣ First save → get PK
-        2️⃣ Generate request_code
-        3️⃣ Save again ONLY if needed
+        request_code comes from the shared allocator (accounts/codes.py)
+        before the INSERT -> one query, no second save.
         """
-        creating = self.pk is None
+        if self.pk is None and not self.request_code:
+            self.request_code = next_code("REQ", PermissionRequest, "request_code")
         super().save(*args, **kwargs)
 
-        if creating and not self.request_code:
-            self.request_code = f"REQ-{self.pk:06d}"
-            super().save(update_fields=["request_code"])
-
     def __str__(self):
         return f"{self.request_code} | {self.title} | {self.student.username}"
 
@@ -124,9 +151,176 @@ class RequestHistory(models.Model):
         null=True,
         blank=True
     )
+    # assignee the request was taken from (forward / reassign / auto escalation)
+    from_user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
 
     note = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # dashboard: Exists(history where request=... and action="auto_escalated")
+            models.Index(fields=["request", "action"], name="rhist_request_action_idx"),
+            # track_request: request=... ORDER BY created_at
+            models.Index(fields=["request", "created_at"], name="rhist_request_created_idx"),
+            # changes_since: requests that left my list since the cursor
+            models.Index(fields=["actor", "created_at"], name="rhist_actor_created_idx"),
+            models.Index(fields=["from_user", "created_at"], name="rhist_from_user_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.request.request_code} - {self.action}"
+
+
+class OutboxEmail(models.Model):
+    """
+    Email queued by the views / escalation command.
+    Rows are written in the same transaction as the state change and
+    delivered later by `manage.py send_outbox` ("sending" = leased by a
+    worker until next_attempt_at).
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True, default="")
+    to_email = models.CharField(max_length=254)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # worker poll: status="pending" AND next_attempt_at <= now
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} | {self.subject} | {self.status}"
+
+
+class InboxEvent(models.Model):
+    """
+    Push event for one user's open dashboards (new assignment, forward,
+    auto-escalation, urgent warning). Written next to the state change and
+    streamed by the SSE endpoint (permissions/sse.py); rows are short-lived.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    event = models.CharField(max_length=30)
+    payload = models.TextField(default="{}")  # JSON
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # stream pump: everything newer than the last poll
+            models.Index(fields=["created_at", "id"], name="inboxevent_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} | {self.event}"
+
+
+class AssigneeQueueStats(models.Model):
+    """
+    Counters of the requests assigned to one user at one level
+    (request_to, current_level), kept in step with every status / assignee
+    change by permissions/queue_stats.py. `manage.py rebuild_queue_stats`
+    checks them against PermissionRequest and fixes drift.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="queue_stats")
+    level = models.CharField(max_length=50)
+
+    pending = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    urgent_pending = models.IntegerField(default=0)
+    oldest_pending_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("user", "level")
+
+    def __str__(self):
+        return f"{self.user_id} | {self.level} | pending={self.pending}"
+
+
+class AttachmentText(models.Model):
+    """
+    Text of a request's uploaded letter (PDF / DOCX), extracted once by
+    `manage.py extract_attachments` right after upload, so view_request
+    only reads a column instead of parsing the file.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    request = models.OneToOneField(
+        PermissionRequest,
+        on_delete=models.CASCADE,
+        related_name="attachment_text"
+    )
+    file_name = models.CharField(max_length=255)   # the upload this text belongs to
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    text = models.TextField(blank=True, default="")
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    truncated = models.BooleanField(default=False)   # page cap / time budget hit, text is partial
+
+    attempts = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # worker: status="pending" ORDER BY id
+            models.Index(fields=["status", "id"], name="attachtext_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.request_id} | {self.file_name} | {self.status}"
+
+
+class SearchDocument(models.Model):
+    """
+    What the request search (permissions/search.py) matches against, one row
+    per request, rebuilt by search.index_requests(). The full-text index on
+    it is database specific, see migration 0018.
+    """
+
+    request = models.OneToOneField(
+        PermissionRequest,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document"
+    )
+    title = models.CharField(max_length=100, blank=True, default="")
+    people = models.CharField(max_length=255, blank=True, default="")   # code, student name / username / roll
+    body = models.TextField(blank=True, default="")                      # reason + attachment text
+    indexed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.request_id} | {self.title}"
@@ -0,0 +1,27 @@
+"""
+PDF page parsing run inside the extraction process pool
+(permissions/extraction.py). Kept free of Django imports so spawned pool
+workers start fast and never touch the database.
+"""
+import time
+
+
+def count_pages(path):
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def parse_pages(path, start, end, deadline):
+    """
+    Text of pages [start, end). Stops early once time.time() passes
+    `deadline` -> (start, texts, complete).
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    texts = []
+    for i in range(start, end):
+        if time.time() > deadline:
+            return start, texts, False
+        texts.append((reader.pages[i].extract_text() or "").strip())
+    return start, texts, True
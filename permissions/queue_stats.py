@@ -0,0 +1,145 @@
+"""
+Incremental upkeep of AssigneeQueueStats.
+
+Callers take snapshot(req) before and after a change and pass the pair to
+record() / record_many() inside the same transaction. Each (user, level)
+bucket gets one UPDATE with F() deltas; oldest_pending_at is re-read from
+preq_inbox_idx only when a pending request leaves its bucket.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DateTimeField, F, Min, Q, Value, When
+
+from .models import AssigneeQueueStats, PermissionRequest
+
+
+QueueState = namedtuple("QueueState", "user_id level status is_urgent applied_at")
+
+COUNTED = ("pending", "approved", "rejected")
+
+
+def snapshot(req):
+    """Where this request counts right now (None if it is unassigned)."""
+    if not req.request_to_id:
+        return None
+    return QueueState(
+        req.request_to_id,
+        req.current_level,
+        req.status,
+        bool(req.is_urgent),
+        req.applied_at,
+    )
+
+
+def _contribution(state):
+    c = {}
+    if state is None or state.status not in COUNTED:
+        return c
+    c[state.status] = 1
+    if state.status == "pending" and state.is_urgent:
+        c["urgent_pending"] = 1
+    return c
+
+
+def record(before, after):
+    record_many([(before, after)])
+
+
+def record_many(changes):
+    """changes: iterable of (before, after) snapshots. Caller holds the transaction."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    oldest_new = {}        # bucket -> earliest applied_at of pending rows that arrived
+    recheck_oldest = set()  # buckets a pending row left
+
+    for before, after in changes:
+        if before == after:
+            continue
+
+        if before is not None:
+            bucket = (before.user_id, before.level)
+            for field, n in _contribution(before).items():
+                deltas[bucket][field] -= n
+            if before.status == "pending":
+                recheck_oldest.add(bucket)
+
+        if after is not None:
+            bucket = (after.user_id, after.level)
+            for field, n in _contribution(after).items():
+                deltas[bucket][field] += n
+            if after.status == "pending" and after.applied_at:
+                current = oldest_new.get(bucket)
+                if current is None or after.applied_at < current:
+                    oldest_new[bucket] = after.applied_at
+
+    # fixed lock order over the stats rows -> concurrent writers can't deadlock
+    for bucket in sorted(set(deltas) | set(oldest_new)):
+        _apply(bucket, deltas.get(bucket, {}), oldest_new.get(bucket))
+
+    for user_id, level in sorted(recheck_oldest):
+        oldest = (
+            PermissionRequest.objects
+            .filter(request_to_id=user_id, status="pending", current_level=level)
+            .aggregate(m=Min("applied_at"))["m"]
+        )
+        AssigneeQueueStats.objects.filter(user_id=user_id, level=level).update(oldest_pending_at=oldest)
+
+
+def _apply(bucket, delta, oldest):
+    user_id, level = bucket
+    values = {field: F(field) + n for field, n in delta.items() if n}
+    if oldest is not None:
+        values["oldest_pending_at"] = Case(
+            When(oldest_pending_at__isnull=True, then=Value(oldest)),
+            When(oldest_pending_at__gt=oldest, then=Value(oldest)),
+            default=F("oldest_pending_at"),
+            output_field=DateTimeField(),
+        )
+    if not values:
+        return
+
+    qs = AssigneeQueueStats.objects.filter(user_id=user_id, level=level)
+    if qs.update(**values):
+        return
+
+    # first request in this bucket
+    try:
+        with transaction.atomic():
+            AssigneeQueueStats.objects.create(
+                user_id=user_id,
+                level=level,
+                oldest_pending_at=oldest,
+                **{field: n for field, n in delta.items()},
+            )
+    except IntegrityError:
+        # created by a concurrent transaction in the meantime
+        qs.update(**values)
+
+
+def actual_stats(queryset=None):
+    """(user_id, level) -> counters computed from PermissionRequest itself."""
+    qs = PermissionRequest.objects.all() if queryset is None else queryset
+    rows = (
+        qs.filter(request_to__isnull=False)
+        .values("request_to_id", "current_level")
+        .annotate(
+            pending=Count("id", filter=Q(status="pending")),
+            approved=Count("id", filter=Q(status="approved")),
+            rejected=Count("id", filter=Q(status="rejected")),
+            urgent_pending=Count("id", filter=Q(status="pending", is_urgent=True)),
+            oldest_pending_at=Min("applied_at", filter=Q(status="pending")),
+        )
+        .order_by()
+    )
+    return {(r.pop("request_to_id"), r.pop("current_level")): r for r in rows}
+
+
+def received_counts(user, role):
+    """Dashboard "Requests Received" counters from the stats rows (O(1) per user)."""
+    counts = {"pending": 0, "approved": 0, "rejected": 0}
+    for row in AssigneeQueueStats.objects.filter(user=user).only("level", "pending", "approved", "rejected"):
+        if row.level == role:
+            counts["pending"] += row.pending
+        counts["approved"] += row.approved
+        counts["rejected"] += row.rejected
+    return counts
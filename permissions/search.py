@@ -0,0 +1,212 @@
+"""
+Full-text search over permission requests: title, reason, request code,
+student name / username / roll number and the extracted attachment text.
+
+index_requests() (re)builds the SearchDocument rows of some requests - called
+on save (permissions/signals.py), after bulk writes and when an attachment's
+text is extracted; `manage.py rebuild_search_index` does all of them. The
+full-text index itself lives in the database (migration 0018):
+
+  * MySQL   - FULLTEXT index, MATCH ... AGAINST in boolean mode
+  * SQLite  - FTS5 table kept in sync by triggers, ranked with bm25()
+  * other   - LIKE on every term, title / people hits first
+
+search() only ever looks at the requests the user may see (visible_to()).
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import AttachmentText, PermissionRequest, RequestHistory, SearchDocument
+
+
+BATCH_SIZE = 500
+MAX_TERMS = 8
+
+FTS_TABLE = "permissions_searchdocument_fts"
+
+# bm25() column weights: title, people, body
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+SearchPage = namedtuple("SearchPage", "results page has_more")
+SearchResult = namedtuple("SearchResult", "request snippet")
+
+
+def page_size():
+    return getattr(settings, "SEARCH_PAGE_SIZE", 20)
+
+
+# ---------------- INDEXING ---------------- #
+
+def _people(row):
+    name = f"{row['student__first_name']} {row['student__last_name']}".strip()
+    parts = [row["request_code"], name, row["student__username"], row["student__userprofile__roll_number"]]
+    return " ".join(p for p in parts if p)[:255]
+
+
+def index_requests(request_ids):
+    """Rebuilds the SearchDocument of each request id (ids of deleted requests are skipped)."""
+    request_ids = list(request_ids)
+    for i in range(0, len(request_ids), BATCH_SIZE):
+        _index_batch(request_ids[i:i + BATCH_SIZE])
+
+
+def _index_batch(ids):
+    rows = list(
+        PermissionRequest.objects.filter(id__in=ids).values(
+            "id", "request_code", "title", "reason", "file",
+            "student__username", "student__first_name", "student__last_name",
+            "student__userprofile__roll_number",
+        )
+    )
+    # text of the current upload only, see extraction.process()
+    texts = {
+        (request_id, file_name): text
+        for request_id, file_name, text in AttachmentText.objects
+        .filter(request_id__in=ids, status="done")
+        .values_list("request_id", "file_name", "text")
+    }
+
+    now = timezone.now()
+    docs = [
+        SearchDocument(
+            request_id=row["id"],
+            title=row["title"] or "",
+            people=_people(row),
+            body="\n\n".join(t for t in (row["reason"], texts.get((row["id"], row["file"]))) if t),
+            indexed_at=now,
+        )
+        for row in rows
+    ]
+    # delete + insert: two statements for the batch, and the FTS5 triggers
+    # see plain row deletes / inserts
+    SearchDocument.objects.filter(request_id__in=ids).delete()
+    SearchDocument.objects.bulk_create(docs)
+
+
+# ---------------- QUERY ---------------- #
+
+def visible_to(user):
+    """Requests the user submitted, is assigned, or has acted on."""
+    acted_on = RequestHistory.objects.filter(actor=user).values("request_id")
+    return PermissionRequest.objects.filter(
+        Q(student=user) | Q(request_to=user) | Q(id__in=acted_on)
+    )
+
+
+def terms_of(query):
+    """Words of the query (no operators / quotes - those are the backends' job), lower-cased, deduped."""
+    terms = []
+    for word in re.findall(r"\w+", (query or "").lower()):
+        if word not in terms:
+            terms.append(word)
+    return terms[:MAX_TERMS]
+
+
+def _backend():
+    if connection.vendor == "mysql":
+        return "mysql"
+    if connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names():
+        return "fts5"
+    return "like"
+
+
+def _fts5_ids(terms, scope_sql, scope_params, limit, offset):
+    # every term, prefix match: "hack"* finds "hackathon"
+    match = " ".join('"{}"*'.format(t) for t in terms)
+    sql = (
+        f"SELECT rowid FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({scope_sql}) "
+        f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s), rowid DESC "
+        f"LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *scope_params, *FTS_WEIGHTS, limit, offset])
+        return [r[0] for r in cursor.fetchall()]
+
+
+def _mysql_ids(terms, scope_sql, scope_params, limit, offset):
+    # words under innodb_ft_min_token_size (3) are not in the index - a
+    # required one would match nothing
+    words = [t for t in terms if len(t) >= 3]
+    if not words:
+        return []
+    against = " ".join(f"+{t}*" for t in words)
+    sql = (
+        "SELECT request_id FROM permissions_searchdocument "
+        "WHERE MATCH(title, people, body) AGAINST (%s IN BOOLEAN MODE) "
+        f"AND request_id IN ({scope_sql}) "
+        "ORDER BY MATCH(title, people, body) AGAINST (%s IN BOOLEAN MODE) DESC, request_id DESC "
+        "LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [against, *scope_params, against, limit, offset])
+        return [r[0] for r in cursor.fetchall()]
+
+
+def _like_ids(terms, scope, limit, offset):
+    docs = SearchDocument.objects.filter(request_id__in=scope)
+    for t in terms:
+        docs = docs.filter(Q(title__icontains=t) | Q(people__icontains=t) | Q(body__icontains=t))
+
+    first = terms[0]
+    docs = docs.annotate(
+        rank=Case(
+            When(title__icontains=first, then=Value(2)),
+            When(people__icontains=first, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    return list(docs.order_by("-rank", "-request_id").values_list("request_id", flat=True)[offset:offset + limit])
+
+
+def _snippet(text, terms, width=80):
+    """About 2*width characters of `text` around the first term found in it."""
+    lower = text.lower()
+    hits = [i for i in (lower.find(t) for t in terms) if i >= 0]
+    if not hits:
+        return ""
+    at = min(hits)
+    start = max(0, at - width)
+    end = min(len(text), at + width)
+    snippet = " ".join(text[start:end].split())
+    return ("…" if start else "") + snippet + ("…" if end < len(text) else "")
+
+
+def search(user, query, page=1):
+    """
+    Ranked requests matching every word of `query`, among the ones `user` may
+    see -> SearchPage(results=[SearchResult(request, snippet)], page, has_more).
+    """
+    terms = terms_of(query)
+    page = max(1, page)
+    if not terms:
+        return SearchPage([], page, False)
+
+    size = page_size()
+    offset = (page - 1) * size
+    scope = visible_to(user).values("id")
+
+    backend = _backend()
+    if backend == "like":
+        ids = _like_ids(terms, scope, size + 1, offset)
+    else:
+        scope_sql, scope_params = scope.query.sql_with_params()
+        fetch = _fts5_ids if backend == "fts5" else _mysql_ids
+        ids = fetch(terms, scope_sql, scope_params, size + 1, offset)
+
+    has_more = len(ids) > size
+    ids = ids[:size]
+
+    reqs = PermissionRequest.objects.select_related("student", "request_to").in_bulk(ids)
+    bodies = dict(SearchDocument.objects.filter(request_id__in=ids).values_list("request_id", "body"))
+    results = [
+        SearchResult(reqs[i], _snippet(bodies.get(i, ""), terms))
+        for i in ids if i in reqs
+    ]
+    return SearchPage(results, page, has_more)
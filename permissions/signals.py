@@ -0,0 +1,78 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from accounts import blobs
+from accounts.models import UserProfile
+from . import search
+from .models import PermissionRequest
+
+
+# ---------------- SEARCH INDEX ---------------- #
+
+# what a SearchDocument is built from (see search.index_requests)
+INDEXED_FIELDS = ("request_code", "title", "reason", "student_id")
+
+
+def _indexed_values(instance):
+    # from __dict__: reading a deferred field here would cost a query
+    return tuple(instance.__dict__.get(f) for f in INDEXED_FIELDS)
+
+
+@receiver(post_init, sender=PermissionRequest)
+def remember_indexed_values(sender, instance, **kwargs):
+    instance._indexed_values = _indexed_values(instance)
+
+
+@receiver(post_save, sender=PermissionRequest)
+def index_saved_request(sender, instance, created, **kwargs):
+    # status / assignee changes don't touch the index
+    values = _indexed_values(instance)
+    if created or values != getattr(instance, "_indexed_values", None):
+        search.index_requests([instance.pk])
+    instance._indexed_values = values
+
+
+def _reindex_student(user_id):
+    search.index_requests(PermissionRequest.objects.filter(student_id=user_id).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=UserProfile)
+def index_student_profile(sender, instance, **kwargs):
+    # roll number is part of the document
+    _reindex_student(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def index_student_name(sender, instance, created, update_fields=None, **kwargs):
+    # every login saves last_login - not indexed
+    if created or (update_fields and set(update_fields) <= {"last_login"}):
+        return
+    _reindex_student(instance.pk)
+
+
+# ---------------- UPLOAD REFERENCES (accounts/blobs.py) ---------------- #
+
+@receiver(post_init, sender=PermissionRequest)
+def remember_file(sender, instance, **kwargs):
+    instance._loaded_file_name = blobs.file_name_of(instance.__dict__.get("file"))
+
+
+@receiver(pre_save, sender=PermissionRequest)
+def remember_original_filename(sender, instance, **kwargs):
+    blobs.remember_original_name(instance, "file")
+
+
+@receiver(post_save, sender=PermissionRequest)
+def release_replaced_file(sender, instance, **kwargs):
+    current = blobs.file_name_of(instance.__dict__.get("file"))
+    loaded = getattr(instance, "_loaded_file_name", None)
+    if loaded and loaded != current:
+        blobs.release(loaded)
+    instance._loaded_file_name = current
+
+
+@receiver(post_delete, sender=PermissionRequest)
+def release_file(sender, instance, **kwargs):
+    blobs.release(blobs.file_name_of(instance.__dict__.get("file")))
+
@@ -0,0 +1,144 @@
+"""
+Server-sent events stream of inbox events (GET /permissions/events/).
+
+Django 3.0 has no async views, so this is a plain ASGI app that
+campusiq/asgi.py puts in front of Django for STREAM_PATH. An open stream
+is one idle coroutine + queue; with the "database" backend, one pump per
+process reads InboxEvent for all of them (see permissions/events.py).
+Under WSGI the path is not served and the dashboard keeps polling.
+"""
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.db import close_old_connections
+
+from .events import DatabasePump, backend_name, hub
+
+
+STREAM_PATH = "/permissions/events/"
+HEARTBEAT_SECONDS = 15
+
+
+def _user_id_from_scope(scope):
+    """Session cookie -> user id (same session + auth hash checks as the views)."""
+    headers = dict(scope.get("headers") or [])
+    cookie = SimpleCookie()
+    cookie.load(headers.get(b"cookie", b"").decode("latin-1"))
+
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+
+    engine = import_module(settings.SESSION_ENGINE)
+    request = SimpleNamespace(session=engine.SessionStore(morsel.value))
+
+    close_old_connections()
+    try:
+        user = auth.get_user(request)
+    finally:
+        close_old_connections()
+    return user.id if user.is_authenticated else None
+
+
+# ---------------- PUMP (database backend) ---------------- #
+
+_pump_task = None
+
+
+def _pump_poll(pump):
+    close_old_connections()
+    try:
+        return pump.poll()
+    finally:
+        close_old_connections()
+
+
+async def _run_pump():
+    global _pump_task
+    pump = DatabasePump()
+    interval = getattr(settings, "INBOX_EVENTS_POLL_SECONDS", 2)
+    poll = sync_to_async(_pump_poll, thread_sensitive=True)
+    try:
+        # stops with the last open stream, the next one starts a new pump
+        while hub.user_ids():
+            await poll(pump)
+            await asyncio.sleep(interval)
+    finally:
+        _pump_task = None
+
+
+def _ensure_pump():
+    global _pump_task
+    if backend_name() == "database" and _pump_task is None:
+        _pump_task = asyncio.ensure_future(_run_pump())
+
+
+# ---------------- STREAM ---------------- #
+
+async def _plain_response(send, status, text):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+    })
+    await send({"type": "http.response.body", "body": text.encode()})
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def inbox_stream(scope, receive, send):
+    if scope.get("method") != "GET":
+        return await _plain_response(send, 405, "Method not allowed")
+
+    user_id = await sync_to_async(_user_id_from_scope, thread_sensitive=True)(scope)
+    if not user_id:
+        return await _plain_response(send, 403, "Login required")
+
+    queue = hub.subscribe(user_id)
+    _ensure_pump()
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),  # nginx: don't buffer the stream
+            ],
+        })
+        await send({"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True})
+
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnected},
+                timeout=HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            if getter in done:
+                event, payload = getter.result()
+                chunk = f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            else:
+                getter.cancel()
+                if disconnected in done:
+                    break
+                chunk = ": ping\n\n"  # keeps proxies from closing an idle stream
+
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(user_id, queue)
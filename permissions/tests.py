@@ -1,3 +1,1372 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from io import BytesIO, StringIO
+import re
+import threading
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import patch
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts import directory
+from accounts.models import UserProfile
+from accounts.pagination import encode_values
+from accounts.tests import profile_lookups
+from accounts.views import latest_change_cursor
+from campusiq.asgi import application
+from . import extraction, search, views
+from .email_utils import queue_email, queue_emails
+from .escalations import DeadlineScheduler, due_queryset, escalate_at_for, run_pass, warn_queryset
+from .events import DatabasePump, hub, publish
+from .extraction_cache import DiskLRUCache, file_sha256
+from .management.commands import send_outbox
+from .models import (
+    AssigneeQueueStats, AttachmentText, InboxEvent, PermissionRequest, RequestHistory, OutboxEmail, SearchDocument,
+)
+from .queue_stats import actual_stats
+
+
+def _user(username, role, dept):
+    u = User.objects.create_user(username=username, password="x", email=f"{username}@campusiq.test")
+    UserProfile.objects.create(
+        user=u, role=role, department=dept,
+        roll_number=username if role == "student" else None,
+    )
+    return u
+
+
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class ConcurrentEscalationTests(TransactionTestCase):
+    """
+    Runs several run_pass() workers at the same time against one dataset and
+    checks every request is warned / escalated exactly once.
+    Needs a DB with SKIP LOCKED (MySQL 8, PostgreSQL).
+    """
+
+    WORKERS = 4
+    PER_DEPT = 30
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.warn_ids = []
+        self.due_ids = []
+
+        for dept in ("CSE", "ECE"):
+            student = _user(f"stu-{dept}", "student", dept)
+            proctor = _user(f"proctor-{dept}", "proctor", dept)
+            _user(f"hod-{dept}", "hod", dept)
+
+            for i in range(self.PER_DEPT):
+                urgent_soon = i % 2 == 0
+                req = PermissionRequest.objects.create(
+                    student=student,
+                    request_to=proctor,
+                    title=f"{dept} {i}",
+                    reason="test",
+                    from_date=date.today(),
+                    to_date=date.today(),
+                    current_level="proctor",
+                    is_urgent=urgent_soon,
+                    escalate_at=(
+                        self.now + timedelta(minutes=3) if urgent_soon
+                        else self.now - timedelta(minutes=1)
+                    ),
+                )
+                (self.warn_ids if urgent_soon else self.due_ids).append(req.id)
+
+    def _run_workers(self, kwargs_list):
+        barrier = threading.Barrier(len(kwargs_list))
+        results = []
+        errors = []
+
+        def worker(kwargs):
+            try:
+                barrier.wait()
+                results.append(run_pass(self.now, chunk_size=4, **kwargs))
+            except Exception as e:  # pragma: no cover - surfaced below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(kw,)) for kw in kwargs_list]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        return results
+
+    def _assert_exactly_once(self, results):
+        self.assertEqual(sum(r[0] for r in results), len(self.warn_ids))
+        self.assertEqual(sum(r[1] for r in results), len(self.due_ids))
+
+        warned = Counter(
+            RequestHistory.objects.filter(action="urgent_warning").values_list("request_id", flat=True)
+        )
+        escalated = Counter(
+            RequestHistory.objects.filter(action="auto_escalated").values_list("request_id", flat=True)
+        )
+        self.assertEqual(warned, Counter(self.warn_ids))
+        self.assertEqual(escalated, Counter(self.due_ids))
+
+        self.assertEqual(
+            PermissionRequest.objects.filter(id__in=self.due_ids, current_level="hod").count(),
+            len(self.due_ids),
+        )
+        # one warning mail + (student mail, assignee mail) per escalation
+        self.assertEqual(
+            OutboxEmail.objects.count(),
+            len(self.warn_ids) + 2 * len(self.due_ids),
+        )
+
+    def test_parallel_workers_handle_each_request_once(self):
+        results = self._run_workers([{}] * self.WORKERS)
+        self._assert_exactly_once(results)
+
+    def test_shards_and_departments_partition_the_work(self):
+        results = self._run_workers(
+            [{"shard": (n, 3)} for n in range(3)]
+            + [{"department": "CSE"}, {"department": "ECE"}]
+        )
+        self._assert_exactly_once(results)
+
+    def test_second_pass_is_a_no_op(self):
+        self._run_workers([{}] * self.WORKERS)
+        warned, escalated, _ = run_pass(self.now)
+        self.assertEqual((warned, escalated), (0, 0))
+
+
+class DeadlineSchedulerTests(TestCase):
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.proctor = _user("proc", "proctor", "CSE")
+        self.req = PermissionRequest.objects.create(
+            student=self.student, request_to=self.proctor, title="t", reason="-",
+            from_date=date.today(), to_date=date.today(), current_level="proctor",
+            escalate_at=timezone.now() - timedelta(minutes=1),
+        )
+
+    def _tick(self, scheduler, now):
+        due = scheduler.pop_due(now)
+        keys = scheduler.keys(due)
+        run_pass(now, ids=due)
+        scheduler.refresh()
+        return scheduler.retry(keys, now)
+
+    def test_due_request_without_target_is_retried_with_backoff(self):
+        scheduler = DeadlineScheduler(retry_seconds=60, max_retry_seconds=150)
+        scheduler.load()
+        now = timezone.now()
+
+        # no HOD in CSE yet -> nothing to escalate to
+        self.assertEqual(self._tick(scheduler, now), 1)
+        self.assertEqual(scheduler.next_deadline(), now + timedelta(seconds=60))
+        later = now + timedelta(seconds=60)
+        self.assertEqual(self._tick(scheduler, later), 1)
+        self.assertEqual(scheduler.next_deadline(), later + timedelta(seconds=120))
+        later += timedelta(seconds=120)
+        self.assertEqual(self._tick(scheduler, later), 1)
+        self.assertEqual(scheduler.next_deadline(), later + timedelta(seconds=150))   # capped
+
+        hod = _user("hod", "hod", "CSE")
+        later += timedelta(seconds=150)
+        self.assertEqual(self._tick(scheduler, later), 0)
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.request_to_id, hod.id)
+        self.assertEqual(len(scheduler), 0)
+
+    def test_urgent_minutes_default_matches_settings(self):
+        with override_settings():
+            del settings.URGENT_MIN_MINUTES
+            now = timezone.now()
+            self.assertEqual(escalate_at_for(True, "x", now=now), now + timedelta(minutes=5))
+        self.assertEqual(settings.URGENT_MIN_MINUTES, 5)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAINs every hot PermissionRequest / RequestHistory query shape on a
+    seeded DB and fails if one of them falls back to a full table scan.
+    """
+
+    USERS = 40
+    REQUESTS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        students = [_user(f"s{i}", "student", "CSE") for i in range(cls.USERS)]
+        staff = [_user(f"t{i}", "proctor", "CSE") for i in range(cls.USERS)]
+
+        reqs = []
+        for i in range(cls.REQUESTS):
+            reqs.append(PermissionRequest(
+                request_code=f"REQ-{i + 1:06d}",
+                student=students[i % cls.USERS],
+                request_to=staff[(i * 7) % cls.USERS],
+                title=f"Request {i}",
+                reason="seed",
+                from_date=date.today(),
+                to_date=date.today(),
+                status=("pending", "approved", "rejected")[i % 3],
+                current_level="proctor",
+                is_urgent=i % 5 == 0,
+                escalate_at=now + timedelta(minutes=i - cls.REQUESTS // 2),
+                warning_sent_at=now if i % 10 == 0 else None,
+            ))
+        PermissionRequest.objects.bulk_create(reqs)
+
+        history = []
+        for req in PermissionRequest.objects.only("id"):
+            history.append(RequestHistory(request=req, action="created"))
+            if req.id % 4 == 0:
+                history.append(RequestHistory(request=req, action="auto_escalated"))
+        RequestHistory.objects.bulk_create(history)
+
+        cls.student = students[0]
+        cls.staff = staff[0]
+        cls.sample = PermissionRequest.objects.filter(request_to=cls.staff).first()
+
+    def setUp(self):
+        with connection.cursor() as cur:
+            if connection.vendor == "postgresql":
+                # tiny tables make seq scans "cheaper"; we want to know if an index CAN be used
+                cur.execute("SET enable_seqscan = off")
+            elif connection.vendor == "mysql":
+                cur.execute("ANALYZE TABLE permissions_permissionrequest, permissions_requesthistory")
+            elif connection.vendor == "sqlite":
+                cur.execute("ANALYZE")
+
+    # ---------------- plan parsing ---------------- #
+
+    def _full_scans(self, qs):
+        vendor = connection.vendor
+
+        if vendor == "mysql":
+            found = []
+
+            def walk(node):
+                if isinstance(node, dict):
+                    if node.get("access_type") == "ALL":
+                        found.append(node.get("table_name", "?"))
+                    for v in node.values():
+                        walk(v)
+                elif isinstance(node, list):
+                    for v in node:
+                        walk(v)
+
+            walk(json.loads(qs.explain(format="json")))
+            return [t for t in found if t.startswith("permissions_")]
+
+        plan = qs.explain()
+        if vendor == "postgresql":
+            return re.findall(r"Seq Scan on (permissions_\w+)", plan)
+        if vendor == "sqlite":
+            scans = []
+            for line in plan.splitlines():
+                m = re.search(r"\bSCAN (?:TABLE )?(permissions_\w+)(.*)", line)
+                if m and "INDEX" not in m.group(2):
+                    scans.append(m.group(1))
+            return scans
+
+        self.skipTest(f"no plan parser for {vendor}")
+
+    def assertUsesIndex(self, qs):
+        scans = self._full_scans(qs)
+        self.assertEqual(scans, [], f"full scan on {scans}:\n{qs.explain()}")
+
+    # ---------------- hot query shapes ---------------- #
+
+    def test_escalation_due(self):
+        self.assertUsesIndex(due_queryset(timezone.now()))
+
+    def test_escalation_warning_window(self):
+        self.assertUsesIndex(warn_queryset(timezone.now()))
+
+    def test_dashboard_received(self):
+        qs = (
+            PermissionRequest.objects
+            .filter(request_to=self.staff)
+            .select_related("student")
+            .annotate(
+                is_urgent_rank=Case(
+                    When(is_urgent=True, status="pending", then=Value(0)),
+                    When(status="pending", then=Value(1)),
+                    When(status="approved", then=Value(2)),
+                    When(status="rejected", then=Value(3)),
+                    default=Value(9),
+                    output_field=IntegerField(),
+                ),
+            )
+            .order_by("is_urgent_rank", "-was_auto_escalated", "-applied_at")
+        )
+        self.assertUsesIndex(qs)
+
+    def test_dashboard_received_pending_count(self):
+        qs = PermissionRequest.objects.filter(request_to=self.staff, status="pending", current_level="proctor")
+        self.assertUsesIndex(qs)
+
+    def test_dashboard_submitted(self):
+        qs = PermissionRequest.objects.filter(student=self.student).select_related("request_to").order_by("-applied_at")
+        self.assertUsesIndex(qs)
+
+    def test_history_auto_escalated_exists(self):
+        qs = RequestHistory.objects.filter(request_id=self.sample.id, action="auto_escalated")
+        self.assertUsesIndex(qs)
+
+    def test_track_request_history(self):
+        qs = RequestHistory.objects.filter(request=self.sample).order_by("created_at")
+        self.assertUsesIndex(qs)
+
+    def test_escalation_daemon_cursor(self):
+        since = timezone.now() - timedelta(minutes=5)
+        qs = (
+            PermissionRequest.objects
+            .filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=0))
+            .order_by("updated_at", "id")
+        )
+        self.assertUsesIndex(qs)
+
+
+class FlakyEmailBackend(BaseEmailBackend):
+    """Test backend: raises what FlakyEmailBackend.errors holds for each send, in turn."""
+
+    errors = []
+
+    def send_messages(self, messages):
+        error = FlakyEmailBackend.errors.pop(0) if FlakyEmailBackend.errors else None
+        if error:
+            raise error
+        mail.outbox.extend(messages)
+        return len(messages)
+
+
+class SendOutboxTests(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        FlakyEmailBackend.errors = []
+
+    def _send(self, **options):
+        call_command("send_outbox", stdout=StringIO(), **options)
+
+    def test_sends_due_rows_over_one_connection(self):
+        queue_emails([(f"s{i}", "body", f"u{i}@campusiq.test") for i in range(5)])
+        OutboxEmail.objects.create(subject="later", message="-", to_email="x@campusiq.test",
+                                   next_attempt_at=timezone.now() + timedelta(hours=1))
+
+        with patch("permissions.management.commands.send_outbox.get_connection",
+                   wraps=send_outbox.get_connection) as connect:
+            self._send(batch_size=2)
+        self.assertEqual(connect.call_count, 1)
+
+        self.assertEqual(sorted(m.subject for m in mail.outbox), ["s0", "s1", "s2", "s3", "s4"])
+        self.assertEqual(
+            Counter(OutboxEmail.objects.values_list("status", "attempts")),
+            Counter({("sent", 1): 5, ("pending", 0): 1}),
+        )
+
+    @override_settings(EMAIL_BACKEND="permissions.tests.FlakyEmailBackend")
+    def test_failures_back_off_then_fail(self):
+        row = queue_email("s", "body", "u@campusiq.test")
+        FlakyEmailBackend.errors = [OSError("smtp down")] * 3
+
+        for attempt, delay in ((1, 60), (2, 120)):
+            started = timezone.now()
+            self._send(backoff_seconds=60, max_attempts=3)
+            row.refresh_from_db()
+            self.assertEqual((row.status, row.attempts, row.last_error), ("pending", attempt, "smtp down"))
+            self.assertAlmostEqual(row.next_attempt_at, started + timedelta(seconds=delay),
+                                   delta=timedelta(seconds=5))
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+
+        self._send(backoff_seconds=60, max_attempts=3)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ("failed", 3))
+        self.assertEqual(mail.outbox, [])
+
+    @override_settings(EMAIL_BACKEND="permissions.tests.FlakyEmailBackend")
+    def test_worker_dying_mid_batch_keeps_what_was_sent(self):
+        first, second = queue_email("a", "-", "a@campusiq.test"), queue_email("b", "-", "b@campusiq.test")
+        FlakyEmailBackend.errors = [None, SystemExit()]
+
+        with self.assertRaises(SystemExit):
+            self._send()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, "sent")
+        self.assertEqual(second.status, "sending")   # leased, not re-sent by the next run
+        self._send()
+        self.assertEqual(len(mail.outbox), 1)
+
+        # the lease runs out -> delivered by the next run
+        OutboxEmail.objects.filter(id=second.id).update(next_attempt_at=timezone.now())
+        self._send()
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.attempts), ("sent", 2))
+        self.assertEqual([m.subject for m in mail.outbox], ["a", "b"])
+
+
+@override_settings(INBOX_EVENTS_BACKEND="local")
+class InboxStreamTests(TransactionTestCase):
+    """
+    Drives the SSE endpoint through the ASGI app with the local backend:
+    a forward made by the proctor must be pushed to the HOD's open stream.
+    """
+
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.proctor = _user("proctor", "proctor", "CSE")
+        self.hod = _user("hod", "hod", "CSE")
+        self.req = PermissionRequest.objects.create(
+            student=self.student,
+            request_to=self.proctor,
+            title="Stream",
+            reason="test",
+            from_date=date.today(),
+            to_date=date.today(),
+            current_level="proctor",
+        )
+
+    def _scope(self, user=None):
+        headers = []
+        if user is not None:
+            self.client.force_login(user)
+            cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+            headers.append((b"cookie", f"{settings.SESSION_COOKIE_NAME}={cookie}".encode()))
+        return {"type": "http", "method": "GET", "path": "/permissions/events/", "headers": headers}
+
+    def _forward(self):
+        try:
+            self.client.force_login(self.proctor)
+            r = self.client.post(
+                f"/permissions/requests/{self.req.id}/forward-do/",
+                {"target_role": "hod", "target_user_id": self.hod.id},
+            )
+            self.assertEqual(r.json()["ok"], True)
+        finally:
+            connection.close()  # runs in a worker thread
+
+    def test_forward_is_pushed_to_the_new_assignee(self):
+        scope = self._scope(self.hod)
+
+        async def scenario():
+            incoming = asyncio.Queue()
+            sent = []
+            got_event = asyncio.Event()
+
+            async def send(message):
+                sent.append(message)
+                if b"event: forwarded" in message.get("body", b""):
+                    got_event.set()
+
+            stream = asyncio.ensure_future(application(scope, incoming.get, send))
+            while self.hod.id not in hub.user_ids():
+                await asyncio.sleep(0.01)
+
+            await sync_to_async(self._forward, thread_sensitive=False)()
+            await asyncio.wait_for(got_event.wait(), timeout=5)
+
+            await incoming.put({"type": "http.disconnect"})
+            await asyncio.wait_for(stream, timeout=5)
+            return sent
+
+        sent = asyncio.run(scenario())
+
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertIn((b"content-type", b"text/event-stream"), sent[0]["headers"])
+        body = b"".join(m.get("body", b"") for m in sent[1:]).decode()
+        data = json.loads(body.split("event: forwarded\ndata: ")[1].split("\n")[0])
+        self.assertEqual(data["id"], self.req.id)
+        self.assertEqual(data["to_user_id"], self.hod.id)
+        self.assertNotIn(self.hod.id, hub.user_ids())
+
+    def test_anonymous_stream_is_refused(self):
+        async def scenario():
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            async def receive():
+                return {"type": "http.disconnect"}
+
+            await application(self._scope(), receive, send)
+            return sent
+
+        sent = asyncio.run(scenario())
+        self.assertEqual(sent[0]["status"], 403)
+
+    @override_settings(INBOX_EVENTS_BACKEND="database")
+    def test_database_pump_fans_out_to_subscribers(self):
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            queue = hub.subscribe(self.hod.id)
+            pump = DatabasePump()
+
+            publish([self.hod.id, self.proctor.id], "forwarded", {"id": self.req.id})
+            self.assertEqual(pump.poll(), 1)  # proctor has no open stream
+            self.assertEqual(pump.poll(), 0)  # overlap re-read is not re-delivered
+
+            event, payload = loop.run_until_complete(asyncio.wait_for(queue.get(), 1))
+            self.assertEqual((event, payload), ("forwarded", {"id": self.req.id}))
+            hub.unsubscribe(self.hod.id, queue)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    @override_settings(INBOX_EVENTS_BACKEND="database")
+    def test_database_pump_delivers_rows_that_commit_late(self):
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            queue = hub.subscribe(self.hod.id)
+            pump = DatabasePump()
+            self.assertEqual(pump.poll(), 0)
+
+            # written 30s ago by a transaction that only commits now
+            InboxEvent.objects.create(
+                user=self.hod, event="forwarded", payload="{}",
+                created_at=timezone.now() - timedelta(seconds=30),
+            )
+            self.assertEqual(pump.poll(), 1)
+            self.assertEqual(pump.poll(), 0)
+            hub.unsubscribe(self.hod.id, queue)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    @override_settings(INBOX_EVENTS_BACKEND="database", INBOX_EVENTS_RETENTION_MINUTES=10)
+    def test_events_are_pruned_without_an_open_stream(self):
+        publish([self.hod.id], "forwarded", {"id": self.req.id})
+        InboxEvent.objects.update(created_at=timezone.now() - timedelta(minutes=11))
+        publish([self.hod.id], "forwarded", {"id": self.req.id})
+
+        call_command("send_outbox", stdout=StringIO())
+        self.assertEqual(InboxEvent.objects.count(), 1)
+
+    @override_settings(INBOX_EVENTS_BACKEND="none")
+    def test_none_backend_writes_nothing(self):
+        self.assertEqual(publish([self.hod.id], "forwarded", {"id": self.req.id}), 0)
+        self.assertFalse(InboxEvent.objects.exists())
+
+
+class QueueStatsTests(TestCase):
+    """
+    Walks requests through the views and run_escalations and checks the
+    incrementally kept AssigneeQueueStats against a full recount.
+    """
+
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.proctor = _user("proctor", "proctor", "CSE")
+        self.hod = _user("hod", "hod", "CSE")
+        _user("dean", "dean", "CSE")
+
+    def _submit(self, urgent=False):
+        self.client.force_login(self.student)
+        self.client.post("/accounts/request_permission/", {
+            "request_to": self.proctor.id, "title": "t", "reason": "r",
+            "from_date": "2026-01-01", "to_date": "2026-01-02",
+            **({"is_urgent": "on", "urgent_minutes": "5"} if urgent else {}),
+        })
+        return PermissionRequest.objects.latest("id")
+
+    maxDiff = None
+
+    def assertStatsMatch(self):
+        stored = {
+            (s.user_id, s.level): {f: getattr(s, f) for f in actual_stats().get((s.user_id, s.level), {})}
+            for s in AssigneeQueueStats.objects.all()
+        }
+        self.assertEqual({k: v for k, v in stored.items() if v}, actual_stats())
+        call_command("rebuild_queue_stats", check=True, stdout=StringIO())
+
+    def test_counters_follow_the_request_lifecycle(self):
+        a, b, c, d = self._submit(), self._submit(urgent=True), self._submit(), self._submit()
+        self.assertStatsMatch()
+
+        self.client.force_login(self.proctor)
+        self.client.post(f"/permissions/requests/{a.id}/forward-do/",
+                         {"target_role": "hod", "target_user_id": self.hod.id})
+        self.client.post("/permissions/bulk-forward/",
+                         {"request_ids": [c.id], "target_role": "hod", "target_user_id": self.hod.id})
+        self.client.get(f"/permissions/reject/{d.id}/")
+        self.assertStatsMatch()
+
+        self.client.force_login(self.hod)
+        self.client.get(f"/permissions/approve/{a.id}/")
+        self.client.post(f"/permissions/reassign/{c.id}/do/", {"target_user_id": self.proctor.id})
+        self.assertStatsMatch()
+
+        PermissionRequest.objects.filter(id=b.id).update(escalate_at=timezone.now() - timedelta(minutes=1))
+        run_pass()
+        self.assertStatsMatch()
+
+        self.client.force_login(self.student)
+        self.client.post(f"/permissions/delete/{c.id}/")
+        self.assertStatsMatch()
+
+        stats = AssigneeQueueStats.objects.get(user=self.proctor, level="proctor")
+        self.assertEqual((stats.pending, stats.rejected), (0, 1))
+        self.assertIsNone(stats.oldest_pending_at)
+
+        self.client.force_login(self.hod)
+        self.assertEqual(
+            self.client.get("/accounts/dashboard/").context["received_counts"],
+            {"pending": 1, "approved": 1, "rejected": 0},
+        )
+
+    def _escalated_before_lock(self, req):
+        """Runs run_escalations on `req` just before the view locks it."""
+        real = views._locked_request
+
+        def locked(**lookup):
+            PermissionRequest.objects.filter(id=req.id).update(escalate_at=timezone.now() - timedelta(minutes=1))
+            run_pass()
+            return real(**lookup)
+
+        return patch("permissions.views._locked_request", side_effect=locked)
+
+    def test_views_act_on_the_row_as_it_is_when_locked(self):
+        a, b, c = self._submit(), self._submit(), self._submit()
+        self.client.force_login(self.proctor)
+
+        with self._escalated_before_lock(a):
+            self.client.get(f"/permissions/approve/{a.id}/")
+        a.refresh_from_db()
+        self.assertEqual((a.request_to_id, a.current_level, a.status), (self.hod.id, "hod", "approved"))
+        self.assertStatsMatch()
+
+        with self._escalated_before_lock(b):
+            response = self.client.post(f"/permissions/requests/{b.id}/forward-do/",
+                                        {"target_role": "hod", "target_user_id": self.hod.id})
+        self.assertEqual(response.status_code, 403)
+        b.refresh_from_db()
+        self.assertEqual((b.request_to_id, b.escalation_count), (self.hod.id, 1))
+        self.assertStatsMatch()
+
+        with self._escalated_before_lock(c):
+            response = self.client.post(f"/permissions/reassign/{c.id}/do/", {"target_user_id": self.hod.id})
+        self.assertEqual(response.status_code, 403)
+        self.assertStatsMatch()
+
+        self.client.force_login(self.hod)
+        self.client.post(f"/permissions/requests/{c.id}/forward-do/",
+                         {"target_role": "dean", "target_user_id": User.objects.get(username="dean").id})
+        c.refresh_from_db()
+        self.assertEqual((c.current_level, c.escalation_count), ("dean", 2))
+        self.assertStatsMatch()
+
+    def test_rebuild_fixes_drift(self):
+        self._submit()
+        AssigneeQueueStats.objects.update(pending=7)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_queue_stats", check=True, stdout=StringIO())
+
+        call_command("rebuild_queue_stats", stdout=StringIO())
+        self.assertStatsMatch()
+
+
+class ProfileLookupTests(TestCase):
+    """Each view resolves the signed-in user's profile once (request.profile)."""
+
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.proctor = _user("proc", "proctor", "CSE")
+        self.hod = _user("hod", "hod", "CSE")
+        self.req = PermissionRequest.objects.create(
+            student=self.student, request_to=self.proctor, title="t", reason="-",
+            from_date=date.today(), to_date=date.today(), current_level="proctor",
+        )
+        directory.targets()  # built here, not counted against the views
+
+    def test_views_look_the_profile_up_once(self):
+        self.client.force_login(self.proctor)
+        pk = self.req.id
+        for method, path, data in (
+            ("get", f"/permissions/requests/{pk}/forward-ui/", {"role": "hod"}),
+            ("get", f"/permissions/reassign/{pk}/", None),
+            ("get", "/permissions/changes/", {"cursor": latest_change_cursor(self.proctor), "gen": "stale"}),
+            ("post", f"/permissions/requests/{pk}/forward-do/", {"target_role": "hod", "target_user_id": self.hod.id}),
+        ):
+            response, lookups = profile_lookups(self.client, method, path, data)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(lookups, 1, path)
+
+
+class ChangesSinceTests(TestCase):
+    """Polling only reads and reports the caller's own requests."""
+
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.proctor = _user("proc", "proctor", "CSE")
+        self.hod = _user("hod", "hod", "CSE")
+        self.other_proctor = _user("proc2", "proctor", "ECE")
+        self.other_student = _user("stu2", "student", "ECE")
+        directory.targets()
+        self.cursor = encode_values([timezone.now() - timedelta(minutes=1), 0])
+
+    def _request(self, student, to):
+        return PermissionRequest.objects.create(
+            student=student, request_to=to, title="t", reason="-",
+            from_date=date.today(), to_date=date.today(), current_level="proctor",
+        )
+
+    def _poll(self, user):
+        self.client.force_login(user)
+        response = self.client.get("/permissions/changes/", {"cursor": self.cursor, "gen": "stale"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_other_users_requests_are_not_reported(self):
+        mine = self._request(self.student, self.proctor)
+        theirs = self._request(self.other_student, self.other_proctor)
+
+        data = self._poll(self.proctor)
+        self.assertEqual([r["id"] for r in data["rows"]], [mine.id])
+        self.assertNotIn(theirs.id, data["removed"])
+        self.assertFalse(data["more"])
+
+    def test_forwarded_request_is_removed_for_the_forwarder(self):
+        req = self._request(self.student, self.proctor)
+        self.client.force_login(self.proctor)
+        self.client.post(
+            f"/permissions/requests/{req.id}/forward-do/",
+            {"target_role": "hod", "target_user_id": self.hod.id},
+        )
+
+        self.assertEqual(self._poll(self.proctor)["removed"], [req.id])
+        self.assertEqual([r["id"] for r in self._poll(self.hod)["rows"]], [req.id])
+
+    def test_escalated_request_is_removed_for_the_previous_assignee(self):
+        req = self._request(self.student, self.proctor)
+        req.escalate_at = timezone.now() - timedelta(minutes=1)
+        req.save(update_fields=["escalate_at"])
+        run_pass()
+
+        req.refresh_from_db()
+        self.assertEqual(req.request_to_id, self.hod.id)
+        self.assertEqual(self._poll(self.proctor)["removed"], [req.id])
+
+    def test_wrongly_typed_cursor_is_rejected(self):
+        self.client.force_login(self.proctor)
+        for values in (["2020-01-01", 0], [timezone.now(), "0"], [timezone.now(), False]):
+            with self.subTest(values=values):
+                response = self.client.get("/permissions/changes/", {"cursor": encode_values(values)})
+                self.assertEqual(response.status_code, 400)
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.proctor = _user("proc", "proctor", "CSE")
+        self.hod = _user("hod", "hod", "CSE")
+        directory.targets()
+
+    def _pending(self, n):
+        ids = [
+            PermissionRequest.objects.create(
+                student=self.student, request_to=self.proctor, title=f"r{i}", reason="-",
+                from_date=date.today(), to_date=date.today(), current_level="proctor",
+            ).id
+            for i in range(n)
+        ]
+        call_command("rebuild_queue_stats", stdout=StringIO())
+        return ids
+
+    def _forward(self, ids):
+        self.client.force_login(self.proctor)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/permissions/bulk-forward/", {
+                "request_ids": ids, "target_role": "hod", "target_user_id": self.hod.id,
+            })
+        return response.json(), len(queries)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self._forward(self._pending(1))  # first stats rows, session
+        _, few = self._forward(self._pending(3))
+        data, many = self._forward(self._pending(60))
+        self.assertEqual(data["updated"], 60)
+        self.assertEqual(few, many)
+
+    def test_one_digest_mail_and_history_per_request(self):
+        ids = self._pending(5)
+        OutboxEmail.objects.all().delete()
+
+        data, _ = self._forward(ids + [999999])
+
+        self.assertEqual((data["updated"], data["skipped"]), (5, [999999]))
+        self.assertEqual(
+            PermissionRequest.objects.filter(id__in=ids, request_to=self.hod, current_level="hod",
+                                             escalation_count=1).count(),
+            5,
+        )
+        self.assertEqual(RequestHistory.objects.filter(request_id__in=ids, action="forwarded").count(), 5)
+
+        mails = list(OutboxEmail.objects.all())
+        self.assertEqual(len(mails), 1)
+        self.assertEqual(mails[0].to_email, self.hod.email)
+        for req in PermissionRequest.objects.filter(id__in=ids):
+            self.assertIn(req.request_code, mails[0].message)
+
+        pending = dict(AssigneeQueueStats.objects.values_list("level", "pending"))
+        self.assertEqual(pending, {"proctor": 0, "hod": 5})
+
+        # a second forward of the same ids finds nothing left to move
+        self.assertEqual(self._forward(ids)[0]["skipped"], ids)
+
+    def test_bulk_approve_and_reject(self):
+        ids = self._pending(6)
+        other = self._pending(1)
+        PermissionRequest.objects.filter(id__in=other).update(request_to=self.hod, current_level="hod")
+        call_command("rebuild_queue_stats", stdout=StringIO())
+        OutboxEmail.objects.all().delete()
+        self.client.force_login(self.proctor)
+
+        data = self.client.post("/permissions/bulk-approve/", {"request_ids": ids[:4] + other}).json()
+        self.assertEqual((data["updated"], data["skipped"]), (4, other))
+
+        # already approved ones are skipped, the rest rejected
+        data = self.client.post("/permissions/bulk-reject/", {"request_ids": ids}).json()
+        self.assertEqual((data["updated"], data["skipped"]), (2, ids[:4]))
+
+        statuses = dict(PermissionRequest.objects.filter(id__in=ids).values_list("id", "status"))
+        self.assertEqual(statuses, {**{i: "approved" for i in ids[:4]}, **{i: "rejected" for i in ids[4:]}})
+        self.assertEqual(
+            RequestHistory.objects.filter(request_id__in=ids, action__in=("approved", "rejected")).count(), 6
+        )
+        self.assertEqual(OutboxEmail.objects.filter(to_email=self.student.email).count(), 6)
+
+        stats = AssigneeQueueStats.objects.get(user=self.proctor, level="proctor")
+        self.assertEqual((stats.pending, stats.approved, stats.rejected), (0, 4, 2))
+
+    def test_students_cannot_bulk_approve(self):
+        ids = self._pending(1)
+        self.client.force_login(self.student)
+        response = self.client.post("/permissions/bulk-approve/", {"request_ids": ids})
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkSubmitTests(TestCase):
+    def setUp(self):
+        self.staff = _user("staff", "staff", "CSE")
+        self.hod = _user("hod", "hod", "CSE")
+        self.rolls = [_user(f"21CS{i:03d}", "student", "CSE").username for i in range(40)]
+        _user("21EC001", "student", "ECE")
+        directory.targets()
+        self.client.force_login(self.staff)
+
+    def _post(self, rolls, **extra):
+        data = {
+            "roll_csv": SimpleUploadedFile("class.csv", ("roll_number\n" + "\n".join(rolls)).encode()),
+            "request_to": self.hod.id,
+            "title": "Sports meet",
+            "reason": "Inter-college sports meet",
+            "from_date": str(date.today()),
+            "to_date": str(date.today() + timedelta(days=1)),
+            **extra,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/accounts/request_permission/bulk/", data)
+        return response, len(queries)
+
+    def test_creates_every_request_with_bulk_writes(self):
+        OutboxEmail.objects.all().delete()
+        response, _ = self._post(self.rolls + self.rolls[:3])  # duplicates are dropped
+        self.assertEqual(response.status_code, 302)
+
+        reqs = PermissionRequest.objects.filter(request_to=self.hod)
+        self.assertEqual(reqs.count(), 40)
+        self.assertEqual(
+            sorted(reqs.values_list("student__username", flat=True)), sorted(self.rolls)
+        )
+        codes = set(reqs.values_list("request_code", flat=True))
+        self.assertEqual(len(codes), 40)
+        self.assertTrue(all(c.startswith("REQ-") for c in codes))
+        self.assertEqual(RequestHistory.objects.filter(request__in=reqs, action="created").count(), 40)
+        self.assertEqual(list(OutboxEmail.objects.values_list("to_email", flat=True)), [self.hod.email])
+        self.assertEqual(AssigneeQueueStats.objects.get(user=self.hod, level="hod").pending, 40)
+
+    @override_settings(CODE_BLOCK_SIZE=1)  # every submission reserves exactly one block
+    def test_query_count_does_not_grow_with_the_class(self):
+        self._post(self.rolls[:1])  # first stats row, session
+        _, few = self._post(self.rolls[1:4])
+        _, many = self._post(self.rolls[4:])
+        self.assertEqual(few, many)
+
+    def test_nothing_is_created_when_anything_is_invalid(self):
+        response, _ = self._post(self.rolls[:5] + ["21EC001", "NOPE"], from_date="2030-01-02", to_date="2030-01-01")
+        self.assertEqual(response.status_code, 400)
+        errors = response.context["errors"]
+        self.assertEqual(len(errors), 2)
+        self.assertIn("21EC001, NOPE", errors[1])
+        self.assertFalse(PermissionRequest.objects.exists())
+
+    def test_command_and_benchmark(self):
+        path = os.path.join(tempfile.mkdtemp(), "class.csv")
+        with open(path, "w") as f:
+            f.write("\n".join(self.rolls[:10]))
+
+        call_command(
+            "bulk_submit_requests", path, by="staff", to="hod", title="Industrial visit",
+            reason="Visit", from_date=str(date.today()), to_date=str(date.today()), stdout=StringIO(),
+        )
+        self.assertEqual(PermissionRequest.objects.count(), 10)
+
+        out = StringIO()
+        call_command("benchmark_bulk_submit", students=5, stdout=out)
+        self.assertIn("Speed-up", out.getvalue())
+        self.assertEqual(PermissionRequest.objects.count(), 10)  # rolled back
+
+
+def _pdf_bytes(pages):
+    from reportlab.pdfgen import canvas
+
+    buf = BytesIO()
+    c = canvas.Canvas(buf)
+    for text in pages:
+        c.drawString(72, 720, text)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _docx_bytes(text):
+    import docx
+
+    buf = BytesIO()
+    d = docx.Document()
+    d.add_paragraph(text)
+    d.save(buf)
+    return buf.getvalue()
+
+
+# parsed in-process here, PdfProcessPoolTests covers the pool
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), EXTRACTION_CACHE_DIR=tempfile.mkdtemp(), EXTRACTION_WORKERS=0)
+class AttachmentExtractionTests(TestCase):
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.proctor = _user("proc", "proctor", "CSE")
+        directory.targets()
+
+    def _submit(self, name, content):
+        self.client.force_login(self.student)
+        self.client.post("/accounts/request_permission/", {
+            "request_to": self.proctor.id, "title": "Letter", "reason": "-",
+            "from_date": str(date.today()), "to_date": str(date.today()),
+            "permission_file": SimpleUploadedFile(name, content),
+        })
+        return PermissionRequest.objects.latest("id")
+
+    def _extract(self):
+        call_command("extract_attachments", stdout=StringIO())
+
+    def test_pdf_text_is_extracted_once_and_read_by_view_request(self):
+        req = self._submit("letter.pdf", _pdf_bytes(["Sports meet page one", "Page two"]))
+        self.assertEqual(AttachmentText.objects.get(request=req).status, "pending")
+
+        self.client.force_login(self.proctor)
+        response = self.client.get(f"/permissions/view/{req.id}/")
+        self.assertIn("still being extracted", response.content.decode())
+
+        self._extract()
+        row = AttachmentText.objects.get(request=req)
+        self.assertEqual((row.status, row.page_count, row.attempts), ("done", 2, 1))
+        self.assertIn("Sports meet page one", row.text)
+
+        with patch("permissions.extraction.extract_text") as parse:
+            response = self.client.get(f"/permissions/view/{req.id}/")
+        parse.assert_not_called()
+        self.assertIn("Sports meet page one", response.content.decode())
+        self.assertIn("2 pages", response.content.decode())
+
+        # the text is searchable once extracted
+        found = search.search(self.proctor, "sports meet")
+        self.assertEqual([r.request.id for r in found.results], [req.id])
+        self.assertIn("Sports meet page one", found.results[0].snippet)
+
+        self._extract()  # nothing left to do
+        self.assertEqual(AttachmentText.objects.get(request=req).attempts, 1)
+
+
+    def test_view_request_is_limited_to_people_who_can_see_it(self):
+        req = self._submit("letter.pdf", _pdf_bytes(["Private letter text"]))
+        self._extract()
+
+        self.client.force_login(_user("stu2", "student", "CSE"))
+        self.assertEqual(self.client.get(f"/permissions/view/{req.id}/").status_code, 404)
+
+        self.client.force_login(self.proctor)
+        self.assertIn("Private letter text", self.client.get(f"/permissions/view/{req.id}/").content.decode())
+
+    def test_docx_and_unreadable_files(self):
+        ok = self._submit("letter.docx", _docx_bytes("Industrial visit letter"))
+        bad = self._submit("broken.pdf", b"not a pdf at all")
+        self._extract()
+
+        ok_row = AttachmentText.objects.get(request=ok)
+        self.assertEqual((ok_row.status, ok_row.page_count), ("done", None))
+        self.assertIn("Industrial visit letter", ok_row.text)
+
+        bad_row = AttachmentText.objects.get(request=bad)
+        self.assertEqual(bad_row.status, "failed")
+        self.assertIn("Could not read PDF", bad_row.error)
+
+    def test_rows_of_a_dead_worker_are_claimed_again(self):
+        req = self._submit("letter.pdf", _pdf_bytes(["Retry me"]))
+        AttachmentText.objects.filter(request=req).update(
+            status="processing", attempts=1, started_at=timezone.now() - timedelta(hours=1),
+        )
+        self._extract()
+        row = AttachmentText.objects.get(request=req)
+        self.assertEqual((row.status, row.attempts), ("done", 2))
+
+    @override_settings(EXTRACTION_MAX_ATTEMPTS=3)
+    def test_row_that_never_finishes_is_given_up(self):
+        req = self._submit("letter.pdf", _pdf_bytes(["Hangs the worker"]))
+        AttachmentText.objects.filter(request=req).update(
+            status="processing", attempts=3, started_at=timezone.now() - timedelta(hours=1),
+        )
+        with patch("permissions.extraction.extract_text") as parse:
+            self._extract()
+        parse.assert_not_called()
+
+        row = AttachmentText.objects.get(request=req)
+        self.assertEqual((row.status, row.attempts), ("failed", 3))
+        self.assertIn("gave up", row.error)
+
+        self.client.force_login(self.proctor)
+        page = self.client.get(f"/permissions/view/{req.id}/").content.decode()
+        self.assertNotIn("still being extracted", page)
+        self.assertIn("gave up", page)
+
+    def test_identical_files_are_parsed_once(self):
+        content = _pdf_bytes(["Same circular"])
+        first = self._submit("circular.pdf", content)
+        second = self._submit("circular (1).pdf", content)
+        other = self._submit("other.pdf", _pdf_bytes(["Different"]))
+
+        with patch("permissions.extraction._parse_pdf", wraps=extraction._parse_pdf) as parse:
+            self._extract()
+        self.assertEqual(parse.call_count, 2)
+
+        texts = dict(AttachmentText.objects.values_list("request_id", "text"))
+        self.assertEqual(texts[first.id], texts[second.id])
+        self.assertIn("Same circular", texts[second.id])
+        self.assertIn("Different", texts[other.id])
+
+        # a new extractor version parses again
+        AttachmentText.objects.filter(request=first).update(status="pending")
+        with patch("permissions.extraction.EXTRACTOR_VERSION", 99), \
+                patch("permissions.extraction._parse_pdf", wraps=extraction._parse_pdf) as parse:
+            self._extract()
+        self.assertEqual(parse.call_count, 1)
+
+    @override_settings(EXTRACTION_PAGE_CAP=2)
+    def test_page_cap_keeps_the_first_pages(self):
+        content = _pdf_bytes(["First page", "Second page", "Third page"])
+        req = self._submit("long.pdf", content)
+        self._extract()
+
+        row = AttachmentText.objects.get(request=req)
+        self.assertEqual((row.status, row.page_count, row.truncated, row.error), ("done", 3, True, ""))
+        self.assertIn("Second page", row.text)
+        self.assertNotIn("Third page", row.text)
+
+        self.client.force_login(self.proctor)
+        self.assertIn("Only part of the document", self.client.get(f"/permissions/view/{req.id}/").content.decode())
+
+        # the cut is the same every time -> cached
+        again = self._submit("long (1).pdf", content)
+        with patch("permissions.extraction._parse_pdf") as parse:
+            self._extract()
+        parse.assert_not_called()
+        self.assertTrue(AttachmentText.objects.get(request=again).truncated)
+
+    @override_settings(EXTRACTION_TIME_BUDGET_SECONDS=2.5)
+    def test_time_budget_keeps_the_pages_parsed_so_far(self):
+        content = _pdf_bytes(["First page", "Second page", "Third page"])
+        req = self._submit("slow.pdf", content)
+
+        # every clock read is one second later: pages 1 and 2 fit in the budget
+        clock = SimpleNamespace(time=itertools.count().__next__)
+        with patch.object(extraction, "time", clock):
+            self._extract()
+
+        row = AttachmentText.objects.get(request=req)
+        self.assertEqual((row.status, row.page_count, row.truncated), ("done", 3, True))
+        self.assertIn("Second page", row.text)
+        self.assertNotIn("Third page", row.text)
+        self.assertIn("2 of 3 pages", row.error)
+
+        # depends on load -> not cached, the next upload of it is parsed again
+        self._submit("slow (1).pdf", content)
+        with patch("permissions.extraction._parse_pdf", wraps=extraction._parse_pdf) as parse:
+            self._extract()
+        self.assertEqual(parse.call_count, 1)
+
+
+@override_settings(EXTRACTION_WORKERS=2, EXTRACTION_PAGES_PER_TASK=2)
+class PdfProcessPoolTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(_pdf_bytes([f"Text of page {n}" for n in range(1, 6)]))
+
+    def tearDown(self):
+        extraction._kill_pool()
+        os.remove(self.path)
+
+    def test_page_ranges_in_parallel_match_the_serial_parse(self):
+        pooled = extraction.parse_pdf_pooled(self.path)
+        with open(self.path, "rb") as f:
+            serial = extraction.parse_pdf_serial(f)
+
+        self.assertEqual(pooled, serial)
+        self.assertEqual((pooled.page_count, pooled.truncated, pooled.error), (5, False, None))
+        self.assertLess(pooled.text.index("page 1"), pooled.text.index("page 5"))
+
+    @override_settings(EXTRACTION_PAGE_CAP=3)
+    def test_page_cap(self):
+        result = extraction.parse_pdf_pooled(self.path)
+        self.assertEqual((result.page_count, result.truncated, result.error), (5, True, None))
+        self.assertIn("page 3", result.text)
+        self.assertNotIn("page 4", result.text)
+
+    def test_ranges_past_the_deadline_are_left_out(self):
+        # the deadline is taken from a clock 10s behind: the workers, on the
+        # real clock, see it passed already
+        with patch("permissions.extraction.time.time", return_value=time.time() - 10), \
+                override_settings(EXTRACTION_TIME_BUDGET_SECONDS=5):
+            result = extraction.parse_pdf_pooled(self.path)
+
+        self.assertTrue(result.truncated)
+        self.assertEqual(result.text, "")
+        self.assertIn("0 of 5 pages", result.error)
+
+    @override_settings(EXTRACTION_WORKERS=1)
+    def test_kill_pool_stops_a_running_page(self):
+        pool = extraction._get_pool()
+        worker = pool.apply(os.getpid)
+        pool.apply_async(time.sleep, (60,))
+        time.sleep(0.5)
+
+        started = time.time()
+        extraction._kill_pool()
+        self.assertLess(time.time() - started, 10)
+        self.assertNotIn(worker, [p.pid for p in multiprocessing.active_children()])
+
+
+class DiskLRUCacheTests(SimpleTestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = DiskLRUCache(tempfile.mkdtemp(), max_bytes=1000)
+        for key in ("aa1", "bb2", "cc3"):
+            cache.put(key, ["x" * 200, None, None])
+            os.utime(cache._path(key), (1, {"aa1": 1, "bb2": 2, "cc3": 3}[key]))
+
+        self.assertIsNotNone(cache.get("aa1"))   # now the most recently used
+        cache.put("dd4", ["x" * 400, None, None])
+
+        self.assertIsNone(cache.get("bb2"))
+        self.assertIsNotNone(cache.get("aa1"))
+        self.assertIsNotNone(cache.get("dd4"))
+        self.assertLessEqual(cache.size(), 1000)
+
+    def test_sha256_of_stream(self):
+        self.assertEqual(
+            file_sha256(BytesIO(b"abc")),
+            "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad",
+        )
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.student.first_name, self.student.last_name = "Asha", "Rao"
+        self.student.save()
+        self.other = _user("stu2", "student", "CSE")
+        self.proctor = _user("proc", "proctor", "CSE")
+        self.hod = _user("hod", "hod", "CSE")
+
+        self.hackathon = self._create(self.student, "Hackathon in Pune", "Team event for two days")
+        self.leave = self._create(self.student, "Medical leave", "Fever - will attend the hackathon prep later")
+        self.others = self._create(self.other, "Hackathon volunteering", "Helping the organisers")
+
+    def _create(self, student, title, reason):
+        return PermissionRequest.objects.create(
+            student=student, request_to=self.proctor, title=title, reason=reason,
+            from_date=date.today(), to_date=date.today(),
+        )
+
+    def _ids(self, user, query, **kwargs):
+        return [r.request.id for r in search.search(user, query, **kwargs).results]
+
+    def test_ranked_and_scoped_to_visible_requests(self):
+        # title hits before reason hits; prefixes match
+        self.assertEqual(self._ids(self.student, "hackath"), [self.hackathon.id, self.leave.id])
+        self.assertEqual(self._ids(self.other, "hackathon"), [self.others.id])
+        self.assertEqual(
+            set(self._ids(self.proctor, "hackathon")), {self.hackathon.id, self.leave.id, self.others.id}
+        )
+
+        # every word has to match
+        self.assertEqual(self._ids(self.proctor, "hackathon pune"), [self.hackathon.id])
+
+        # an authority sees what it acted on, even after forwarding it
+        self.assertEqual(self._ids(self.hod, "hackathon"), [])
+        RequestHistory.objects.create(request=self.others, action="forwarded", actor=self.hod)
+        self.assertEqual(self._ids(self.hod, "hackathon"), [self.others.id])
+
+        self.assertEqual(self._ids(self.proctor, "  \"*  "), [])
+
+    def test_student_name_roll_and_code(self):
+        self.assertEqual(set(self._ids(self.proctor, "asha rao")), {self.hackathon.id, self.leave.id})
+        self.assertEqual(self._ids(self.proctor, "stu2"), [self.others.id])
+        self.assertEqual(self._ids(self.proctor, self.leave.request_code), [self.leave.id])
+
+        # a changed name is re-indexed
+        self.other.first_name = "Kiran"
+        self.other.save()
+        self.assertEqual(self._ids(self.proctor, "kiran"), [self.others.id])
+
+    def test_index_follows_saves(self):
+        doc = SearchDocument.objects.get(request=self.leave)
+        indexed_at = doc.indexed_at
+
+        self.leave.status = "approved"
+        self.leave.save()
+        self.assertEqual(SearchDocument.objects.get(request=self.leave).indexed_at, indexed_at)
+
+        self.leave.title = "Sick leave"
+        self.leave.save()
+        self.assertEqual(self._ids(self.student, "sick"), [self.leave.id])
+        self.assertEqual(self._ids(self.student, "medical"), [])
+
+        self.leave.delete()
+        self.assertFalse(SearchDocument.objects.filter(request_id=self.leave.id).exists())
+        self.assertEqual(self._ids(self.student, "sick"), [])
+
+    @override_settings(SEARCH_PAGE_SIZE=2)
+    def test_pages_and_view(self):
+        more = [self._create(self.student, f"Hackathon round {i}", "-") for i in range(3)]
+
+        first = search.search(self.proctor, "hackathon round")
+        second = search.search(self.proctor, "hackathon round", page=2)
+        self.assertTrue(first.has_more)
+        self.assertFalse(second.has_more)
+        self.assertEqual(
+            sorted(r.request.id for r in first.results + second.results), sorted(r.id for r in more)
+        )
+
+        self.client.force_login(self.other)
+        response = self.client.get("/permissions/search/", {"q": "hackathon"})
+        self.assertContains(response, "Hackathon volunteering")
+        self.assertNotContains(response, "Hackathon in Pune")
+
+    def test_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual(self._ids(self.proctor, "hackathon"), [])
+
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(len(self._ids(self.proctor, "hackathon")), 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DownloadTests(TestCase):
+    CONTENT = b"%PDF-1.4 0123456789"
+
+    def setUp(self):
+        self.student = _user("stu", "student", "CSE")
+        self.other = _user("stu2", "student", "CSE")
+        self.proctor = _user("proc", "proctor", "CSE")
+        self.req = PermissionRequest.objects.create(
+            student=self.student, request_to=self.proctor, title="Letter", reason="-",
+            from_date=date.today(), to_date=date.today(),
+            file=SimpleUploadedFile("Leave letter.pdf", self.CONTENT),
+        )
+        self.url = f"/permissions/view/{self.req.id}/file/"
+        self.etag = '"{}"'.format(os.path.basename(self.req.file.name)[:64])
+
+    def _body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_access_is_one_query(self):
+        for user in (self.student, self.proctor):
+            self.client.force_login(user)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self._body(response), self.CONTENT)
+            self.assertEqual(
+                len([q for q in queries if "permissions_permissionrequest" in q["sql"]]), 1
+            )
+
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["Content-Disposition"], 'inline; filename="Leave letter.pdf"')
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(response["Content-Length"], str(len(self.CONTENT)))
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_range_and_conditional_requests(self):
+        self.client.force_login(self.student)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=9-12")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self._body(response), b"0123")
+        self.assertEqual(response["Content-Range"], f"bytes 9-12/{len(self.CONTENT)}")
+        self.assertEqual(response["Content-Length"], "4")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(self._body(response), b"789")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=15-")
+        self.assertEqual(self._body(response), b"6789")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=500-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.CONTENT)}")
+
+        # a changed file (other ETag) -> the whole of it
+        response = self.client.get(self.url, HTTP_RANGE="bytes=9-12", HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, self._body(response)), (200, self.CONTENT))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"x", W/{self.etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_front_end_server_sends_the_file(self):
+        self.client.force_login(self.proctor)
+
+        with override_settings(SENDFILE_BACKEND="nginx", SENDFILE_NGINX_PREFIX="/protected/"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/{self.req.file.name}")
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], self.etag)
+
+        with override_settings(SENDFILE_BACKEND="xsendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], self.req.file.path)
 
-# Create your tests here.
@@ -6,6 +6,7 @@ urlpatterns = [
    
     # 🔽 STAFF ACTIONS
     path('view/<int:id>/', views.view_request, name='view_request'),
+    path('view/<int:id>/file/', views.download_request_file, name='download_request_file'),
     path('approve/<int:id>/', views.approve_request, name='approve_request'),
     path('reject/<int:id>/', views.reject_request, name='reject_request'),
     path('forward/<int:id>/', views.forward_request, name='forward_request'),
@@ -15,8 +16,12 @@ urlpatterns = [
     path("track/<int:id>/", views.track_request, name="track_request"),
     path("delete/<int:id>/", views.delete_request, name="delete_request"),
     path("bulk-forward/", views.bulk_forward_do, name="bulk_forward_do"),
+    path("bulk-approve/", views.bulk_approve_do, name="bulk_approve_do"),
+    path("bulk-reject/", views.bulk_reject_do, name="bulk_reject_do"),
     path("reassign/<int:pk>/", views.reassign_ui, name="reassign_ui"),
 path("reassign/<int:pk>/do/", views.reassign_do, name="reassign_do"),
+    path("changes/", views.changes_since, name="changes_since"),
+    path("search/", views.search_requests, name="search_requests"),
 
 
 
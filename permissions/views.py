@@ -1,21 +1,39 @@
+from datetime import timedelta
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseForbidden
-from django.views.decorators.http import require_POST
+from django.http import Http404, JsonResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET, require_POST
 from django.contrib import messages
 from django.conf import settings
-from django.core.mail import send_mail
+from django.template.loader import render_to_string
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import F, Q
 
+from accounts import directory
+from accounts.dashboard_cache import bump, generation
+from accounts.downloads import serve_file
 from accounts.models import UserProfile
-from .models import PermissionRequest, RequestHistory
-
-import os
+from accounts.pagination import BadCursor, decode_cursor, encode_cursor, encode_values, rows_after
+from accounts.views import CHANGE_KEYS, CHANGES_OVERLAP_SECONDS, dashboard_counts
+from .models import AttachmentText, PermissionRequest, RequestHistory
+from .email_utils import queue_email, queue_emails
+from .events import publish, publish_many, request_payload
+from . import queue_stats, search
 
 
 # ---------------- HELPERS ---------------- #
 
+def _locked_request(**lookup):
+    """
+    The row re-read under SELECT ... FOR UPDATE - the caller holds the
+    transaction. run_escalations or another authority may have moved it since
+    the view first loaded it; queue_stats.snapshot() must see where it is now.
+    """
+    return get_object_or_404(PermissionRequest.objects.select_for_update(), **lookup)
+
+
 def _full_name_or_username(u):
     full = (f"{u.first_name} {u.last_name}").strip()
     return full if full else (u.username or "User")
@@ -23,16 +41,23 @@ def _full_name_or_username(u):
 
 def notify_student(req, event, *, actor=None, to_user=None, extra_note=None):
     """
-    Sends professional email to student for events:
+    Queues professional email to student for events:
       - received, forwarded, approved, rejected, auto_escalated
     """
+    mail = student_mail(req, event, actor=actor, to_user=to_user, extra_note=extra_note)
+    if mail:
+        queue_email(*mail)
+
+
+def student_mail(req, event, *, actor=None, to_user=None, extra_note=None):
+    """(subject, message, to_email) of notify_student(), or None if the student has no email."""
     request_id = getattr(req, "request_code", None) or f"REQ-{req.id:06d}"
     title = (req.title or "").strip() or "Permission Request"
     student_name = _full_name_or_username(req.student)
 
     student_email = (req.student.email or "").strip()
     if not student_email:
-        return
+        return None
 
     authority_name = _full_name_or_username(req.request_to) if req.request_to else "N/A"
     action_by = _full_name_or_username(actor) if actor else "System"
@@ -93,18 +118,12 @@ def notify_student(req, event, *, actor=None, to_user=None, extra_note=None):
 
     lines += ["", "Regards,", "CampusIQ Team"]
 
-    send_mail(
-        subject=subject,
-        message="\n".join(lines),
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[student_email],
-        fail_silently=False,
-    )
+    return subject, "\n".join(lines), student_email
 
 
 def notify_assignee(req, event, *, actor=None, from_user=None, extra_note=None):
     """
-    ✅ Sends email to assigned authority (req.request_to) when:
+    ✅ Queues email to assigned authority (req.request_to) when:
       - event="assigned"  -> new request created
       - event="forwarded" -> request forwarded to this authority
     """
@@ -164,13 +183,39 @@ def notify_assignee(req, event, *, actor=None, from_user=None, extra_note=None):
 
     body_lines += ["", "Regards,", "CampusIQ Team"]
 
-    send_mail(
-        subject=subject,
-        message="\n".join(body_lines),
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[to_email],
-        fail_silently=False,
-    )
+    queue_email(subject, "\n".join(body_lines), to_email)
+
+
+def notify_assignee_digest(assignee, reqs, *, actor=None):
+    """
+    ✅ ONE email to the new assignee listing every request of a bulk forward
+    (instead of one notify_assignee() mail per request).
+    """
+    to_email = (assignee.email or "").strip()
+    if not to_email or not reqs:
+        return
+
+    authority_name = _full_name_or_username(assignee)
+    action_by = _full_name_or_username(actor) if actor else "System"
+
+    subject = f"{len(reqs)} Permission Request(s) Forwarded to You"
+    body_lines = [
+        f"Hello {authority_name},",
+        "",
+        f"{action_by} has forwarded {len(reqs)} permission request(s) to you for review.",
+        "",
+    ]
+    for req in reqs:
+        request_id = getattr(req, "request_code", None) or f"REQ-{req.id:06d}"
+        title = (req.title or "").strip() or "Permission Request"
+        student_name = _full_name_or_username(req.student)
+        body_lines.append(
+            f"- {request_id} | {student_name} ({req.student.username}) | {title} | {req.from_date} to {req.to_date}"
+        )
+
+    body_lines += ["", "Please login to CampusIQ and take action.", "", "Regards,", "CampusIQ Team"]
+
+    queue_email(subject, "\n".join(body_lines), to_email)
 
 
 # ---------------- BASIC VIEWS ---------------- #
@@ -180,82 +225,68 @@ def index(request):
     return render(request, "permissions/index.html")
 
 
-def extract_text_from_uploaded_file(file_field):
-    """
-    Returns (text, error_message)
-    """
-    if not file_field:
-        return ("", None)
-
-    try:
-        path = file_field.path
-    except Exception:
-        return ("", "File path not available.")
-
-    ext = os.path.splitext(path)[1].lower()
-
-    if ext == ".docx":
-        try:
-            import docx
-            doc = docx.Document(path)
-            text = "\n".join([p.text for p in doc.paragraphs]).strip()
-            return (text, None if text else "DOCX has no readable text.")
-        except Exception as e:
-            return ("", f"Could not read DOCX: {e}")
-
-    if ext == ".pdf":
-        try:
-            from PyPDF2 import PdfReader
-            reader = PdfReader(path)
-            parts = []
-            for page in reader.pages:
-                parts.append((page.extract_text() or "").strip())
-            text = "\n\n".join([p for p in parts if p]).strip()
-            if not text:
-                return ("", "This PDF looks like scanned/image-based, so text can't be extracted (OCR needed).")
-            return (text, None)
-        except Exception as e:
-            return ("", f"Could not read PDF: {e}")
-
-    if ext == ".doc":
-        return ("", "Old .DOC format can't be extracted directly. Upload .DOCX or PDF text file.")
-
-    return ("", f"Unsupported file type: {ext}")
-
-
 @login_required
 def view_request(request, id):
-    req = get_object_or_404(PermissionRequest, id=id)
+    # same scope as download_request_file: the page shows the letter's text
+    req = get_object_or_404(search.visible_to(request.user).select_related("student"), id=id)
 
     display_reason = req.reason or ""
     extract_error = None
+    file_text = None
 
     if req.file and req.file.name:
-        # You can extract & show file text if needed
-        pass
+        # ✅ extracted once after upload (`manage.py extract_attachments`), only read here
+        sidecar = (
+            AttachmentText.objects
+            .filter(request=req, file_name=req.file.name)
+            .only("status", "text", "page_count", "error")
+            .first()
+        )
+        if sidecar is None or sidecar.status in ("pending", "processing"):
+            extract_error = "The file's text is still being extracted. Refresh in a moment."
+        else:
+            file_text = sidecar
+            extract_error = sidecar.error or None
 
     return render(request, "permissions/view_request.html", {
         "req": req,
         "display_reason": display_reason,
         "extract_error": extract_error,
+        "file_text": file_text,
     })
 
 
+@login_required
+@require_GET
+def download_request_file(request, id):
+    """✅ The uploaded letter, for the people who can see the request (one query)."""
+    req = (
+        search.visible_to(request.user)
+        .filter(id=id)
+        .only("id", "file", "original_filename")
+        .first()
+    )
+    if req is None:
+        raise Http404("Not found")
+    return serve_file(request, req.file, req.original_filename)
+
+
 # ---------------- APPROVE / REJECT ---------------- #
 
 @login_required
 def approve_request(request, id):
-    req = get_object_or_404(PermissionRequest, id=id)
-    req.status = "approved"
-    req.save()
-
-    if req.student.email:
-        send_mail(
-            subject="Your permission request is APPROVED",
-            message=f"Hi {req.student.username},\n\nYour request '{req.title}' has been APPROVED.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[req.student.email],
-            fail_silently=True
+    with transaction.atomic():
+        req = _locked_request(id=id)
+        before = queue_stats.snapshot(req)
+        req.status = "approved"
+        req.last_action_at = timezone.now()
+        req.save(update_fields=["status", "last_action_at", "updated_at"])
+        queue_stats.record(before, queue_stats.snapshot(req))
+
+        queue_email(
+            "Your permission request is APPROVED",
+            f"Hi {req.student.username},\n\nYour request '{req.title}' has been APPROVED.",
+            req.student.email,
         )
 
     return redirect("dashboard")
@@ -263,17 +294,18 @@ def approve_request(request, id):
 
 @login_required
 def reject_request(request, id):
-    req = get_object_or_404(PermissionRequest, id=id)
-    req.status = "rejected"
-    req.save()
-
-    if req.student.email:
-        send_mail(
-            subject="Your permission request is REJECTED",
-            message=f"Hi {req.student.username},\n\nYour request '{req.title}' has been REJECTED.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[req.student.email],
-            fail_silently=True
+    with transaction.atomic():
+        req = _locked_request(id=id)
+        before = queue_stats.snapshot(req)
+        req.status = "rejected"
+        req.last_action_at = timezone.now()
+        req.save(update_fields=["status", "last_action_at", "updated_at"])
+        queue_stats.record(before, queue_stats.snapshot(req))
+
+        queue_email(
+            "Your permission request is REJECTED",
+            f"Hi {req.student.username},\n\nYour request '{req.title}' has been REJECTED.",
+            req.student.email,
         )
 
     return redirect("dashboard")
@@ -301,7 +333,7 @@ ROLE_FLOW = {
 def forward_ui(request, pk):
     req = get_object_or_404(PermissionRequest, pk=pk)
 
-    my_profile = UserProfile.objects.filter(user=request.user).first()
+    my_profile = request.profile
     if not my_profile:
         return JsonResponse({"error": "no profile"}, status=403)
 
@@ -320,11 +352,15 @@ def forward_ui(request, pk):
 
     users = []
     if selected_role and selected_role in allowed_roles:
-        qs = UserProfile.objects.filter(
-            role=selected_role,
-            department=my_dept
-        ).select_related("user")
-        users = list(qs.values("user__id", "user__username", "user__first_name", "user__last_name"))
+        users = [
+            {
+                "user__id": p.user.id,
+                "user__username": p.user.username,
+                "user__first_name": p.user.first_name,
+                "user__last_name": p.user.last_name,
+            }
+            for p in directory.profiles(my_dept, selected_role)
+        ]
 
     return JsonResponse({"allowed_roles": allowed_roles, "users": users})
 
@@ -334,7 +370,7 @@ def forward_ui(request, pk):
 def forward_do(request, pk):
     req = get_object_or_404(PermissionRequest, pk=pk)
 
-    my_profile = UserProfile.objects.filter(user=request.user).first()
+    my_profile = request.profile
     if not my_profile:
         return JsonResponse({"ok": False, "error": "Profile not found"}, status=403)
 
@@ -354,45 +390,56 @@ def forward_do(request, pk):
     if target_role not in allowed_roles:
         return JsonResponse({"ok": False, "error": "Not allowed role"}, status=403)
 
-    target_profile = UserProfile.objects.filter(
-        user_id=target_user_id,
-        role=target_role,
-        department=my_dept
-    ).first()
+    target_profile = directory.profile_of(target_user_id, department=my_dept, role=target_role)
 
     if not target_profile:
         return JsonResponse({"ok": False, "error": "User not found in same department/role"}, status=404)
 
-    # ✅ UPDATE REQUEST
-    req.request_to = target_profile.user
-    req.status = "pending"
-    req.current_level = target_profile.role
-    req.save()
-
-    # ✅ STUDENT EMAIL (you already had)
-    if req.student.email:
-        send_mail(
-            subject="Your permission request was FORWARDED",
-            message=(
+    with transaction.atomic():
+        req = _locked_request(pk=pk)
+        if req.request_to_id != request.user.id:
+            # escalated / reassigned since it was loaded above
+            return JsonResponse({"ok": False, "error": "Not assigned to you"}, status=403)
+
+        # ✅ UPDATE REQUEST
+        before = queue_stats.snapshot(req)
+        req.request_to = target_profile.user
+        req.status = "pending"
+        req.current_level = target_profile.role
+        req.escalation_count = F("escalation_count") + 1
+        req.last_action_at = timezone.now()
+        req.save(update_fields=[
+            "request_to", "status", "current_level", "escalation_count", "last_action_at", "updated_at",
+        ])
+        queue_stats.record(before, queue_stats.snapshot(req))
+
+        # ✅ STUDENT EMAIL (you already had)
+        queue_email(
+            "Your permission request was FORWARDED",
+            (
                 f"Hi {req.student.username},\n\n"
                 f"Your request '{req.title}' has been FORWARDED to {target_profile.role.upper()}."
             ),
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[req.student.email],
-            fail_silently=True
+            req.student.email,
         )
 
-    # ✅ NEW: EMAIL TO NEW ASSIGNEE
-    notify_assignee(req, "forwarded", actor=request.user, from_user=request.user)
+        # ✅ NEW: EMAIL TO NEW ASSIGNEE
+        notify_assignee(req, "forwarded", actor=request.user, from_user=request.user)
+
+        RequestHistory.objects.create(
+            request=req,
+            action="forwarded",
+            from_role=my_role,
+            to_role=target_profile.role,
+            actor=request.user,
+            from_user=request.user,
+            note="Forwarded"
+        )
 
-    RequestHistory.objects.create(
-        request=req,
-        action="forwarded",
-        from_role=my_role,
-        to_role=target_profile.role,
-        actor=request.user,
-        note="Forwarded"
-    )
+        publish(
+            [req.request_to_id, request.user.id], "forwarded",
+            request_payload(req, from_user_id=request.user.id, to_user_id=req.request_to_id),
+        )
 
     return JsonResponse({"ok": True})
 
@@ -427,19 +474,26 @@ def delete_request(request, id):
     if req.student_id != request.user.id:
         return HttpResponseForbidden("You can delete only your own requests")
 
-    profile = UserProfile.objects.filter(user=request.user).first()
+    profile = request.profile
     my_role = (profile.role or "").strip().lower() if profile else ""
 
-    RequestHistory.objects.create(
-        request=req,
-        action="rejected",
-        from_role=my_role,
-        to_role=None,
-        actor=request.user,
-        note="Deleted by requester"
-    )
+    with transaction.atomic():
+        req = _locked_request(id=id)
+        if req.status != "pending":
+            return HttpResponseForbidden("Only pending requests can be deleted")
+
+        RequestHistory.objects.create(
+            request=req,
+            action="rejected",
+            from_role=my_role,
+            to_role=None,
+            actor=request.user,
+            note="Deleted by requester"
+        )
 
-    req.delete()
+        before = queue_stats.snapshot(req)
+        req.delete()
+        queue_stats.record(before, None)
     messages.success(request, "Request deleted successfully.")
     return redirect("dashboard")
 
@@ -449,7 +503,7 @@ def delete_request(request, id):
 @login_required
 @require_POST
 def bulk_forward_do(request):
-    my_profile = UserProfile.objects.filter(user=request.user).first()
+    my_profile = request.profile
     if not my_profile:
         return JsonResponse({"ok": False, "error": "Profile not found"}, status=403)
 
@@ -472,16 +526,13 @@ def bulk_forward_do(request):
     if target_role not in allowed_roles:
         return JsonResponse({"ok": False, "error": "Not allowed role"}, status=403)
 
-    target_profile = UserProfile.objects.filter(
-        user_id=target_user_id,
-        role=target_role,
-        department=my_dept
-    ).select_related("user").first()
+    target_profile = directory.profile_of(target_user_id, department=my_dept, role=target_role)
 
     if not target_profile:
         return JsonResponse({"ok": False, "error": "Target user not found in same dept/role"}, status=404)
 
     new_role = (target_profile.role or "").strip().lower()
+    target_user = target_profile.user
     action_label = "forwarded"
 
     qs = PermissionRequest.objects.filter(
@@ -490,44 +541,163 @@ def bulk_forward_do(request):
         status="pending"
     )
 
-    updated = 0
-    skipped = []
-
+    # ✅ set-based: one UPDATE + one history INSERT + one digest mail for N requests
     with transaction.atomic():
-        for req in qs.select_related("student"):
-            req.request_to = target_profile.user
-            req.current_level = new_role
-            req.status = "pending"
-            req.save(update_fields=["request_to", "current_level", "status", "updated_at"])
+        # locked in id order -> two bulk forwards over the same rows can't deadlock
+        reqs = list(qs.select_for_update().order_by("id").prefetch_related("student"))
+        forwarded_ids = [req.id for req in reqs]
+        now = timezone.now()
+
+        if reqs:
+            # update() sends no post_save -> dashboards are invalidated below
+            PermissionRequest.objects.filter(id__in=forwarded_ids).update(
+                request_to=target_user,
+                current_level=new_role,
+                status="pending",
+                escalation_count=F("escalation_count") + 1,
+                last_action_at=now,
+                updated_at=now,
+            )
 
-            # ✅ NEW: mail to new assignee (for each forwarded request)
-            notify_assignee(req, "forwarded", actor=request.user, from_user=request.user)
+        moves = []
+        history = []
+        events = []
+        for req in reqs:
+            before = queue_stats.snapshot(req)
+            req.request_to = target_user
+            req.current_level = new_role
+            req.escalation_count += 1
+            req.last_action_at = now
+            req.updated_at = now
+            moves.append((before, queue_stats.snapshot(req)))
 
-            RequestHistory.objects.create(
+            history.append(RequestHistory(
                 request=req,
                 action=action_label,
                 from_role=my_role,
                 to_role=new_role,
                 actor=request.user,
-                note=f"Forwarded to {target_profile.user.username}"
+                from_user=request.user,
+                note=f"Forwarded to {target_user.username}"
+            ))
+            payload = request_payload(req, from_user_id=request.user.id, to_user_id=target_user.id)
+            events += [(target_user.id, "forwarded", payload), (request.user.id, "forwarded", payload)]
+
+        RequestHistory.objects.bulk_create(history)
+        queue_stats.record_many(moves)
+
+        # ✅ one digest mail to the new assignee (outbox row, sent after commit by send_outbox)
+        notify_assignee_digest(target_user, reqs, actor=request.user)
+
+        publish_many(events)
+        if reqs:
+            bump(request.user.id, target_user.id, *{req.student_id for req in reqs})
+
+    forwarded = set(forwarded_ids)
+    skipped = [rid for rid in ids if rid not in forwarded]
+
+    return JsonResponse({
+        "ok": True,
+        "updated": len(reqs),
+        "skipped": skipped,
+        "target": target_user.username
+    })
+
+
+# ---------------- BULK APPROVE / REJECT ---------------- #
+
+def _bulk_decide(request, new_status):
+    """Shared body of bulk_approve_do / bulk_reject_do (same shape as bulk_forward_do)."""
+    my_profile = request.profile
+    if not my_profile:
+        return JsonResponse({"ok": False, "error": "Profile not found"}, status=403)
+
+    my_role = (my_profile.role or "").strip().lower()
+    if my_role == "student":
+        return JsonResponse({"ok": False, "error": "Students cannot approve or reject"}, status=403)
+
+    ids = request.POST.getlist("request_ids")
+    ids = [int(x) for x in ids if str(x).isdigit()]
+
+    if not ids:
+        return JsonResponse({"ok": False, "error": "No requests selected"}, status=400)
+
+    # assignment + state check for all ids in one query
+    qs = PermissionRequest.objects.filter(
+        id__in=ids,
+        request_to=request.user,
+        status="pending"
+    )
+
+    with transaction.atomic():
+        reqs = list(qs.select_for_update().order_by("id").prefetch_related("student"))
+        decided_ids = [req.id for req in reqs]
+        now = timezone.now()
+
+        if reqs:
+            # update() sends no post_save -> dashboards are invalidated below
+            PermissionRequest.objects.filter(id__in=decided_ids).update(
+                status=new_status,
+                last_action_at=now,
+                updated_at=now,
             )
-            updated += 1
 
-        valid_ids = set(qs.values_list("id", flat=True))
-        for rid in ids:
-            if rid not in valid_ids:
-                skipped.append(rid)
+        moves = []
+        history = []
+        mails = []
+        for req in reqs:
+            before = queue_stats.snapshot(req)
+            req.status = new_status
+            req.last_action_at = now
+            req.updated_at = now
+            moves.append((before, queue_stats.snapshot(req)))
+
+            history.append(RequestHistory(
+                request=req,
+                action=new_status,
+                from_role=my_role,
+                to_role=None,
+                actor=request.user,
+                note=f"Bulk {new_status}"
+            ))
+            mail = student_mail(req, new_status, actor=request.user)
+            if mail:
+                mails.append(mail)
+
+        RequestHistory.objects.bulk_create(history)
+        queue_stats.record_many(moves)
+
+        # ✅ all student mails in one outbox INSERT (sent after commit by send_outbox)
+        queue_emails(mails)
+
+        if reqs:
+            bump(request.user.id, *{req.student_id for req in reqs})
+
+    decided = set(decided_ids)
+    skipped = [rid for rid in ids if rid not in decided]
 
     return JsonResponse({
         "ok": True,
-        "updated": updated,
+        "updated": len(reqs),
         "skipped": skipped,
-        "target": target_profile.user.username
+        "status": new_status
     })
+
+
+@login_required
+@require_POST
+def bulk_approve_do(request):
+    return _bulk_decide(request, "approved")
+
+
+@login_required
+@require_POST
+def bulk_reject_do(request):
+    return _bulk_decide(request, "rejected")
+
 from django.http import JsonResponse, HttpResponseForbidden
 from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404, render
-from django.core.mail import send_mail
 from django.conf import settings
 
 from accounts.models import UserProfile
@@ -549,7 +719,7 @@ def _full_name_or_username(u):
 def _send_mail(subject, message, to_email):
     if not to_email:
         return
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [to_email], fail_silently=False)
+    queue_email(subject, message, to_email)
 
 
 ROLE_FLOW = {
@@ -568,7 +738,7 @@ def _full_name_or_username(u):
 def _send_mail(subject, message, to_email):
     if not to_email:
         return
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [to_email], fail_silently=False)
+    queue_email(subject, message, to_email)
 
 
 from django.http import JsonResponse
@@ -584,15 +754,12 @@ def reassign_ui(request, pk):
     if req.request_to != request.user:
         return JsonResponse({"ok": False, "error": "Not allowed"}, status=403)
 
-    my_profile = UserProfile.objects.filter(user=request.user).first()
+    my_profile = request.profile
     if not my_profile:
         return JsonResponse({"ok": False, "error": "Profile not found"}, status=403)
 
-    # ✅ Get ALL staff in same department (no role restriction)
-    users = UserProfile.objects.filter(
-    department=my_profile.department
-).exclude(user=request.user).exclude(role="student")
-
+    # ✅ Get ALL staff in same department (no role restriction), from the directory
+    users = directory.staff_in_department(my_profile.department, exclude_user_id=request.user.id)
 
     data = []
     for u in users:
@@ -623,31 +790,158 @@ def reassign_do(request, pk):
     if not target_user_id:
         return JsonResponse({"ok": False, "error": "No user selected"}, status=400)
 
-    my_profile = UserProfile.objects.filter(user=request.user).first()
+    my_profile = request.profile
     if not my_profile:
         return JsonResponse({"ok": False, "error": "Profile not found"}, status=403)
 
     # ✅ Ensure SAME DEPARTMENT
-    target_profile = UserProfile.objects.filter(
-        user_id=target_user_id,
-        department=my_profile.department
-    ).select_related("user").first()
+    target_profile = directory.profile_of(target_user_id, department=my_profile.department)
 
     if not target_profile:
         return JsonResponse({"ok": False, "error": "User not found in same department"}, status=404)
 
-    # Update request
-    req.request_to = target_profile.user
-    req.current_level = target_profile.role
-    req.save(update_fields=["request_to", "current_level", "updated_at"])
-
-    RequestHistory.objects.create(
-        request=req,
-        action="reassigned",
-        from_role=my_profile.role,
-        to_role=target_profile.role,
-        actor=request.user,
-        note="Reassigned manually"
-    )
+    with transaction.atomic():
+        req = _locked_request(pk=pk)
+        if req.request_to_id != request.user.id or req.status != "pending":
+            # escalated / decided since it was loaded above
+            return JsonResponse({"ok": False, "error": "Not allowed"}, status=403)
+
+        # Update request
+        before = queue_stats.snapshot(req)
+        req.request_to = target_profile.user
+        req.current_level = target_profile.role
+        req.last_action_at = timezone.now()
+        req.save(update_fields=["request_to", "current_level", "last_action_at", "updated_at"])
+        queue_stats.record(before, queue_stats.snapshot(req))
+
+        RequestHistory.objects.create(
+            request=req,
+            action="reassigned",
+            from_role=my_profile.role,
+            to_role=target_profile.role,
+            actor=request.user,
+            from_user=request.user,
+            note="Reassigned manually"
+        )
+
+        publish(
+            [req.request_to_id, request.user.id], "reassigned",
+            request_payload(req, from_user_id=request.user.id, to_user_id=req.request_to_id),
+        )
 
     return JsonResponse({"ok": True})
+
+
+# ---------------- LIVE REFRESH (changes since cursor) ---------------- #
+
+CHANGES_PAGE_SIZE = 200
+
+
+@login_required
+@require_GET
+def changes_since(request):
+    """
+    ✅ Dashboard polling.
+    GET ?cursor=<changes cursor>&gen=<generation the page was built at>
+    -> {"ok": true, "changed": false, "gen": g, "cursor": c}     nothing of mine changed (no DB hit)
+    -> {"ok": true, "changed": true, "gen": g, "cursor": c, "more": bool,
+        "rows": [{"id", "list": "received"|"submitted", "html"}],
+        "removed": [ids no longer in my list], "counts": {...}}
+    Rows are my requests (submitted / assigned) after the cursor in (updated_at, id)
+    order; "removed" are the ones I handed on since then, found from their history
+    (I acted or the request was taken from me) - never anybody else's.
+    """
+    user = request.user
+    cursor = request.GET.get("cursor") or ""
+    if not cursor:
+        return JsonResponse({"ok": False, "error": "cursor is required"}, status=400)
+
+    try:
+        since = decode_cursor(cursor, CHANGE_KEYS)
+    except BadCursor as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+
+    # the dashboard generation moves on every change that touches this user
+    gen = generation(user.id)
+    if request.GET.get("gen") == str(gen):
+        return JsonResponse({"ok": True, "changed": False, "gen": gen, "cursor": cursor})
+
+    mine_q = Q(student=user) | Q(request_to=user)
+    rows, more = rows_after(
+        PermissionRequest.objects.filter(mine_q).select_related("student", "request_to"),
+        CHANGE_KEYS, cursor, CHANGES_PAGE_SIZE,
+    )
+
+    profile = request.profile
+    role = (profile.role or "").strip().lower() if profile else ""
+
+    if role == "student":
+        list_name, row_template, mine = "submitted", "dashboard/_submitted_rows.html", "student_id"
+    else:
+        list_name, row_template, mine = "received", "dashboard/_received_rows.html", "request_to_id"
+
+    changed = []
+    removed = []
+    for req in rows:
+        if getattr(req, mine) == user.id:
+            html = render_to_string(row_template, {"rows": [req], "profile": profile}, request=request)
+            changed.append({"id": req.id, "list": list_name, "html": html})
+        else:
+            # mine, but not in this list - the page drops it if it shows it
+            removed.append(req.id)
+
+    # forwarded / reassigned / escalated away from me since the cursor
+    handed_on = RequestHistory.objects.filter(
+        Q(actor=user) | Q(from_user=user), created_at__gte=since[0],
+    ).values("request_id")
+    removed += list(
+        PermissionRequest.objects.filter(id__in=handed_on).exclude(mine_q)
+        .order_by("id").values_list("id", flat=True)[:CHANGES_PAGE_SIZE]
+    )
+
+    if rows:
+        next_cursor = encode_cursor(rows[-1], CHANGE_KEYS)
+        tail = timezone.now() - timedelta(seconds=CHANGES_OVERLAP_SECONDS)
+        if not more and rows[-1].updated_at > tail:
+            next_cursor = encode_values([max(tail, since[0]), 0])
+    else:
+        next_cursor = cursor
+
+    counts = dashboard_counts(user, role)
+
+    return JsonResponse({
+        "ok": True,
+        "changed": True,
+        "gen": gen,
+        "cursor": next_cursor,
+        "more": more,
+        "rows": changed,
+        "removed": removed,
+        "counts": counts,
+    })
+
+
+# ---------------- SEARCH ---------------- #
+
+@login_required
+@require_GET
+def search_requests(request):
+    """
+    ✅ Full-text search over the requests this user may see (see permissions/search.py).
+    GET ?q=<words>&page=<n>  -> ranked, search.page_size() per page
+    """
+    query = (request.GET.get("q") or "").strip()
+    try:
+        page = int(request.GET.get("page") or 1)
+    except ValueError:
+        page = 1
+
+    found = search.search(request.user, query, page=page)
+
+    return render(request, "permissions/search.html", {
+        "query": query,
+        "results": found.results,
+        "page": found.page,
+        "has_more": found.has_more,
+        "profile": request.profile,
+    })